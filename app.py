@@ -1,33 +1,71 @@
 import os
+import json
 import uuid
-import psycopg2
 import psycopg2.extras
 import logging
 import random
-import requests
+import re
+import threading
 from datetime import datetime, timedelta, timezone
-from flask import Flask, request, jsonify, render_template, redirect, url_for, flash
+from flask import Flask, Response, request, jsonify, render_template, redirect, url_for, flash, stream_with_context, g
 from dotenv import load_dotenv
-import google.generativeai as genai
 from flask_login import LoginManager, UserMixin, login_user, logout_user, current_user, login_required
-import bcrypt
-from flask_mail import Mail, Message
 from itsdangerous import URLSafeTimedSerializer as Serializer
+from cachetools import TTLCache
 
 # --- Konfigurasi Awal & Logging ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 load_dotenv()
 
+# Modul lokal diimpor setelah load_dotenv() karena sebagian membaca environment saat diimpor
+from db import get_db_connection
+from gemini import get_model
+from chat_store import load_chat_history
+from pagination import encode_cursor, decode_cursor, parse_timestamp, page_limit, make_etag, is_not_modified, conditional_json, not_modified_response
+import pipeline
+import tracing
+import metrics
+import markdown_render
+import search
+import archive
+import ask_dedup
+import rate_limit
+import mail_queue
+from password_hasher import hasher, HasherBusy, RETRY_AFTER as HASHER_RETRY_AFTER
+
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
 
 # Konfigurasi Email
-app.config['MAIL_SERVER'] = 'smtp.gmail.com'
-app.config['MAIL_PORT'] = 587
-app.config['MAIL_USE_TLS'] = True
+app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER', 'smtp.gmail.com')
+app.config['MAIL_PORT'] = int(os.getenv('MAIL_PORT', '587'))
+app.config['MAIL_USE_TLS'] = os.getenv('MAIL_USE_TLS', '1') == '1'
 app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME')
 app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD')
-mail = Mail(app)
+MAIL_SENDER = ('Richatz.AI', os.getenv('MAIL_USERNAME'))
+# thread   : worker antrian email berjalan di dalam proses web, dimulai pada request pertama (default)
+# inline   : email yang baru diantrikan dikirim langsung di request itu dengan timeout SMTP pendek (default di
+#            Vercel: tidak ada thread yang tetap hidup setelah response, dan OTP tidak bisa menunggu cron harian);
+#            email yang gagal serta antrian lama dikirim oleh cron /tasks/mail-queue
+# external : worker dijalankan terpisah dengan `python mail_queue.py` / cron /tasks/mail-queue
+# Cron /tasks/mail-queue di vercel.json harian supaya bisa di-deploy di plan Hobby (yang menolak cron lebih
+# sering dari sekali sehari); di plan Pro jadwalnya bisa dipercepat ke `* * * * *` untuk retry lebih cepat.
+MAIL_QUEUE_MODE = os.getenv('MAIL_QUEUE_MODE', 'inline' if os.getenv('VERCEL') else 'thread')
+# Batas waktu satu kali kirim langsung (mode inline); lewat dari ini email menunggu cron
+MAIL_INLINE_TIMEOUT = float(os.getenv('MAIL_INLINE_TIMEOUT', '5'))
+
+_mail = None
+_mail_lock = threading.Lock()
+
+def get_mail():
+    """Flask-Mail baru diinisialisasi saat ada email yang benar-benar akan dikirim."""
+    global _mail
+    if _mail is None:
+        with _mail_lock:
+            if _mail is None:
+                from flask_mail import Mail
+                _mail = Mail(app)
+    return _mail
 
 # --- TEMPLATE EMAIL HTML (Dengan Perbaikan) ---
 HTML_EMAIL_TEMPLATE = """
@@ -66,16 +104,6 @@ HTML_EMAIL_TEMPLATE = """
 </html>
 """
 
-# --- Koneksi Database ---
-DATABASE_URL = os.getenv("POSTGRES_URL")
-def get_db_connection():
-    try:
-        conn = psycopg2.connect(DATABASE_URL, sslmode='require')
-        return conn
-    except Exception as e:
-        logging.exception("Gagal terhubung ke database Postgres.")
-        raise
-
 # --- Konfigurasi Sistem Login ---
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -98,51 +126,120 @@ class User(UserMixin):
             return None
         return load_user(user_id)
 
+# Cache User per proses, supaya setiap request @login_required (termasuk /history setelah
+# setiap pesan) tidak perlu query ke tabel users. Entri dihapus eksplisit saat data user berubah.
+user_cache = TTLCache(maxsize=int(os.getenv("USER_CACHE_SIZE", "4096")), ttl=int(os.getenv("USER_CACHE_TTL", "300")))
+user_cache_lock = threading.Lock()
+
+def cache_user(user):
+    with user_cache_lock:
+        user_cache[int(user.id)] = user
+
+def invalidate_user(user_id):
+    with user_cache_lock:
+        user_cache.pop(int(user_id), None)
+
 @login_manager.user_loader
 def load_user(user_id):
-    conn = None
-    try:
-        conn = get_db_connection()
+    with user_cache_lock:
+        user = user_cache.get(int(user_id))
+    if user is not None:
+        return user
+    with get_db_connection() as conn:
         with conn.cursor() as cur:
             cur.execute("SELECT id, email, name FROM users WHERE id = %s", (int(user_id),))
             user_data = cur.fetchone()
-        if user_data:
-            return User(id=user_data[0], email=user_data[1], name=user_data[2])
-        return None
-    finally:
-        if conn: conn.close()
-
-# --- Konfigurasi AI Gemini ---
-try:
-    api_key = os.getenv("GOOGLE_API_KEY")
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel('gemini-1.5-flash')
-except Exception as e:
-    model = None
-    logging.error(f"Error Konfigurasi Gemini: {e}")
-
-briefing_user = """
-PERATURAN UTAMA DAN IDENTITAS DIRI ANDA:
-1. Nama kamu adalah Richatz.AI, dibuat oleh seorang developer Indonesia bernama 'R.ARTCH'. Versi kamu adalah 1.0 SPRO.
-2. Jika ditanya identitasmu, jawab sesuai poin 1. Jangan pernah menjawab "Saya adalah model bahasa besar".
-3. Kamu PUNYA akses internet real-time.
-4. Sangat Penting: Jika kamu memberikan contoh kode, selalu gunakan Markdown Code Blocks.
-"""
-briefing_model = "Siap, saya mengerti. Nama saya Richatz.AI v1.0 SPRO."
+    if user_data:
+        user = User(id=user_data[0], email=user_data[1], name=user_data[2])
+        cache_user(user)
+        return user
+    return None
 
 # === ROUTES APLIKASI UTAMA ===
 @app.route('/')
 @login_required
 def home():
-    return render_template('index.html')
+    return render_template('index.html', server_render=markdown_render.ENABLED)
 
 @app.route('/start')
 @login_required
 def start_page():
     return render_template('start_chat.html')
 
+@app.errorhandler(rate_limit.RateLimited)
+@app.errorhandler(rate_limit.QueueTimeout)
+def rate_limited(e):
+    status = 429 if isinstance(e, rate_limit.RateLimited) else 503
+    logging.info(f"{request.path} ditolak ({status}): {e}")
+    if request.is_json:
+        response = jsonify({'error': str(e)})
+        response.status_code = status
+    else:
+        response = Response(str(e), status=status, mimetype='text/plain')
+    response.headers['Retry-After'] = rate_limit.retry_after_header(e.retry_after)
+    return response
+
+@app.errorhandler(HasherBusy)
+def password_hasher_busy(e):
+    # Badai login ditolak cepat alih-alih menghabiskan worker yang juga melayani chat
+    logging.warning(f"Hashing password ditolak: {e}")
+    response = Response('Server sedang sibuk, silakan coba lagi sebentar lagi.', status=503, mimetype='text/plain')
+    response.headers['Retry-After'] = str(HASHER_RETRY_AFTER)
+    return response
+
+# === TRACING PER REQUEST ===
+REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+@app.before_request
+def start_request_trace():
+    request_id = request.headers.get('X-Request-ID', '')
+    g.trace, g.trace_token = tracing.start_trace(request.endpoint or 'unmatched',
+                                                 request_id if REQUEST_ID_RE.match(request_id) else None)
+
+@app.before_request
+def ensure_mail_worker():
+    # Email yang tertunda/di-backoff dari proses sebelumnya (restart, deploy) dikirim tanpa menunggu
+    # ada pendaftaran atau reset password baru
+    if MAIL_QUEUE_MODE == 'thread':
+        mail_queue.start_worker_thread(app, get_mail, MAIL_SENDER)
+
+@app.after_request
+def add_trace_headers(response):
+    trace = g.get('trace')
+    if trace is not None:
+        g.trace_status = response.status_code
+        response.headers['X-Request-ID'] = trace.request_id
+        if not response.is_streamed:
+            response.headers['Server-Timing'] = ", ".join(
+                f"{name.replace('.', '-')};dur={duration * 1000:.1f}" for name, duration in trace.stage_totals().items()
+            )
+    return response
+
+@app.teardown_request
+def finish_request_trace(exc):
+    # Untuk /ask/stream ini baru dipanggil setelah stream selesai, jadi durasinya mencakup seluruh jawaban
+    trace = g.pop('trace', None)
+    if trace is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        status = 500 if exc is not None else g.get('trace_status', 500)
+        tracing.finish_trace(trace, g.pop('trace_token', None), route, request.method, status)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    # Tanpa METRICS_TOKEN /metrics ditolak, kecuali di server pengembangan (`python app.py`, debug) atau
+    # METRICS_PUBLIC=1 untuk scraper di jaringan privat. Di Vercel setiap deployment publik, jadi token wajib.
+    token = os.getenv('METRICS_TOKEN')
+    if token:
+        if request.headers.get('Authorization') != f"Bearer {token}":
+            return jsonify({'error': 'Unauthorized'}), 401
+    elif os.getenv('VERCEL') or not (app.debug or os.getenv('METRICS_PUBLIC') == '1'):
+        logging.warning("/metrics ditolak: METRICS_TOKEN belum diset")
+        return jsonify({'error': 'Unauthorized'}), 401
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 # === ROUTES AUTENTIKASI (LENGKAP) ===
 @app.route('/login', methods=['GET', 'POST'])
+@rate_limit.limited('login')
 def login():
     if current_user.is_authenticated:
         return redirect(url_for('start_page'))
@@ -150,29 +247,35 @@ def login():
         email = request.form['email']
         password = request.form['password']
         remember = 'remember' in request.form
-        conn = None
-        try:
-            conn = get_db_connection()
+        with get_db_connection() as conn:
             with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
                 cur.execute("SELECT * FROM users WHERE email = %s", (email,))
                 user_data = cur.fetchone()
-            
-            if user_data and bcrypt.checkpw(password.encode('utf-8'), user_data['password_hash'].encode('utf-8')):
-                if not user_data['is_verified']:
-                    flash('Your account is not verified. Please check your email for the OTP.', 'warning')
-                    return redirect(url_for('verify_otp', email=email))
 
-                user = User(id=user_data['id'], email=user_data['email'], name=user_data['name'])
-                login_user(user, remember=remember)
-                next_page = request.args.get('next')
-                return redirect(next_page or url_for('start_page'))
-            else:
-                flash('Incorrect email or password.', 'danger')
-        finally:
-            if conn: conn.close()
+        if user_data and hasher.verify(password, user_data['password_hash']):
+            # Hash dengan cost lama diganti diam-diam selagi password asli masih di tangan
+            new_hash = hasher.rehash_if_needed(password, user_data['password_hash'])
+            if new_hash:
+                with get_db_connection() as conn:
+                    with conn.cursor() as cur:
+                        cur.execute("UPDATE users SET password_hash = %s WHERE id = %s", (new_hash, user_data['id']))
+                    conn.commit()
+
+            if not user_data['is_verified']:
+                flash('Your account is not verified. Please check your email for the OTP.', 'warning')
+                return redirect(url_for('verify_otp', email=email))
+
+            user = User(id=user_data['id'], email=user_data['email'], name=user_data['name'])
+            cache_user(user)
+            login_user(user, remember=remember)
+            next_page = request.args.get('next')
+            return redirect(next_page or url_for('start_page'))
+        else:
+            flash('Incorrect email or password.', 'danger')
     return render_template('login.html')
 
 @app.route('/register', methods=['GET', 'POST'])
+@rate_limit.limited('register')
 def register():
     if current_user.is_authenticated:
         return redirect(url_for('home'))
@@ -180,48 +283,48 @@ def register():
         email = request.form['email']
         name = request.form['name']
         password = request.form['password']
-        conn = None
+        # Hashing dilakukan sebelum meminjam koneksi agar koneksi tidak tertahan selama bcrypt berjalan
+        hashed_password = hasher.hash(password)
         try:
-            conn = get_db_connection()
-            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-                cur.execute("SELECT * FROM users WHERE email = %s", (email,))
-                user = cur.fetchone()
-
-                if user and user['is_verified']:
-                    flash('Email already registered. Please log in.', 'warning')
-                    return redirect(url_for('login'))
-
-                otp = "".join([str(random.randint(0, 9)) for _ in range(6)])
-                otp_expiry = datetime.now(timezone.utc) + timedelta(minutes=10)
-                hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
-
-                if user and not user['is_verified']:
-                    cur.execute(
-                        "UPDATE users SET name = %s, password_hash = %s, otp = %s, otp_expires_at = %s WHERE email = %s",
-                        (name, hashed_password.decode('utf-8'), otp, otp_expiry, email)
-                    )
-                else:
-                    cur.execute(
-                        "INSERT INTO users (name, email, password_hash, otp, otp_expires_at, is_verified) VALUES (%s, %s, %s, %s, %s, %s)",
-                        (name, email, hashed_password.decode('utf-8'), otp, otp_expiry, False)
-                    )
-            conn.commit()
-
-            msg = Message('Your Richatz.AI Verification Code', sender=('Richatz.AI', os.getenv('MAIL_USERNAME')), recipients=[email])
-            main_content_for_otp = f"""
-            <p>Thank you for registering. Use the code below to verify your account. This code will expire in 10 minutes.</p>
-            <div class="otp-code">{otp}</div>
-            """
-            msg.html = HTML_EMAIL_TEMPLATE.format(name=name, main_content=main_content_for_otp)
-            mail.send(msg)
+            with get_db_connection() as conn:
+                with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                    cur.execute("SELECT * FROM users WHERE email = %s", (email,))
+                    user = cur.fetchone()
+
+                    if user and user['is_verified']:
+                        flash('Email already registered. Please log in.', 'warning')
+                        return redirect(url_for('login'))
+
+                    otp = "".join([str(random.randint(0, 9)) for _ in range(6)])
+                    otp_expiry = datetime.now(timezone.utc) + timedelta(minutes=10)
+
+                    if user and not user['is_verified']:
+                        invalidate_user(user['id'])
+                        cur.execute(
+                            "UPDATE users SET name = %s, password_hash = %s, otp = %s, otp_expires_at = %s WHERE email = %s",
+                            (name, hashed_password, otp, otp_expiry, email)
+                        )
+                    else:
+                        cur.execute(
+                            "INSERT INTO users (name, email, password_hash, otp, otp_expires_at, is_verified) VALUES (%s, %s, %s, %s, %s, %s)",
+                            (name, email, hashed_password, otp, otp_expiry, False)
+                        )
+
+                    # Email OTP masuk antrian di transaksi yang sama dengan data user
+                    main_content_for_otp = f"""
+                    <p>Thank you for registering. Use the code below to verify your account. This code will expire in 10 minutes.</p>
+                    <div class="otp-code">{otp}</div>
+                    """
+                    job_id = mail_queue.enqueue(cur, email, 'Your Richatz.AI Verification Code',
+                                                HTML_EMAIL_TEMPLATE.format(name=name, main_content=main_content_for_otp))
+                conn.commit()
+            wake_mail_worker(job_id)
 
             flash('Registration successful! Please check your email for the OTP code.', 'info')
             return redirect(url_for('verify_otp', email=email))
         except Exception as e:
             logging.error(f"Error during registration: {e}")
             flash('An error occurred during registration.', 'danger')
-        finally:
-            if conn: conn.close()
     return render_template('register.html')
 
 @app.route('/verify-otp', methods=['GET', 'POST'])
@@ -231,9 +334,7 @@ def verify_otp():
         return redirect(url_for('register'))
     if request.method == 'POST':
         otp_from_form = "".join([request.form.get(f'otp{i}', '') for i in range(1, 7)])
-        conn = None
-        try:
-            conn = get_db_connection()
+        with get_db_connection() as conn:
             with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
                 cur.execute("SELECT * FROM users WHERE email = %s", (email,))
                 user = cur.fetchone()
@@ -248,52 +349,90 @@ def verify_otp():
                         (email,)
                     )
                     conn.commit()
+                    invalidate_user(user['id'])
                     flash('Verification successful! Please log in.', 'success')
                     return redirect(url_for('login'))
                 else:
                     flash('Incorrect or expired OTP code.', 'danger')
-        finally:
-            if conn: conn.close()
     return render_template('verify_otp.html', email=email)
 
 @app.route('/logout')
 @login_required
 def logout():
+    invalidate_user(current_user.id)
     logout_user()
     return redirect(url_for('login'))
 
+def wake_mail_worker(job_id):
+    if MAIL_QUEUE_MODE == 'inline':
+        try:
+            mail_queue.process_batch(get_mail(), MAIL_SENDER, job_ids=[job_id], timeout=MAIL_INLINE_TIMEOUT)
+        except Exception as e:
+            # Email tetap di antrian dan dicoba lagi oleh cron /tasks/mail-queue
+            logging.error(f"Pengiriman email langsung gagal: {e}")
+        return
+    if MAIL_QUEUE_MODE == 'thread':
+        mail_queue.start_worker_thread(app, get_mail, MAIL_SENDER)
+    mail_queue.notify()
+
 def send_reset_email(user):
     token = user.get_reset_token()
-    msg = Message('Password Reset Request', sender=('Richatz.AI', os.getenv('MAIL_USERNAME')), recipients=[user.email])
     reset_link = url_for("reset_token", token=token, _external=True)
     main_content_for_reset = f"""
     <p>To reset your password, please click the button below. This link will expire in 30 minutes.</p>
     <a href="{reset_link}" class="button">Reset Password</a>
     """
-    msg.html = HTML_EMAIL_TEMPLATE.format(name=user.name, main_content=main_content_for_reset)
-    
-    # PERBAIKAN: Menambahkan try-except di sini untuk error logging yang lebih baik
+    html = HTML_EMAIL_TEMPLATE.format(name=user.name, main_content=main_content_for_reset)
+
+    # Email tidak dikirim langsung di request ini, tapi dimasukkan ke antrian (lihat mail_queue.py)
     try:
-        mail.send(msg)
-        logging.info(f"Email reset password berhasil dikirim ke {user.email}")
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                job_id = mail_queue.enqueue(cur, user.email, 'Password Reset Request', html)
+            conn.commit()
+        logging.info(f"Email reset password untuk {user.email} masuk antrian")
     except Exception as e:
-        logging.error(f"GAGAL MENGIRIM EMAIL ke {user.email}: {e}")
+        logging.error(f"GAGAL MENGANTRIKAN EMAIL ke {user.email}: {e}")
         # Melempar kembali error agar bisa ditangkap oleh route utama
         raise e
+    wake_mail_worker(job_id)
+
+@app.route("/tasks/mail-queue", methods=['GET', 'POST'])
+def run_mail_queue():
+    """Dipanggil oleh Vercel Cron (Authorization: Bearer CRON_SECRET) untuk deployment tanpa worker thread."""
+    secret = os.getenv('CRON_SECRET')
+    if not secret or request.headers.get('Authorization') != f"Bearer {secret}":
+        return jsonify({'error': 'Unauthorized'}), 401
+    processed = 0
+    deadline = datetime.now(timezone.utc) + timedelta(seconds=20)
+    while datetime.now(timezone.utc) < deadline:
+        count = mail_queue.process_batch(get_mail(), MAIL_SENDER)
+        processed += count
+        if count < mail_queue.BATCH_SIZE:
+            break
+    return jsonify({'processed': processed, 'queue': mail_queue.queue_stats()})
+
+@app.route("/tasks/archive", methods=['GET', 'POST'])
+def run_archive():
+    """Kompaksi arsip berkala lewat Vercel Cron; VACUUM diserahkan ke autovacuum supaya tetap singkat."""
+    secret = os.getenv('CRON_SECRET')
+    if not secret or request.headers.get('Authorization') != f"Bearer {secret}":
+        return jsonify({'error': 'Unauthorized'}), 401
+    return jsonify(archive.run_compaction(deadline_seconds=20, vacuum=False))
 
 @app.route("/reset_password", methods=['GET', 'POST'])
+@rate_limit.limited('reset_password')
 def reset_request():
     if current_user.is_authenticated:
         return redirect(url_for('home'))
     if request.method == 'POST':
         email = request.form.get('email')
-        conn = None
         try:
-            conn = get_db_connection()
-            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-                cur.execute("SELECT id, email, name FROM users WHERE email = %s", (email,))
-                user_data = cur.fetchone()
-            
+            with get_db_connection() as conn:
+                with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                    cur.execute("SELECT id, email, name FROM users WHERE email = %s", (email,))
+                    user_data = cur.fetchone()
+
             if user_data:
                 user = User(id=user_data['id'], email=user_data['email'], name=user_data['name'])
                 send_reset_email(user)
@@ -306,8 +445,6 @@ def reset_request():
             logging.error(f"Error di route reset_request: {e}")
             flash('An error occurred while trying to send the email. Please check server logs.', 'danger')
             return redirect(url_for('reset_request'))
-        finally:
-            if conn: conn.close()
     return render_template('reset_request.html')
 
 @app.route("/reset_password/<token>", methods=['GET', 'POST'])
@@ -320,198 +457,362 @@ def reset_token(token):
         return redirect(url_for('reset_request'))
     if request.method == 'POST':
         password = request.form.get('password')
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
-        conn = None
-        try:
-            conn = get_db_connection()
+        hashed_password = hasher.hash(password)
+        with get_db_connection() as conn:
             with conn.cursor() as cur:
-                cur.execute("UPDATE users SET password_hash = %s WHERE id = %s", (hashed_password.decode('utf-8'), user.id))
+                cur.execute("UPDATE users SET password_hash = %s WHERE id = %s", (hashed_password, user.id))
             conn.commit()
-            flash('Your password has been updated! You are now able to log in.', 'success')
-            return redirect(url_for('login'))
-        finally:
-            if conn: conn.close()
+        invalidate_user(user.id)
+        flash('Your password has been updated! You are now able to log in.', 'success')
+        return redirect(url_for('login'))
     return render_template('reset_token.html')
 
 
 # === ROUTES CHAT API (Lengkap & Aman) ===
+# Versi daftar percakapan untuk ETag /history: jumlah percakapan + perubahan terakhir (termasuk penghapusan)
+HISTORY_VERSION_SQL = """
+    SELECT count(*) AS total,
+           greatest(max(updated_at),
+                    (SELECT max(deleted_at) FROM conversation_tombstones WHERE user_id = %(user_id)s)) AS synced_at
+    FROM conversations WHERE user_id = %(user_id)s
+"""
+# Tombstone percakapan yang dihapus disimpan selama ini; client dengan `since` yang lebih tua disuruh resync
+TOMBSTONE_RETENTION_DAYS = int(os.getenv("HISTORY_TOMBSTONE_DAYS", "30"))
+DELETE_CONVERSATION_SQL = """
+    WITH deleted AS (
+        DELETE FROM conversations WHERE id = %(conversation_id)s AND user_id = %(user_id)s RETURNING id
+    )
+    INSERT INTO conversation_tombstones (conversation_id, user_id)
+    SELECT id, %(user_id)s FROM deleted
+    ON CONFLICT (conversation_id) DO UPDATE SET deleted_at = now()
+"""
+
 @app.route('/history', methods=['GET'])
 @login_required
 def get_history():
-    conn = None
+    """
+    Daftar percakapan, terbaru dulu.
+    ?limit=&cursor=  -> halaman berikutnya (keyset pada timestamp, id)
+    ?since=          -> hanya percakapan yang berubah setelah `synced_at` dari respons sebelumnya, ditambah
+                        `deleted`: id percakapan yang dihapus sejak itu (dari conversation_tombstones)
+    """
+    limit = page_limit()
+    cursor = request.args.get('cursor')
+    since = request.args.get('since')
+    try:
+        after = decode_cursor(cursor) if cursor else None
+        if after is not None:
+            if not isinstance(after, list) or len(after) != 2 or not isinstance(after[1], str):
+                raise ValueError("Invalid cursor.")
+            after = (parse_timestamp(after[0], "Invalid cursor."), after[1])
+        since = parse_timestamp(since, "Invalid since.") if since else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     try:
-        conn = get_db_connection()
-        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-            cur.execute("SELECT id, title FROM conversations WHERE user_id = %s ORDER BY timestamp DESC", (current_user.id,))
-            conversations = cur.fetchall()
-        return jsonify(conversations)
+        with get_db_connection() as conn:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                # Query agregat murah untuk ETag; jika client sudah punya versi ini, daftar tidak perlu dibaca.
+                # synced_at ikut naik saat percakapan dihapus supaya delta berikutnya membawa tombstone-nya.
+                cur.execute(HISTORY_VERSION_SQL, {'user_id': current_user.id})
+                version = cur.fetchone()
+                etag = make_etag('history', current_user.id, version['total'], version['synced_at'], limit, cursor, since)
+                if is_not_modified(etag):
+                    return not_modified_response(etag)
+
+                deleted = []
+                if since and since < datetime.now(timezone.utc) - timedelta(days=TOMBSTONE_RETENTION_DAYS):
+                    # Tombstone sejak `since` mungkin sudah dibersihkan: client harus memuat ulang dari awal
+                    conversations, has_more = [], True
+                elif since:
+                    cur.execute(
+                        "SELECT id, title, timestamp, updated_at FROM conversations WHERE user_id = %s AND updated_at > %s ORDER BY updated_at DESC LIMIT %s",
+                        (current_user.id, since, limit + 1)
+                    )
+                    conversations = cur.fetchall()
+                    cur.execute(
+                        "SELECT conversation_id FROM conversation_tombstones WHERE user_id = %s AND deleted_at > %s LIMIT %s",
+                        (current_user.id, since, limit + 1)
+                    )
+                    deleted = [row['conversation_id'] for row in cur.fetchall()]
+                    has_more = len(conversations) > limit or len(deleted) > limit
+                elif after:
+                    cur.execute(
+                        "SELECT id, title, timestamp, updated_at FROM conversations WHERE user_id = %s AND (timestamp, id) < (%s, %s) ORDER BY timestamp DESC, id DESC LIMIT %s",
+                        (current_user.id, after[0], after[1], limit + 1)
+                    )
+                    conversations = cur.fetchall()
+                    has_more = len(conversations) > limit
+                else:
+                    cur.execute(
+                        "SELECT id, title, timestamp, updated_at FROM conversations WHERE user_id = %s ORDER BY timestamp DESC, id DESC LIMIT %s",
+                        (current_user.id, limit + 1)
+                    )
+                    conversations = cur.fetchall()
+                    has_more = len(conversations) > limit
+
+        conversations = conversations[:limit]
+        next_cursor = None
+        if has_more and not since:
+            next_cursor = encode_cursor(conversations[-1]['timestamp'], conversations[-1]['id'])
+        payload = {
+            'conversations': [
+                {'id': c['id'], 'title': c['title'], 'timestamp': c['timestamp'].isoformat(), 'updated_at': c['updated_at'].isoformat()}
+                for c in conversations
+            ],
+            'next_cursor': next_cursor,
+            # Delta terlalu besar untuk satu halaman: client sebaiknya memuat ulang dari awal
+            'resync': bool(since) and has_more,
+            'synced_at': version['synced_at'].isoformat() if version['synced_at'] else None,
+        }
+        if since:
+            payload['deleted'] = deleted
+        return conditional_json(payload, etag)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    finally:
-        if conn: conn.close()
+
+# Hash dihitung Postgres dengan rumus yang sama dengan markdown_render.content_hash, jadi HTML yang
+# sudah pernah dirender ikut terbaca di query pesan yang sama (None jika belum ada di cache)
+RENDERED_HTML_JOIN = (" LEFT JOIN rendered_messages r ON m.role = 'assistant'"
+                      " AND r.content_hash = sha256(convert_to(%s || m.content, 'UTF8'))")
+
+def render_message(message, render_html):
+    item = {'role': message['role'], 'content': message['content']}
+    if render_html and message['role'] == 'assistant':
+        item['html'] = message['html']
+    return item
 
 @app.route('/conversation/<conversation_id>', methods=['GET'])
 @login_required
 def get_conversation(conversation_id):
-    conn = None
+    """
+    Pesan dalam satu percakapan, urut dari yang lama ke yang baru.
+    Tanpa parameter, mengembalikan `limit` pesan terakhir; ?before=<next_cursor> memuat pesan sebelumnya.
+    Dengan ?render=html (dan SERVER_RENDER=1), pesan assistant juga membawa `html` hasil render server.
+    """
+    limit = page_limit()
+    cursor = request.args.get('before')
+    render_html = markdown_render.ENABLED and request.args.get('render') == 'html'
+    try:
+        before = decode_cursor(cursor) if cursor else None
+        if before is not None and (not isinstance(before, list) or len(before) != 1
+                                   or not isinstance(before[0], int) or isinstance(before[0], bool)):
+            raise ValueError("Invalid cursor.")
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     try:
-        conn = get_db_connection()
-        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-            cur.execute("SELECT user_id FROM conversations WHERE id = %s", (conversation_id,))
-            owner = cur.fetchone()
-            if not owner or owner['user_id'] != current_user.id:
-                return jsonify({'error': 'Access denied'}), 403
-            cur.execute("SELECT role, content FROM messages WHERE conversation_id = %s AND role IN ('user', 'assistant') ORDER BY timestamp ASC", (conversation_id,))
-            messages = cur.fetchall()
-            return jsonify(messages or [])
+        with get_db_connection() as conn:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                cur.execute("SELECT user_id, updated_at, archived_at FROM conversations WHERE id = %s", (conversation_id,))
+                owner = cur.fetchone()
+                if not owner or owner['user_id'] != current_user.id:
+                    return jsonify({'error': 'Access denied'}), 403
+
+                # updated_at naik setiap ada pesan baru, jadi cukup untuk ETag tanpa membaca pesan
+                etag = make_etag('conversation', conversation_id, owner['updated_at'], limit, cursor, render_html)
+                if is_not_modified(etag):
+                    return not_modified_response(etag)
+                if owner['archived_at']:
+                    # Percakapan lama: pesan dikembalikan dari arsip dulu (id asli, jadi ETag/cursor tetap berlaku)
+                    archive.restore(conn, conversation_id)
+
+                query = "SELECT m.id, m.role, m.content" + (", r.html" if render_html else "") + " FROM messages m"
+                params = [markdown_render.RENDER_PREFIX] if render_html else []
+                if render_html:
+                    query += RENDERED_HTML_JOIN
+                query += " WHERE m.conversation_id = %s AND m.role IN ('user', 'assistant')"
+                params.append(conversation_id)
+                if before:
+                    query += " AND m.id < %s"
+                    params.append(before[0])
+                cur.execute(query + " ORDER BY m.id DESC LIMIT %s", params + [limit + 1])
+                messages = cur.fetchall()
+
+                has_more = len(messages) > limit
+                messages = list(reversed(messages[:limit]))
+                if render_html:
+                    markdown_render.fill_missing(conn, messages)
+
+        payload = {
+            'messages': [render_message(m, render_html) for m in messages],
+            'next_cursor': encode_cursor(messages[0]['id']) if has_more else None,
+        }
+        return conditional_json(payload, etag)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/search', methods=['GET'])
+@login_required
+def search_messages():
+    """
+    Pencarian full-text di semua percakapan user: ?q=<kata kunci>&limit=&cursor=
+    Hasil diurutkan berdasarkan relevansi di dalam jendela pesan cocok terbaru (lihat search.py);
+    `snippet` adalah HTML dengan kata yang cocok dibungkus <mark>. Halaman pertama juga membawa
+    `archived_conversations`: jumlah percakapan arsip yang pesannya tidak ikut dicari.
+    """
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({'error': 'Query is required.'}), 400
+    limit = page_limit()
+    cursor = request.args.get('cursor')
+    try:
+        after = decode_cursor(cursor) if cursor else None
+        if after is not None and (not isinstance(after, list) or len(after) not in (1, 3)):
+            raise ValueError("Invalid cursor.")
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        results, next_values = search.search_messages(current_user.id, q, limit, after)
+        payload = {
+            'results': results,
+            'next_cursor': encode_cursor(*next_values) if next_values else None,
+        }
+        if after is None:
+            payload['archived_conversations'] = search.archived_count(current_user.id)
+        return jsonify(payload)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    finally:
-        if conn: conn.close()
 
 @app.route('/delete_conversation/<conversation_id>', methods=['DELETE'])
 @login_required
 def delete_conversation(conversation_id):
-    conn = None
     try:
-        conn = get_db_connection()
-        with conn.cursor() as cur:
-            cur.execute("DELETE FROM conversations WHERE id = %s AND user_id = %s", (conversation_id, current_user.id))
-            conn.commit()
-            if cur.rowcount > 0:
-                return jsonify({'status': 'success'})
-            else:
-                return jsonify({'status': 'error', 'message': 'Conversation not found'}), 404
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(DELETE_CONVERSATION_SQL, {'conversation_id': conversation_id, 'user_id': current_user.id})
+                deleted = cur.rowcount
+                if random.random() < 0.01:
+                    cur.execute("DELETE FROM conversation_tombstones WHERE deleted_at < now() - %s * interval '1 day'",
+                                (TOMBSTONE_RETENTION_DAYS,))
+                conn.commit()
+        if deleted > 0:
+            return jsonify({'status': 'success'})
+        else:
+            return jsonify({'status': 'error', 'message': 'Conversation not found'}), 404
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
-    finally:
-        if conn: conn.close()
 
 @app.route('/new_chat', methods=['POST'])
 @login_required
 def new_chat():
-    conn = None
     try:
         conversation_id = str(uuid.uuid4())
-        conn = get_db_connection()
-        with conn.cursor() as cur:
-            cur.execute('INSERT INTO conversations (id, title, user_id) VALUES (%s, %s, %s)', 
-                        (conversation_id, "New Conversation", current_user.id))
-        conn.commit()
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute('INSERT INTO conversations (id, title, user_id) VALUES (%s, %s, %s)', 
+                            (conversation_id, "New Conversation", current_user.id))
+            conn.commit()
         return jsonify({'conversation_id': conversation_id})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    finally:
-        if conn: conn.close()
+
+# === HELPER CHAT ===
+def sse_event(payload, event=None):
+    data = json.dumps(payload, ensure_ascii=False)
+    return (f"event: {event}\n" if event else "") + f"data: {data}\n\n"
 
 @app.route('/ask', methods=['POST'])
 @login_required
+@rate_limit.limited('ask', admit=True)
 def ask_ai():
     data = request.get_json()
     conversation_id = data.get('conversation_id')
     user_prompt_original = data.get('prompt')
     if not all([conversation_id, user_prompt_original]):
         return jsonify({'error': 'Conversation ID or prompt missing.'}), 400
-    if model is None:
+    if get_model() is None:
         return jsonify({'answer': "Sorry, the AI model is not configured."}), 500
 
-    user_prompt_lower = user_prompt_original.lower()
-    ai_answer = ""
-    db_history = []
-    
-    if "cuaca" in user_prompt_lower:
-        try:
-            # LANGKAH 1: Minta Gemini untuk mengekstrak nama kota dari pertanyaan
-            extraction_prompt = f"""Dari kalimat berikut, ekstrak HANYA nama kota atau lokasinya. Jika tidak disebutkan secara spesifik, jawab HANYA dengan kata 'None'. Kalimat: '{user_prompt_original}'"""
-            
-            city_response = model.generate_content(extraction_prompt)
-            city = city_response.text.strip()
-
-            # Jika Gemini tidak menemukan kota, gunakan default atau bisa juga bertanya kembali ke user
-            if city.lower() == 'none' or not city:
-                city = "Jakarta" # Tetap gunakan default jika tidak ada kota dalam pertanyaan
-                logging.info(f"Tidak ada kota terdeteksi, menggunakan default: {city}")
-            else:
-                logging.info(f"Kota yang terdeteksi oleh AI: {city}")
-
-            # LANGKAH 2: Panggil API OpenWeatherMap dengan kota yang sudah diekstrak
-            api_key = os.getenv("OPENWEATHERMAP_API_KEY")
-            url = f"http://api.openweathermap.org/data/2.5/weather?q={city}&appid={api_key}&units=metric&lang=id"
-            response = requests.get(url).json()
-            
-            if response.get("cod") == 200:
-                cuaca = response['weather'][0]['description']
-                suhu = response['main']['temp']
-                ai_answer = f"Tentu, cuaca di {city.title()} saat ini adalah {cuaca} dengan suhu sekitar {suhu}°C."
-            else:
-                # Jika kota hasil ekstraksi tidak ditemukan oleh API cuaca
-                ai_answer = f"Maaf, saya tidak dapat menemukan data cuaca untuk '{city.title()}'. Pastikan nama lokasinya benar."
+    idempotency_key = request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+    if idempotency_key and len(idempotency_key) > ask_dedup.MAX_KEY_CHARS:
+        return jsonify({'error': 'Idempotency-Key too long.'}), 400
 
-        except Exception as e:
-            logging.error(f"Error saat memproses permintaan cuaca: {e}")
-            ai_answer = "Maaf, terjadi kesalahan saat memproses permintaan cuaca."
-    
-    elif user_prompt_lower.startswith(("siapa", "apa itu", "kapan", "presiden", "berita")):
-        try:
-            api_key = os.getenv("SERPAPI_API_KEY")
-            params = { "engine": "google", "q": user_prompt_original, "api_key": api_key }
-            response = requests.get("https://serpapi.com/search.json", params=params).json()
-            context_snippets = []
-            if "organic_results" in response:
-                for result in response["organic_results"][:3]:
-                    if "snippet" in result:
-                        context_snippets.append(result["snippet"])
-            if not context_snippets:
-                raise ValueError("No context found from web search")
-            context = " ".join(context_snippets)
-            augmented_prompt = f"""Berdasarkan informasi dari internet berikut: "{context}", jawab pertanyaan ini secara detail, lengkap, dan jelaskan dengan baik dalam Bahasa Indonesia: "{user_prompt_original}" """
-            response = model.generate_content(augmented_prompt)
-            ai_answer = response.text
-        except Exception as e:
-            logging.error(f"SerpAPI/Augmented prompt failed: {e}")
-            ai_answer = ""
+    user_id = current_user.id
+    try:
+        if ask_dedup.ENABLED:
+            # Request identik yang sedang berjalan digabung; pipeline dibatalkan jika semua client pergi
+            ai_answer = ask_dedup.deduplicator.run(
+                user_id, conversation_id, user_prompt_original, idempotency_key,
+                start=lambda exchange_id, on_chunk: pipeline.start(
+                    pipeline.ask(conversation_id, user_id, user_prompt_original, exchange_id=exchange_id)),
+                disconnected=lambda: ask_dedup.client_disconnected(request.environ),
+            )
+        else:
+            ai_answer = pipeline.run(pipeline.ask(conversation_id, user_id, user_prompt_original))
+    except ask_dedup.ClientDisconnected:
+        # Tidak ada yang membaca respons ini lagi; 499 hanya untuk log akses
+        return Response(status=499)
+    except ask_dedup.IdempotencyConflict as e:
+        return jsonify({'error': str(e)}), 409
+    except pipeline.AccessDenied:
+        return jsonify({'error': 'Access denied'}), 403
+    except pipeline.StepTimeout as e:
+        logging.error(f"/ask timeout: {e}")
+        return jsonify({'answer': "Sorry, the AI took too long to respond. Please try again."}), 504
+    except Exception as e:
+        return jsonify({'answer': f"Sorry, an error occurred with the AI: {e}"}), 500
 
-    if not ai_answer:
-        conn = None
-        try:
-            conn = get_db_connection()
-            with conn.cursor() as cur:
-                cur.execute("SELECT user_id FROM conversations WHERE id = %s", (conversation_id,))
-                owner = cur.fetchone()
-                if not owner or owner[0] != current_user.id:
-                    return jsonify({'error': 'Access denied'}), 403
-                cur.execute("SELECT role, content FROM messages WHERE conversation_id = %s ORDER BY timestamp DESC LIMIT 6", (conversation_id,))
-                db_history_reversed = cur.fetchall()
-                db_history = list(reversed(db_history_reversed))
-        finally:
-            if conn: conn.close()
-        
+    return jsonify({'answer': ai_answer})
+
+@app.route('/ask/stream', methods=['POST'])
+@login_required
+@rate_limit.limited('ask', admit=True)
+def ask_ai_stream():
+    data = request.get_json()
+    conversation_id = data.get('conversation_id')
+    user_prompt_original = data.get('prompt')
+    if not all([conversation_id, user_prompt_original]):
+        return jsonify({'error': 'Conversation ID or prompt missing.'}), 400
+    if get_model() is None:
+        return jsonify({'answer': "Sorry, the AI model is not configured."}), 500
+
+    idempotency_key = request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+    if idempotency_key and len(idempotency_key) > ask_dedup.MAX_KEY_CHARS:
+        return jsonify({'error': 'Idempotency-Key too long.'}), 400
+
+    # Cek kepemilikan sebelum stream dimulai, supaya 403 masih bisa dikirim sebagai status HTTP
+    db_history = load_chat_history(conversation_id, current_user.id)
+    if db_history is None:
+        return jsonify({'error': 'Access denied'}), 403
+
+    user_id = current_user.id
+    environ = request.environ
+    # Pipeline berjalan di loop async; stream identik yang sedang berjalan digabung (double-submit, tab lain),
+    # dan pipeline dibatalkan (juga di tahap tool) begitu semua client yang menunggunya pergi
+    chunks = ask_dedup.deduplicator.stream(
+        user_id, conversation_id, user_prompt_original, idempotency_key,
+        start=lambda exchange_id, on_chunk: pipeline.start(
+            pipeline.ask_stream(conversation_id, user_prompt_original, db_history, on_chunk, exchange_id=exchange_id)),
+        disconnected=lambda: ask_dedup.client_disconnected(environ),
+        coalesce=ask_dedup.ENABLED,
+    )
+
+    def generate():
+        status = 'done'
+        length = 0
         try:
-            history_for_ai = [
-                {"role": 'user', "parts": [briefing_user]},
-                {"role": 'model', "parts": [briefing_model]}
-            ]
-            history_for_ai.extend([{"role": ('model' if role in ['assistant', 'model'] else 'user'), "parts": [content]} for role, content in db_history])
-            chat = model.start_chat(history=history_for_ai)
-            response = chat.send_message(user_prompt_original)
-            ai_answer = response.text
+            for text in chunks:
+                length += len(text)
+                yield sse_event({'delta': text})
+            yield sse_event({'status': 'done'}, event='done')
+        except GeneratorExit:
+            # Client memutus koneksi (pindah halaman / tombol stop); pembatalan dicatat oleh ask_dedup
+            status = 'cancelled'
+            chunks.close()
+            raise
+        except ask_dedup.ClientDisconnected:
+            status = 'cancelled'
+        except ask_dedup.IdempotencyConflict as e:
+            status = 'conflict'
+            yield sse_event({'error': str(e)}, event='error')
         except Exception as e:
-            return jsonify({'answer': f"Sorry, an error occurred with the AI: {e}"}), 500
+            status = 'error'
+            logging.error(f"Streaming answer failed: {e}")
+            yield sse_event({'error': f"Sorry, an error occurred with the AI: {e}"}, event='error')
+        finally:
+            logging.info(f"Stream {conversation_id} selesai dengan status '{status}' ({length} karakter)")
 
-    try:
-        conn = get_db_connection()
-        with conn.cursor() as cur:
-            cur.execute('INSERT INTO messages (conversation_id, role, content) VALUES (%s, %s, %s)', (conversation_id, 'user', user_prompt_original))
-            cur.execute('INSERT INTO messages (conversation_id, role, content) VALUES (%s, %s, %s)', (conversation_id, 'assistant', ai_answer))
-            if not db_history:
-                cur.execute("UPDATE conversations SET title = %s WHERE id = %s", (user_prompt_original[:50], conversation_id))
-        conn.commit()
-    except Exception as e:
-        logging.error(f"Failed to save message: {e}")
-    finally:
-        if conn: conn.close()
-    
-    return jsonify({'answer': ai_answer})
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
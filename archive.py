@@ -0,0 +1,289 @@
+# archive.py
+# Tier arsip untuk percakapan yang lama tidak aktif.
+#
+# Percakapan yang tidak berubah selama ARCHIVE_IDLE_DAYS hari dipindah dari tabel messages ke satu
+# baris archived_conversations: semua pesannya sebagai JSON yang dikompres zstd. Tabel messages (dan
+# index-indexnya) jadi hanya berisi percakapan yang masih dipakai. Saat percakapan arsip dibuka lagi
+# (/conversation/<id> atau /ask), pesannya dikembalikan ke messages dengan id aslinya (restore), jadi
+# cursor, urutan, dan ETag tetap sama dan client tidak perlu tahu percakapan itu pernah diarsipkan.
+#
+# Percakapan dianggap idle sejak aktivitas terakhirnya: pesan terakhir (updated_at) atau terakhir kali
+# dikembalikan dari arsip (restored_at), jadi percakapan lama yang baru dibuka tidak langsung diarsipkan lagi.
+#
+# Selama diarsipkan, pesan tidak ikut /search (search_vector hanya ada di messages); UI pencarian
+# memberi tahu user jika ada percakapan arsip (search.archived_count).
+#
+#   python archive.py                         # satu putaran kompaksi: arsipkan, VACUUM, cetak laporan
+#   python archive.py --idle-days 30 --limit 5000
+#   python archive.py --report                # laporan ruang saja, tanpa mengarsipkan
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+import statistics
+
+from psycopg2.extras import execute_values
+
+from db import get_db_connection
+import tracing
+
+IDLE_DAYS = int(os.getenv("ARCHIVE_IDLE_DAYS", "90"))
+BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "50"))
+ZSTD_LEVEL = int(os.getenv("ARCHIVE_ZSTD_LEVEL", "10"))
+CODEC = "zstd+json"
+COLUMNS = ("id", "role", "content", "token_count", "timestamp", "exchange_id")
+# Jumlah percakapan aktif yang query-nya diukur sebelum/sesudah kompaksi untuk laporan
+SAMPLE_CONVERSATIONS = 20
+
+# Salinan query halaman pertama /conversation/<id> (app.get_conversation)
+CONVERSATION_PAGE_SQL = """
+    SELECT m.id, m.role, m.content FROM messages m
+    WHERE m.conversation_id = %s AND m.role IN ('user', 'assistant')
+    ORDER BY m.id DESC LIMIT 51
+"""
+
+# Kandidat arsip: idle dihitung dari aktivitas terakhir, pesan baru (updated_at) atau restore (restored_at)
+CANDIDATES_SQL = """
+    SELECT id FROM conversations
+    WHERE archived_at IS NULL AND greatest(updated_at, restored_at) < now() - %(idle_days)s * interval '1 day'
+    ORDER BY greatest(updated_at, restored_at) LIMIT %(limit)s FOR UPDATE SKIP LOCKED
+"""
+
+_stats_lock = threading.Lock()
+_stats = {"archived": 0, "archived_messages": 0, "restored": 0, "restored_messages": 0,
+          "restore_seconds_total": 0.0}
+
+
+def _pack(rows):
+    """Baris pesan -> (ukuran JSON mentah, payload terkompresi)."""
+    raw = json.dumps({"columns": COLUMNS, "rows": rows}, ensure_ascii=False, separators=(",", ":"),
+                     default=str).encode("utf-8")
+    # ZstdCompressor/ZstdDecompressor tidak thread-safe, jadi dibuat per pemanggilan (murah). zstandard
+    # diimpor di sini, bukan saat modul dimuat: chat_store/metrics mengimpor archive di setiap cold start.
+    import zstandard
+
+    return len(raw), zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+
+
+def _unpack(codec, payload):
+    if codec != CODEC:
+        raise ValueError(f"Codec arsip tidak dikenal: {codec}")
+    import zstandard
+
+    data = json.loads(zstandard.ZstdDecompressor().decompress(bytes(payload)))
+    return [dict(zip(data["columns"], row)) for row in data["rows"]]
+
+
+def archive_batch(idle_days=IDLE_DAYS, limit=BATCH_SIZE):
+    """
+    Mengarsipkan sampai `limit` percakapan yang idle lebih dari `idle_days` hari dalam satu transaksi.
+    Baris conversations dikunci FOR UPDATE SKIP LOCKED, jadi aman dijalankan paralel dengan restore
+    atau job lain. Mengembalikan statistik batch (jumlah, ukuran di tabel panas vs terkompresi).
+    """
+    batch = {"conversations": 0, "messages": 0, "hot_bytes": 0, "raw_bytes": 0, "compressed_bytes": 0}
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(CANDIDATES_SQL, {'idle_days': idle_days, 'limit': limit})
+            ids = [row[0] for row in cur.fetchall()]
+            if not ids:
+                conn.rollback()
+                return batch
+
+            cur.execute(
+                """SELECT conversation_id, pg_column_size(m.*), id, role, content, token_count, timestamp, exchange_id
+                   FROM messages m WHERE conversation_id = ANY(%s) ORDER BY conversation_id, id""",
+                (ids,)
+            )
+            grouped = {conversation_id: [] for conversation_id in ids}
+            for conversation_id, size, *row in cur.fetchall():
+                grouped[conversation_id].append(row)
+                batch["hot_bytes"] += size
+
+            archived = []
+            for conversation_id, rows in grouped.items():
+                raw_bytes, payload = _pack(rows)
+                archived.append((conversation_id, CODEC, payload, len(rows), raw_bytes))
+                batch["messages"] += len(rows)
+                batch["raw_bytes"] += raw_bytes
+                batch["compressed_bytes"] += len(payload)
+            execute_values(cur, """INSERT INTO archived_conversations
+                                   (conversation_id, codec, payload, message_count, raw_bytes) VALUES %s""", archived)
+            cur.execute("DELETE FROM messages WHERE conversation_id = ANY(%s)", (ids,))
+            cur.execute("UPDATE conversations SET archived_at = now() WHERE id = ANY(%s)", (ids,))
+        conn.commit()
+
+    batch["conversations"] = len(ids)
+    with _stats_lock:
+        _stats["archived"] += len(ids)
+        _stats["archived_messages"] += batch["messages"]
+    return batch
+
+
+@tracing.traced('db.archive_restore')
+def restore(conn, conversation_id):
+    """
+    Mengembalikan pesan percakapan arsip ke tabel messages (id asli dipertahankan) lalu commit.
+    Aman dipanggil bersamaan dari beberapa request: yang kedua menunggu kunci baris lalu tidak
+    menemukan arsip lagi. Mengembalikan jumlah pesan yang dikembalikan.
+    """
+    started = time.perf_counter()
+    restored = 0
+    with conn.cursor() as cur:
+        # Urutan kunci sama dengan archive_batch (conversations dulu) supaya tidak deadlock
+        cur.execute("UPDATE conversations SET archived_at = NULL, restored_at = now() WHERE id = %s RETURNING user_id",
+                    (conversation_id,))
+        owner = cur.fetchone()
+        cur.execute("DELETE FROM archived_conversations WHERE conversation_id = %s RETURNING codec, payload",
+                    (conversation_id,))
+        archived = cur.fetchone()
+        if owner and archived:
+            rows = _unpack(*archived)
+            execute_values(
+                cur,
+                """INSERT INTO messages (id, conversation_id, user_id, role, content, token_count, timestamp, exchange_id)
+                   VALUES %s ON CONFLICT (id) DO NOTHING""",
+                [(r["id"], conversation_id, owner[0], r["role"], r["content"], r["token_count"], r["timestamp"],
+                  r["exchange_id"]) for r in rows]
+            )
+            restored = len(rows)
+    conn.commit()
+
+    with _stats_lock:
+        _stats["restored"] += 1
+        _stats["restored_messages"] += restored
+        _stats["restore_seconds_total"] += time.perf_counter() - started
+    logging.info(f"Percakapan {conversation_id} dikembalikan dari arsip ({restored} pesan)")
+    return restored
+
+
+def space_report():
+    """Ukuran tabel panas dan arsip saat ini, plus rasio kompresi arsip."""
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """SELECT pg_total_relation_size('messages'), pg_relation_size('messages'),
+                          pg_total_relation_size('archived_conversations'),
+                          count(*), coalesce(sum(message_count), 0), coalesce(sum(raw_bytes), 0),
+                          coalesce(sum(octet_length(payload)), 0)
+                   FROM archived_conversations"""
+            )
+            (messages_total, messages_heap, archive_total,
+             conversations, messages, raw_bytes, compressed_bytes) = cur.fetchone()
+        conn.rollback()
+    return {
+        "messages_total_bytes": messages_total, "messages_heap_bytes": messages_heap,
+        "archive_total_bytes": archive_total, "archived_conversations": conversations,
+        "archived_messages": int(messages), "archived_raw_bytes": int(raw_bytes),
+        "archived_compressed_bytes": int(compressed_bytes),
+        "compression_ratio": round(int(raw_bytes) / int(compressed_bytes), 2) if compressed_bytes else None,
+    }
+
+
+def _time_hot_queries(samples):
+    """Median latensi (ms) query /conversation dan history /ask untuk percakapan aktif `samples`."""
+    import chat_store
+    import context_builder
+
+    conversation, history = [], []
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            for conversation_id, user_id in samples:
+                start = time.perf_counter()
+                cur.execute(CONVERSATION_PAGE_SQL, (conversation_id,))
+                cur.fetchall()
+                conversation.append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                cur.execute(chat_store.HISTORY_SQL, {
+                    'overhead': context_builder.MESSAGE_OVERHEAD_TOKENS, 'limit': context_builder.MAX_MESSAGES,
+                    'conversation_id': conversation_id, 'user_id': user_id,
+                })
+                cur.fetchall()
+                history.append(time.perf_counter() - start)
+        conn.rollback()
+    return {"conversation_ms": round(statistics.median(conversation) * 1000, 2) if conversation else None,
+            "ask_history_ms": round(statistics.median(history) * 1000, 2) if history else None}
+
+
+def _vacuum():
+    with get_db_connection() as conn:
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("VACUUM (ANALYZE) messages")
+        finally:
+            conn.autocommit = False
+
+
+def run_compaction(idle_days=IDLE_DAYS, limit=None, deadline_seconds=None, vacuum=True):
+    """
+    Satu putaran kompaksi: mengarsipkan percakapan idle per batch sampai habis (atau `limit` percakapan /
+    `deadline_seconds` tercapai), VACUUM tabel messages, lalu membandingkan ukuran tabel dan latensi
+    query panas sebelum dan sesudahnya. Mengembalikan laporan sebagai dict.
+    """
+    started = time.perf_counter()
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT id, user_id FROM conversations WHERE archived_at IS NULL ORDER BY updated_at DESC LIMIT %s",
+                        (SAMPLE_CONVERSATIONS,))
+            samples = cur.fetchall()
+        conn.rollback()
+    space_before, time_before = space_report(), _time_hot_queries(samples)
+
+    totals = {"conversations": 0, "messages": 0, "hot_bytes": 0, "raw_bytes": 0, "compressed_bytes": 0}
+    while limit is None or totals["conversations"] < limit:
+        if deadline_seconds is not None and time.perf_counter() - started > deadline_seconds:
+            break
+        batch = archive_batch(idle_days, BATCH_SIZE if limit is None else min(BATCH_SIZE, limit - totals["conversations"]))
+        for key, value in batch.items():
+            totals[key] += value
+        if batch["conversations"] < BATCH_SIZE:
+            break
+    if vacuum and totals["conversations"]:
+        _vacuum()
+
+    space_after, time_after = space_report(), _time_hot_queries(samples)
+    report = {
+        "idle_days": idle_days,
+        "archived": totals,
+        # Byte baris di tabel panas yang dibebaskan vs byte yang ditambahkan ke arsip (belum termasuk index)
+        "bytes_saved": totals["hot_bytes"] - totals["compressed_bytes"],
+        "space_before": space_before,
+        "space_after": space_after,
+        "query_time_before": time_before,
+        "query_time_after": time_after,
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+    logging.info(f"Kompaksi arsip: {totals['conversations']} percakapan, {totals['messages']} pesan, "
+                 f"{totals['hot_bytes']} -> {totals['compressed_bytes']} byte")
+    return report
+
+
+def stats():
+    with _stats_lock:
+        result = dict(_stats)
+    result["avg_restore_seconds"] = result.pop("restore_seconds_total") / result["restored"] if result["restored"] else 0.0
+    return result
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--idle-days", type=int, default=IDLE_DAYS)
+    parser.add_argument("--limit", type=int, help="maksimal percakapan yang diarsipkan di putaran ini")
+    parser.add_argument("--no-vacuum", action="store_true")
+    parser.add_argument("--report", action="store_true", help="cetak ukuran tabel/arsip saja")
+    args = parser.parse_args()
+
+    if args.report:
+        result = space_report()
+    else:
+        result = run_compaction(args.idle_days, args.limit, vacuum=not args.no_vacuum)
+    json.dump(result, sys.stdout, indent=2)
+    print()
@@ -0,0 +1,384 @@
+# ask_dedup.py
+# Idempotency key, penggabungan /ask yang identik, dan pembatalan saat client memutus koneksi.
+#
+# - /ask yang identik dan sedang berjalan di proses yang sama digabung: hanya satu yang menjalankan
+#   pipeline (Gemini/SerpAPI), sisanya menunggu hasil yang sama. Identik = user + percakapan + header
+#   Idempotency-Key, atau user + percakapan + prompt jika client tidak mengirim key (double-submit).
+# - Dengan Idempotency-Key, request dicatat di tabel ask_requests (migrasi 12): request ulang dengan
+#   key yang sama dari proses mana pun menunggu yang sedang berjalan, atau langsung mendapat jawaban
+#   yang sudah jadi selama ASK_IDEMPOTENCY_TTL. Key yang sama untuk prompt/percakapan lain ditolak (409).
+#   exchange_id pesan diturunkan dari key + klaimnya, jadi jawaban tidak pernah tersimpan dua kali, tapi key
+#   yang dipakai ulang setelah TTL (klaim baru) tetap menyimpan jawaban barunya.
+# - /ask/stream memakai mekanisme yang sama lewat stream(): request yang menumpang menerima potongan
+#   jawaban yang sudah ada lalu mengikuti sisanya; jawaban yang diputar ulang dikirim sebagai satu potongan.
+# - Selama menunggu, koneksi client diintip setiap ASK_DISCONNECT_POLL detik. Jika semua client yang
+#   menunggu satu request sudah pergi, task pipeline dibatalkan (panggilan upstream yang sedang
+#   berjalan ikut dihentikan, jawaban tidak disimpan) dan pembatalannya dicatat di ask_requests.
+# Catatan di Postgres bersifat fail-open: jika database bermasalah, request tetap dijalankan biasa.
+
+import os
+import time
+import uuid
+import random
+import select
+import socket
+import hashlib
+import logging
+import threading
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from db import get_db_connection
+
+ENABLED = os.getenv("ASK_DEDUP", "1") == "1"
+IDEMPOTENCY_TTL = int(os.getenv("ASK_IDEMPOTENCY_TTL", "86400"))
+RECORD_RETENTION_DAYS = int(os.getenv("ASK_RECORD_RETENTION_DAYS", "7"))
+POLL_INTERVAL = float(os.getenv("ASK_DISCONNECT_POLL", "0.25"))
+# Klaim 'running' setua ini dianggap ditinggal proses yang mati (lebih lama dari semua batas langkah pipeline)
+STALE_SECONDS = int(os.getenv("ASK_CLAIM_STALE", "120"))
+MAX_KEY_CHARS = 200
+EXCHANGE_NAMESPACE = uuid.UUID("5b0f6a4e-2d7c-4c53-9d1e-6f0a8c3b7e21")
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+class IdempotencyConflict(Exception):
+    def __init__(self):
+        super().__init__("Idempotency-Key sudah dipakai untuk request lain.")
+
+
+def request_hash(conversation_id, prompt):
+    return hashlib.sha256(f"{conversation_id}\0{prompt}".encode("utf-8")).digest()
+
+
+def client_disconnected(environ):
+    """
+    True jika client sudah menutup koneksi. Socket diintip (MSG_PEEK) tanpa mengonsumsi data: siap
+    dibaca tapi kosong berarti EOF. Hanya bisa di server yang menaruh socket di environ (gunicorn,
+    server dev Werkzeug); di tempat lain (mis. Vercel) selalu False.
+    """
+    sock = environ.get('gunicorn.socket') or environ.get('werkzeug.socket')
+    if sock is None:
+        return False
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        return bool(readable) and sock.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT) == b''
+    except (BlockingIOError, InterruptedError):
+        return False
+    except ValueError:
+        # Socket TLS tidak mendukung MSG_PEEK
+        return False
+    except OSError:
+        return True
+
+
+class RequestStore:
+    """Baris ask_requests: klaim Idempotency-Key, hasil yang bisa diputar ulang, dan catatan pembatalan."""
+
+    # Klaim baru, atau ambil alih klaim yang kedaluwarsa / dibatalkan / ditinggal proses mati
+    CLAIM_SQL = """
+        INSERT INTO ask_requests AS r (user_id, idempotency_key, conversation_id, request_hash, status)
+        VALUES (%(user_id)s, %(key)s, %(conversation_id)s, %(hash)s, 'running')
+        ON CONFLICT (user_id, idempotency_key) WHERE idempotency_key IS NOT NULL DO UPDATE SET
+            status = 'running', answer = NULL, coalesced = 0, conversation_id = EXCLUDED.conversation_id,
+            request_hash = EXCLUDED.request_hash, started_at = now(), finished_at = NULL,
+            -- created_at hanya diperbarui untuk key yang dipakai ulang setelah TTL (request baru, exchange_id
+            -- baru); pengambilalihan klaim yang dibatalkan/basi melanjutkan request yang sama
+            created_at = CASE WHEN r.created_at < now() - %(ttl)s * interval '1 second' THEN now() ELSE r.created_at END
+        WHERE r.created_at < now() - %(ttl)s * interval '1 second'
+           OR (r.request_hash = EXCLUDED.request_hash
+               AND (r.status = 'cancelled'
+                    OR (r.status = 'running' AND r.started_at < now() - %(stale)s * interval '1 second')))
+        RETURNING id, created_at
+    """
+
+    def claim(self, user_id, key, conversation_id, hash_):
+        """
+        ((id, created_at), None, None, None) jika klaim didapat, selain itu (None, status, jawaban, hash)
+        milik baris yang ada.
+        """
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(self.CLAIM_SQL, {'user_id': user_id, 'key': key, 'conversation_id': conversation_id,
+                                             'hash': hash_, 'ttl': IDEMPOTENCY_TTL, 'stale': STALE_SECONDS})
+                row = cur.fetchone()
+                if row is None:
+                    cur.execute("SELECT status, answer, request_hash FROM ask_requests WHERE user_id = %s AND idempotency_key = %s",
+                                (user_id, key))
+                    existing = cur.fetchone()
+                elif random.random() < 0.01:
+                    cur.execute("DELETE FROM ask_requests WHERE created_at < now() - %s * interval '1 day'",
+                                (RECORD_RETENTION_DAYS,))
+            conn.commit()
+        if row is not None:
+            return (row[0], row[1]), None, None, None
+        if existing is None:
+            return None, None, None, None
+        return None, existing[0], existing[1], bytes(existing[2])
+
+    def finish(self, record_id, answer, coalesced):
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("UPDATE ask_requests SET status = 'done', answer = %s, coalesced = %s, finished_at = now() WHERE id = %s",
+                            (answer, coalesced, record_id))
+            conn.commit()
+
+    def release(self, record_id):
+        """Request gagal: klaim dilepas supaya retry dengan key yang sama dijalankan ulang."""
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM ask_requests WHERE id = %s", (record_id,))
+            conn.commit()
+
+    def cancelled(self, record_id, user_id, conversation_id, hash_, coalesced, elapsed):
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                if record_id is not None:
+                    cur.execute("UPDATE ask_requests SET status = 'cancelled', coalesced = %s, finished_at = now() WHERE id = %s",
+                                (coalesced, record_id))
+                else:
+                    cur.execute(
+                        """INSERT INTO ask_requests (user_id, conversation_id, request_hash, status, coalesced, started_at, finished_at)
+                           VALUES (%s, %s, %s, 'cancelled', %s, now() - %s * interval '1 second', now())""",
+                        (user_id, conversation_id, hash_, coalesced, elapsed)
+                    )
+            conn.commit()
+
+
+def exchange_id_for(user_id, key, claim):
+    """exchange_id tetap untuk satu klaim Idempotency-Key (id baris + waktu klaim dibuat)."""
+    record_id, created_at = claim
+    return str(uuid.uuid5(EXCHANGE_NAMESPACE, f"{user_id}:{key}:{record_id}:{created_at.isoformat()}"))
+
+
+class Flight:
+    """Satu eksekusi pipeline yang ditunggu oleh satu atau lebih request."""
+
+    def __init__(self, record_id):
+        self.future = None
+        self.record_id = record_id      # baris ask_requests milik eksekusi ini (None tanpa Idempotency-Key)
+        self.waiters = 0
+        self.coalesced = 0
+        self.started = time.monotonic()
+        self.settled = False            # hasil akhir (selesai/batal) sudah dicatat
+        self.chunks = []                # potongan jawaban yang sudah diterima (untuk /ask/stream)
+        self.changed = threading.Condition()
+
+    def launch(self, start, exchange_id):
+        """start(exchange_id, on_chunk) memulai pipeline dan mengembalikan concurrent.futures.Future."""
+        self.future = start(exchange_id, self.push)
+        self.future.add_done_callback(lambda _: self._notify())
+        return self
+
+    def push(self, text):
+        # Dipanggil dari thread event loop pipeline
+        with self.changed:
+            self.chunks.append(text)
+            self.changed.notify_all()
+
+    def _notify(self):
+        with self.changed:
+            self.changed.notify_all()
+
+    def follow(self, sent):
+        """
+        Menunggu paling lama POLL_INTERVAL lalu mengembalikan (potongan baru setelah indeks `sent`, selesai).
+        `selesai` dibaca sebelum potongannya: semua push() terjadi sebelum future selesai, jadi saat
+        selesai=True tidak ada potongan yang tertinggal.
+        """
+        with self.changed:
+            if len(self.chunks) == sent and not self.future.done():
+                self.changed.wait(POLL_INTERVAL)
+            done = self.future.done()
+            return self.chunks[sent:], done
+
+
+class AskDeduplicator:
+    def __init__(self, store):
+        self.store = store
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._stats = {'started': 0, 'coalesced': 0, 'replayed': 0, 'cancelled': 0, 'disconnects': 0,
+                       'conflicts': 0, 'store_errors': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _store_call(self, fn, *args, default=None):
+        try:
+            return fn(*args)
+        except Exception as e:
+            self._count('store_errors')
+            logging.warning(f"ask_requests tidak tersedia ({fn.__name__}), lanjut tanpa catatan: {e}")
+            return default
+
+    def run(self, user_id, conversation_id, prompt, idempotency_key, start, disconnected):
+        """
+        Menjalankan atau menumpang satu giliran /ask dan mengembalikan jawabannya.
+        start(exchange_id, on_chunk) memulai pipeline dan mengembalikan concurrent.futures.Future;
+        disconnected() mengembalikan True jika client sudah pergi.
+        Melempar ClientDisconnected, IdempotencyConflict, atau error dari pipeline.
+        """
+        hash_ = request_hash(conversation_id, prompt)
+        key = (user_id, conversation_id, idempotency_key or hash_)
+        flight, answer = self._acquire(key, user_id, conversation_id, hash_, idempotency_key, start, disconnected)
+        if flight is None:
+            return answer
+        return self._wait(key, flight, user_id, conversation_id, hash_, disconnected)
+
+    def stream(self, user_id, conversation_id, prompt, idempotency_key, start, disconnected, coalesce=True):
+        """
+        Seperti run(), tapi berupa generator potongan jawaban untuk /ask/stream. Jika generator ditutup
+        (client putus saat yield) atau disconnected() bernilai True, request ini berhenti menunggu dan
+        pipeline dibatalkan jika tidak ada request lain yang menumpang. coalesce=False menjalankan
+        pipeline sendiri tanpa penggabungan dan tanpa Idempotency-Key (ASK_DEDUP=0).
+        """
+        hash_ = request_hash(conversation_id, prompt)
+        key = (user_id, conversation_id, idempotency_key or hash_) if coalesce else (user_id, conversation_id, uuid.uuid4())
+        flight, answer = self._acquire(key, user_id, conversation_id, hash_, idempotency_key if coalesce else None,
+                                       start, disconnected)
+        if flight is None:
+            yield answer
+            return
+        sent = 0
+        try:
+            while True:
+                new, done = flight.follow(sent)
+                for text in new:
+                    sent += 1
+                    yield text
+                if done:
+                    break
+                if not new and disconnected():
+                    self._leave(key, flight, user_id, conversation_id, hash_)
+                    raise ClientDisconnected()
+        except GeneratorExit:
+            self._leave(key, flight, user_id, conversation_id, hash_)
+            raise
+        if self._settle(key, flight):
+            self._record_result(flight)
+        answer = flight.future.result()
+        if sent == 0 and answer:
+            # Menumpang eksekusi /ask (tanpa streaming): jawabannya dikirim utuh
+            yield answer
+
+    def _acquire(self, key, user_id, conversation_id, hash_, idempotency_key, start, disconnected):
+        """(flight, None) untuk ditunggu, atau (None, jawaban) jika jawaban Idempotency-Key bisa diputar ulang."""
+        flight = self._join(key)
+        if flight is None:
+            record_id, exchange_id = None, None
+            if idempotency_key:
+                claim, answer, flight = self._claim(key, user_id, idempotency_key, conversation_id, hash_, disconnected)
+                if answer is not None:
+                    self._count('replayed')
+                    return None, answer
+                if claim is not None:
+                    record_id = claim[0]
+                    exchange_id = exchange_id_for(user_id, idempotency_key, claim)
+            if flight is None:
+                flight = self._join(key, lambda: Flight(record_id).launch(start, exchange_id))
+        return flight, None
+
+    def _join(self, key, create=None):
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                if create is None:
+                    return None
+                flight = self._flights[key] = create()
+                self._stats['started'] += 1
+            else:
+                flight.coalesced += 1
+                self._stats['coalesced'] += 1
+            flight.waiters += 1
+            return flight
+
+    def _claim(self, flight_key, user_id, key, conversation_id, hash_, disconnected):
+        """
+        (klaim, None, None) jika request ini yang menjalankan pipeline (klaim None jika ask_requests tidak
+        tersedia), (None, jawaban, None) untuk diputar ulang, atau (None, None, flight) jika eksekusinya
+        ternyata berjalan di proses ini.
+        """
+        while True:
+            claim, status, answer, existing_hash = self._store_call(
+                self.store.claim, user_id, key, conversation_id, hash_, default=(None, None, None, None))
+            if claim is not None or status is None:
+                return claim, None, None
+            if existing_hash != hash_:
+                self._count('conflicts')
+                raise IdempotencyConflict()
+            if status == 'done':
+                return None, answer, None
+            flight = self._join(flight_key)
+            if flight is not None:
+                return None, None, flight
+            # Masih berjalan di proses lain: tunggu sampai selesai, dibatalkan, atau dianggap basi
+            if disconnected():
+                self._count('disconnects')
+                raise ClientDisconnected()
+            time.sleep(POLL_INTERVAL)
+
+    def _settle(self, key, flight):
+        """True untuk pemanggil pertama yang mencatat hasil akhir flight."""
+        with self._lock:
+            if flight.settled:
+                return False
+            flight.settled = True
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            return True
+
+    def _record_result(self, flight):
+        if flight.record_id is None:
+            return
+        if flight.future.exception() is None:
+            self._store_call(self.store.finish, flight.record_id, flight.future.result(), flight.coalesced)
+        else:
+            self._store_call(self.store.release, flight.record_id)
+
+    def _wait(self, key, flight, user_id, conversation_id, hash_, disconnected):
+        while True:
+            try:
+                flight.future.result(timeout=POLL_INTERVAL)
+                break
+            except FutureTimeout:
+                if disconnected():
+                    self._leave(key, flight, user_id, conversation_id, hash_)
+                    raise ClientDisconnected()
+            except Exception:
+                break
+        if self._settle(key, flight):
+            self._record_result(flight)
+        return flight.future.result()
+
+    def _leave(self, key, flight, user_id, conversation_id, hash_):
+        """Client berhenti menunggu. Client terakhir yang pergi membatalkan pipeline."""
+        with self._lock:
+            self._stats['disconnects'] += 1
+            flight.waiters -= 1
+            # Diputuskan di bawah lock yang sama dengan _join, jadi tidak ada client baru yang
+            # sempat menumpang flight yang akan dibatalkan
+            if flight.waiters > 0 or flight.settled:
+                return
+            flight.settled = True
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        if not flight.future.cancel():
+            # Pipeline keburu selesai: hasilnya tetap dicatat untuk diputar ulang
+            self._record_result(flight)
+            return
+        elapsed = time.monotonic() - flight.started
+        self._count('cancelled')
+        logging.info(f"/ask {conversation_id} dibatalkan setelah {elapsed:.1f} detik: client putus")
+        self._store_call(self.store.cancelled, flight.record_id, user_id, conversation_id, hash_,
+                         flight.coalesced, elapsed)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._flights),
+                        waiting=sum(flight.waiters for flight in self._flights.values()))
+
+
+deduplicator = AskDeduplicator(RequestStore())
@@ -0,0 +1,109 @@
+# benchmarks/bench_city_extraction.py
+# Membandingkan latensi dan akurasi ekstraksi kota: gazetteer lokal vs Gemini.
+#
+#   python benchmarks/bench_city_extraction.py          # hanya jalur lokal
+#   python benchmarks/bench_city_extraction.py --llm    # + jalur Gemini (butuh GOOGLE_API_KEY)
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gazetteer
+
+# (prompt, kota yang diharapkan atau None)
+CORPUS = [
+    ("cuaca di bandung hari ini?", "Bandung"),
+    ("Bagaimana cuaca Jakarta sekarang", "Jakarta"),
+    ("cuaca jaksel siang ini", "Jakarta"),
+    ("cuaca jogja besok gimana", "Yogyakarta"),
+    ("info cuaca Surabaya dong", "Surabaya"),
+    ("cuaca di bandar lampung", "Bandar Lampung"),
+    ("cuaca di kota medan", "Medan"),
+    ("cuaca makassar sore ini", "Makassar"),
+    ("tolong cek cuaca di Denpasar", "Denpasar"),
+    ("cuaca di bali hari ini", "Denpasar"),
+    ("cuaca surakarta malam ini", "Surakarta"),
+    ("cuaca di malang", "Malang"),
+    ("cuaca di kota batu", "Batu"),
+    ("cuaca palembang", "Palembang"),
+    ("cuaca pontianak sekarang panas ga", "Pontianak"),
+    ("cuaca di banda aceh", "Banda Aceh"),
+    ("cuaca di tanjung pinang", "Tanjung Pinang"),
+    ("berapa suhu dan cuaca di Tokyo", "Tokyo"),
+    ("cuaca di kuala lumpur", "Kuala Lumpur"),
+    ("cuaca singapura hari ini", "Singapore"),
+    ("cuaca new york besok", "New York"),
+    ("cuaca di london sekarang", "London"),
+    ("cuaca di mekkah", "Mecca"),
+    ("cuaca surabya", "Surabaya"),
+    ("cuaca di yogyakrta", "Yogyakarta"),
+    ("cuaca semarng hari ini", "Semarang"),
+    ("cuaca hari ini", None),
+    ("cuaca sekarang bagaimana", None),
+    ("bagaimana cuaca besok", None),
+    ("apakah cuaca akan hujan nanti sore", None),
+    ("ramalan cuaca minggu depan", None),
+    # Kata sehari-hari yang juga nama/alias kota tidak boleh dibaca sebagai lokasi
+    ("cuaca lima hari ke depan", None),
+    ("tolong bantu cek cuaca", None),
+    ("cuaca lagi panas, kl hujan bawa payung ya", None),
+    ("smg cuaca besok cerah", None),
+    ("liburan solo enaknya pas cuaca cerah", None),
+    ("malang banget cuaca hari ini hujan terus", None),
+    ("sambal lombok cocok buat cuaca dingin", None),
+    ("batu akik cocok untuk cuaca apa", None),
+    ("cuaca panas plg kerja enaknya minum apa", None),
+]
+
+def _score(results):
+    correct = sum(1 for (_, expected), got in zip(CORPUS, results) if (got or None) == expected)
+    return correct / len(CORPUS)
+
+def _report(name, latencies, accuracy):
+    latencies = sorted(latencies)
+    p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+    print(f"{name:<10} akurasi {accuracy:6.1%}  median {statistics.median(latencies) * 1000:9.3f} ms  "
+          f"p95 {p95 * 1000:9.3f} ms")
+
+def bench_local(repeat):
+    latencies, results = [], []
+    for _ in range(repeat):
+        results = []
+        for prompt, _ in CORPUS:
+            start = time.perf_counter()
+            results.append(gazetteer.find_city(prompt))
+            latencies.append(time.perf_counter() - start)
+    _report("lokal", latencies, _score(results))
+    for (prompt, expected), got in zip(CORPUS, results):
+        if (got or None) != expected:
+            print(f"  salah: {prompt!r} -> {got!r} (harusnya {expected!r})")
+
+async def bench_llm():
+    import tools
+    latencies, results = [], []
+    for prompt, _ in CORPUS:
+        start = time.perf_counter()
+        try:
+            city = await tools.extract_city_llm(prompt)
+        except Exception as e:
+            print(f"  error Gemini: {e}")
+            city = None
+        latencies.append(time.perf_counter() - start)
+        # Gemini menjawab nama apa adanya, jadi dinormalisasi lewat gazetteer untuk perbandingan
+        results.append(gazetteer.find_city(city) if city else None)
+    _report("gemini", latencies, _score(results))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--llm", action="store_true", help="ikut ukur jalur ekstraksi lewat Gemini")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    bench_local(args.repeat)
+    if args.llm:
+        asyncio.run(bench_llm())
@@ -0,0 +1,119 @@
+# benchmarks/bench_intent_router.py
+# Membandingkan latensi routing dan tingkat salah-route: if/elif lama vs router Aho-Corasick,
+# dengan dan tanpa classifier lokal. Korpus di bawah sengaja berbeda dari data/intents.txt
+# (data latih classifier) supaya angkanya tidak bias.
+#
+#   python benchmarks/bench_intent_router.py
+#   python benchmarks/bench_intent_router.py --repeat 2000 --verbose
+
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intent_router import IntentRouter, Tool, NaiveBayesClassifier
+import tools
+
+# (prompt, route yang benar)
+CORPUS = [
+    ("cuaca di bandung hari ini?", "weather"),
+    ("Bagaimana cuaca Jakarta sekarang", "weather"),
+    ("cuacanya gimana di surabaya", "weather"),
+    ("tolong cek cuaca di Denpasar", "weather"),
+    ("ramalan cuaca jogja besok", "weather"),
+    ("prakiraan cuaca medan minggu depan", "weather"),
+    ("besok hujan ga di bogor?", "weather"),
+    ("berapa suhu di semarang sekarang", "weather"),
+    ("apakah nanti sore hujan di depok", "weather"),
+    ("lagi cerah nggak di bali", "weather"),
+    ("weather in singapore today", "weather"),
+    ("info cuaca makassar", "weather"),
+    ("siapa presiden indonesia ke-3", "search"),
+    ("Siapakah penemu telepon?", "search"),
+    ("apa itu machine learning", "search"),
+    ("Apa itu fotosintesis?", "search"),
+    ("kapan candi borobudur dibangun", "search"),
+    ("berita teknologi terbaru", "search"),
+    ("presiden prancis sekarang siapa", "search"),
+    ("apa itu cuaca ekstrem", "search"),
+    ("siapa yang menemukan vaksin polio", "search"),
+    ("kapan gerhana matahari berikutnya", "search"),
+    ("berapa harga bitcoin hari ini", "search"),
+    ("kurs euro ke rupiah sekarang", "search"),
+    ("berita cuaca ekstrem di eropa", "search"),
+    ("apa itu la nina", "search"),
+    ("siapa kamu?", "chat"),
+    ("Kamu siapa sebenarnya", "chat"),
+    ("siapa yang membuat kamu", "chat"),
+    ("halo, apa kabar?", "chat"),
+    ("buatkan fungsi python untuk membalik string", "chat"),
+    ("jelaskan perbedaan let dan const di javascript", "chat"),
+    ("tolong buatkan puisi tentang senja", "chat"),
+    ("terjemahkan 'selamat pagi' ke bahasa jepang", "chat"),
+    ("aku bosan, kasih ide kegiatan dong", "chat"),
+    ("bagaimana cara membuat api dengan flask", "chat"),
+    ("ringkas paragraf berikut ini", "chat"),
+    ("buat cerita anak tentang hujan dan pelangi", "chat"),
+    ("apakah kode ini ada bug-nya?", "chat"),
+    ("makasih banyak ya", "chat"),
+    ("tulis email izin sakit ke atasan", "chat"),
+    ("kapan-kapan kita ngobrol lagi ya", "chat"),
+]
+
+LEGACY_PREFIXES = ("siapa", "apa itu", "kapan", "presiden", "berita")
+
+
+def legacy_route(prompt):
+    """Routing lama di ask_ai: substring "cuaca" lalu startswith prefix pencarian."""
+    lower = prompt.lower()
+    if "cuaca" in lower:
+        return "weather"
+    if lower.startswith(LEGACY_PREFIXES):
+        return "search"
+    return "chat"
+
+
+def keyword_router(classifier=None):
+    router = IntentRouter(classifier=classifier)
+    for tool in tools.router.tools.values():
+        router.register(Tool(tool.name, tool.handler, keywords=tool.keywords, prefixes=tool.prefixes,
+                             priority=tool.priority))
+    return router
+
+
+def bench(name, route, repeat, verbose):
+    latencies = []
+    for _ in range(repeat):
+        for prompt, _ in CORPUS:
+            start = time.perf_counter()
+            route(prompt)
+            latencies.append(time.perf_counter() - start)
+    wrong = [(prompt, expected, route(prompt)) for prompt, expected in CORPUS if route(prompt) != expected]
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{name:<24} salah-route {len(wrong):>2}/{len(CORPUS)} ({len(wrong) / len(CORPUS):5.1%})  "
+          f"median {statistics.median(latencies) * 1e6:7.1f} µs  p95 {p95 * 1e6:7.1f} µs")
+    if verbose:
+        for prompt, expected, got in wrong:
+            print(f"    {prompt!r}: {got} (harusnya {expected})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=500)
+    parser.add_argument("--verbose", action="store_true", help="tampilkan prompt yang salah route")
+    args = parser.parse_args()
+
+    classifier = NaiveBayesClassifier.from_file(
+        os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "intents.txt"))
+    print(f"{len(CORPUS)} prompt berlabel, {args.repeat} putaran")
+    bench("if/elif lama", legacy_route, args.repeat, args.verbose)
+    bench("router kata kunci", keyword_router().route, args.repeat, args.verbose)
+    bench("router + classifier", keyword_router(classifier).route, args.repeat, args.verbose)
+
+
+if __name__ == "__main__":
+    main()
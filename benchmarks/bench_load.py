@@ -0,0 +1,454 @@
+# benchmarks/bench_load.py
+# Uji beban end-to-end tanpa layanan luar: menjalankan server tiruan (fake_upstreams.py), mengisi
+# Postgres lokal (seed_loadtest.py), menjalankan app di proses terpisah, lalu memutar skenario:
+#   login_storm    banyak klien login bersamaan (bcrypt pool, lookup user)
+#   chat_burst     user membuat chat baru lalu bertanya lewat /ask dan /ask/stream (pipeline, tool, Gemini)
+#   history_heavy  user dengan ratusan percakapan membuka /history dan percakapan panjang (paging, ETag)
+#   register       pendaftaran baru (hash bcrypt + antrian email + SMTP)
+# Hasilnya throughput dan p50/p95/p99 per route, dibandingkan dengan baseline yang disimpan.
+#
+#   python benchmarks/bench_load.py                                 # semua skenario, bandingkan dengan baseline
+#   python benchmarks/bench_load.py --scenarios chat_burst --duration 20 --concurrency 32
+#   python benchmarks/bench_load.py --save-baseline                 # simpan hasil sebagai baseline baru
+#   python benchmarks/bench_load.py --output hasil.json --tolerance 0.3
+#
+# Butuh POSTGRES_URL ke database lokal/percobaan (data @bench.local dibuat dan dihapus di sana).
+# Paket tambahan untuk server tiruan: `pip install -r requirements-dev.txt`.
+# Baseline hanya bermakna di mesin yang sama: buat ulang dengan --save-baseline saat pindah mesin.
+# Exit code 1 jika ada regresi terhadap baseline, jadi bisa dipakai di CI.
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import socket
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import httpx
+
+import migrations
+import fake_upstreams
+import seed_loadtest
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline_load.json")
+SCENARIOS = ("login_storm", "chat_burst", "history_heavy", "register")
+MIN_SAMPLES = 20
+DEFAULT_CONCURRENCY = {"login_storm": 32, "chat_burst": 16, "history_heavy": 16, "register": 8}
+CHAT_PROMPTS = (
+    "halo, apa kabar?", "jelaskan perbedaan list dan tuple di python", "buatkan fungsi python untuk membalik string",
+    "bagaimana cara membuat api dengan flask", "tolong buatkan puisi tentang senja", "jelaskan big-o notation",
+)
+WEATHER_PROMPTS = tuple(f"cuaca di {city} hari ini?" for city in
+                        ("bandung", "jakarta", "surabaya", "medan", "denpasar", "makassar", "semarang", "malang"))
+SEARCH_PROMPTS = tuple(f"siapa {topic}" for topic in
+                       ("presiden indonesia ke-3", "penemu telepon", "penemu vaksin polio", "pendiri google",
+                        "pelukis mona lisa", "penulis laskar pelangi", "juara piala dunia 2022", "ilmuwan teori relativitas"))
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}   # route -> [(latensi detik, ok)]
+
+    def add(self, route, seconds, ok):
+        with self._lock:
+            self.samples.setdefault(route, []).append((seconds, ok))
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(p * len(sorted_values)) - 1)]
+
+
+def timed(recorder, route, fn, ok=lambda r: r.status_code < 400):
+    """
+    Menjalankan satu request dan mencatat latensinya. 503 (penolakan beban yang disengaja, mis. pool
+    bcrypt penuh) dicatat terpisah sebagai "<route> (503)" dan tidak dihitung sebagai error.
+    """
+    start = time.perf_counter()
+    try:
+        response = fn()
+    except httpx.HTTPError:
+        recorder.add(route, time.perf_counter() - start, False)
+        return None
+    if response.status_code == 503:
+        recorder.add(f"{route} (503)", time.perf_counter() - start, True)
+        retry_after(response)
+        return None
+    passed = ok(response)
+    recorder.add(route, time.perf_counter() - start, passed)
+    return response if passed else None
+
+
+def retry_after(response):
+    """Klien yang ditolak menunggu sesuai Retry-After (dengan jitter) sebelum mencoba lagi."""
+    time.sleep(float(response.headers.get("retry-after", "1")) * random.uniform(0.5, 1.5))
+
+
+def new_client(base_url):
+    return httpx.Client(base_url=base_url, follow_redirects=False, timeout=120)
+
+
+def login(client, email, timeout=60):
+    """Login untuk persiapan skenario (tidak diukur); 503 dicoba ulang sesuai Retry-After."""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        response = client.post("/login", data={"email": email, "password": seed_loadtest.PASSWORD})
+        if response.status_code != 503:
+            return response.status_code == 302 and "/login" not in response.headers.get("location", "")
+        retry_after(response)
+    return False
+
+
+# --- Skenario: fungsi (ctx, recorder, worker_id, begin). Persiapan (login) dilakukan sebelum begin(),
+# yang menunggu semua klien siap lalu mengembalikan deadline; hanya bagian setelahnya yang diukur. ---
+
+def login_storm(ctx, recorder, worker_id, begin):
+    rng = random.Random(worker_id)
+    deadline = begin()
+    while time.perf_counter() < deadline:
+        email = seed_loadtest.user_email(rng.randrange(ctx.args.users))
+        with new_client(ctx.base_url) as client:
+            timed(recorder, "POST /login", lambda: client.post("/login", data={"email": email, "password": seed_loadtest.PASSWORD}),
+                  ok=lambda r: r.status_code == 302 and "/login" not in r.headers.get("location", ""))
+
+
+def chat_burst(ctx, recorder, worker_id, begin):
+    rng = random.Random(worker_id)
+    with new_client(ctx.base_url) as client:
+        if not login(client, seed_loadtest.user_email(worker_id % ctx.args.users)):
+            raise RuntimeError("login gagal untuk skenario chat_burst")
+        deadline = begin()
+        while time.perf_counter() < deadline:
+            created = timed(recorder, "POST /new_chat", lambda: client.post("/new_chat"))
+            if created is None:
+                continue
+            conversation_id = created.json()["conversation_id"]
+            for prompts in (CHAT_PROMPTS, rng.choice((WEATHER_PROMPTS, SEARCH_PROMPTS)), CHAT_PROMPTS):
+                prompt = rng.choice(prompts)
+                timed(recorder, "POST /ask", lambda: client.post("/ask", json={"prompt": prompt, "conversation_id": conversation_id}),
+                      ok=lambda r: r.status_code == 200 and bool(r.json().get("answer")))
+            start = time.perf_counter()
+            try:
+                with client.stream("POST", "/ask/stream", json={"prompt": rng.choice(CHAT_PROMPTS),
+                                                                 "conversation_id": conversation_id}) as response:
+                    first = None
+                    for chunk in response.iter_bytes():
+                        if first is None and chunk:
+                            first = time.perf_counter() - start
+                    ok = response.status_code == 200 and first is not None
+            except httpx.HTTPError:
+                first, ok = None, False
+            recorder.add("POST /ask/stream", time.perf_counter() - start, ok)
+            if first is not None:
+                recorder.add("POST /ask/stream (first byte)", first, ok)
+
+
+def history_heavy(ctx, recorder, worker_id, begin):
+    rng = random.Random(worker_id)
+    render = "&render=html" if ctx.args.render_html else ""
+    with new_client(ctx.base_url) as client:
+        if not login(client, seed_loadtest.heavy_email(worker_id % ctx.args.heavy_users)):
+            raise RuntimeError("login gagal untuk skenario history_heavy")
+        deadline = begin()
+        etag = None
+        while time.perf_counter() < deadline:
+            page = timed(recorder, "GET /history", lambda: client.get("/history"))
+            if page is None:
+                continue
+            if etag:
+                # Klien yang sudah punya salinan cukup revalidasi (304 tanpa body)
+                timed(recorder, "GET /history (If-None-Match)", lambda: client.get("/history", headers={"If-None-Match": etag}),
+                      ok=lambda r: r.status_code in (200, 304))
+            etag = page.headers.get("etag")
+            data, conversations = page.json(), page.json()["conversations"]
+            for _ in range(2):
+                if not data.get("next_cursor"):
+                    break
+                cursor = data["next_cursor"]
+                more = timed(recorder, "GET /history?cursor", lambda: client.get("/history", params={"cursor": cursor}))
+                if more is None:
+                    break
+                data = more.json()
+                conversations += data["conversations"]
+            if not conversations:
+                continue
+            # Percakapan terpanjang selalu paling atas; sisanya dipilih acak
+            conversation = conversations[0] if rng.random() < 0.5 else rng.choice(conversations)
+            messages = timed(recorder, "GET /conversation",
+                             lambda: client.get(f"/conversation/{conversation['id']}?limit=50{render}"))
+            if messages is not None and messages.json().get("next_cursor"):
+                cursor = messages.json()["next_cursor"]
+                timed(recorder, "GET /conversation?before",
+                      lambda: client.get(f"/conversation/{conversation['id']}?limit=50{render}&before={cursor}"))
+
+
+def register(ctx, recorder, worker_id, begin):
+    n = 0
+    deadline = begin()
+    while time.perf_counter() < deadline:
+        email = f"reg-{ctx.run_id}-{worker_id}-{n}@{seed_loadtest.DOMAIN}"
+        n += 1
+        with new_client(ctx.base_url) as client:
+            timed(recorder, "POST /register",
+                  lambda: client.post("/register", data={"email": email, "name": "Bench", "password": seed_loadtest.PASSWORD}),
+                  ok=lambda r: r.status_code == 302 and "verify-otp" in r.headers.get("location", ""))
+
+
+# --- Menjalankan app dan skenario ---
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def serve(port):
+    """Dijalankan di proses anak: app di server WSGI berthread werkzeug."""
+    import logging
+    from werkzeug.serving import make_server
+    os.chdir(ROOT)
+    import app as app_module
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    make_server("127.0.0.1", port, app_module.app, threaded=True).serve_forever()
+
+
+class AppProcess:
+    def __init__(self, env, log_path):
+        self.port = free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self.log = open(log_path, "w")
+        self.process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", str(self.port)],
+                                        env=env, stdout=self.log, stderr=subprocess.STDOUT)
+
+    def wait_ready(self, timeout=60):
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"app berhenti saat start (exit {self.process.returncode}), lihat {self.log.name}")
+            try:
+                if httpx.get(self.base_url + "/login", timeout=2).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"app tidak siap dalam {timeout} detik, lihat {self.log.name}")
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self.log.close()
+
+
+class Context:
+    def __init__(self, args, base_url):
+        self.args = args
+        self.base_url = base_url
+        self.run_id = datetime.now().strftime("%H%M%S")
+
+
+def run_scenario(ctx, name, concurrency, duration):
+    recorder = Recorder()
+    errors = []
+    fn = globals()[name]
+    window = {}
+
+    def release():
+        window["start"] = time.perf_counter()
+        window["deadline"] = window["start"] + duration
+
+    barrier = threading.Barrier(concurrency, action=release)
+
+    def begin():
+        barrier.wait()
+        return window["deadline"]
+
+    def worker(worker_id):
+        try:
+            fn(ctx, recorder, worker_id, begin)
+        except threading.BrokenBarrierError:
+            pass
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+            # Klien yang gagal bersiap tidak boleh membuat klien lain menunggu selamanya
+            barrier.abort()
+
+    threads = [threading.Thread(target=worker, args=(i,), name=f"{name}-{i}") for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - window.get("start", time.perf_counter())
+    for message in sorted(set(errors)):
+        print(f"  ! {name}: {message}")
+    return summarize(recorder, elapsed, concurrency)
+
+
+def summarize(recorder, elapsed, concurrency):
+    routes = {}
+    for route, samples in sorted(recorder.samples.items()):
+        latencies = sorted(s for s, _ in samples)
+        errors = sum(1 for _, ok in samples if not ok)
+        routes[route] = {
+            "count": len(samples), "errors": errors, "error_rate": round(errors / len(samples), 4),
+            "rps": round(len(samples) / elapsed, 2),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        }
+    return {"duration_s": round(elapsed, 2), "concurrency": concurrency, "routes": routes}
+
+
+def print_report(results):
+    print(f"\n{'skenario / route':<46} {'n':>6} {'err':>5} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for scenario, result in results.items():
+        print(f"{scenario} ({result['concurrency']} klien, {result['duration_s']} s)")
+        for route, r in result["routes"].items():
+            print(f"  {route:<44} {r['count']:>6} {r['errors']:>5} {r['rps']:>8.2f} "
+                  f"{r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f}")
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    """Daftar regresi: latensi p50/p95 naik, throughput turun, atau error rate naik melebihi toleransi."""
+    regressions = []
+    for scenario, result in results.items():
+        base_routes = baseline.get("results", {}).get(scenario, {}).get("routes", {})
+        for route, current in result["routes"].items():
+            base = base_routes.get(route)
+            # Persentil dari segelintir sampel terlalu berisik untuk dibandingkan
+            if base is None or min(base["count"], current["count"]) < MIN_SAMPLES:
+                continue
+            for key in ("p50_ms", "p95_ms"):
+                if current[key] > base[key] * (1 + tolerance) and current[key] - base[key] > min_delta_ms:
+                    regressions.append(f"{scenario} {route}: {key} {base[key]} -> {current[key]}")
+            if current["rps"] < base["rps"] * (1 - tolerance):
+                regressions.append(f"{scenario} {route}: req/s {base['rps']} -> {current['rps']}")
+            if current["error_rate"] > base["error_rate"] + 0.01:
+                regressions.append(f"{scenario} {route}: error rate {base['error_rate']:.2%} -> {current['error_rate']:.2%}")
+    return regressions
+
+
+def wait_for_mail(upstreams, expected, timeout=30):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if upstreams.smtp.counters.snapshot().get("delivered", 0) >= expected:
+            break
+        time.sleep(0.5)
+    return upstreams.smtp.counters.snapshot().get("delivered", 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--duration", type=float, default=15, help="detik per skenario")
+    parser.add_argument("--concurrency", type=int, help="jumlah klien untuk semua skenario (default per skenario)")
+    parser.add_argument("--render-html", action="store_true", help="history_heavy memakai ?render=html (SERVER_RENDER=1)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="tulis hasil ke --baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="kenaikan latensi/penurunan throughput yang masih wajar")
+    parser.add_argument("--min-delta-ms", type=float, default=5, help="selisih latensi minimal untuk dianggap regresi")
+    parser.add_argument("--output", help="simpan hasil lengkap (JSON)")
+    parser.add_argument("--reseed", action="store_true", help="seed ulang database walau data sudah ada")
+    parser.add_argument("--keep-data", action="store_true", help="jangan hapus user hasil skenario register")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    fake_upstreams.add_arguments(parser)
+    seed_loadtest.add_arguments(parser)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve)
+        return
+    if not os.getenv("POSTGRES_URL"):
+        parser.error("POSTGRES_URL belum di-set")
+
+    conn = migrations.connect()
+    migrations.migrate(conn, log=lambda message: print(f"migrasi: {message}"))
+    if args.reseed or not seed_loadtest.is_seeded(conn, args):
+        seed_loadtest.seed(conn, args)
+
+    upstreams = fake_upstreams.Upstreams(args)
+    env = dict(os.environ, **upstreams.env())
+    env.setdefault("SECRET_KEY", "bench-load")
+    # Semua klien datang dari 127.0.0.1: tanpa ini badai login hanya mengukur rate limiter
+    env.setdefault("RATE_LIMIT", "0")
+    if args.render_html:
+        env["SERVER_RENDER"] = "1"
+    log_path = os.path.join(tempfile.gettempdir(), "richatz-bench-load-app.log")
+    app = AppProcess(env, log_path)
+    results = {}
+    try:
+        app.wait_ready()
+        ctx = Context(args, app.base_url)
+        for name in args.scenarios:
+            concurrency = args.concurrency or DEFAULT_CONCURRENCY[name]
+            print(f"menjalankan {name}: {concurrency} klien selama {args.duration:g} detik")
+            results[name] = run_scenario(ctx, name, concurrency, args.duration)
+        if "register" in results:
+            expected = results["register"]["routes"].get("POST /register", {}).get("count", 0)
+            results["register"]["emails_delivered"] = wait_for_mail(upstreams, expected)
+    finally:
+        app.stop()
+        upstreams_stats = upstreams.stats()
+        upstreams.stop()
+        if "register" in args.scenarios and not args.keep_data:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM users WHERE email LIKE %s", (f"reg-%@{seed_loadtest.DOMAIN}",))
+                cur.execute("DELETE FROM outbound_emails WHERE recipient LIKE %s", (f"reg-%@{seed_loadtest.DOMAIN}",))
+            conn.commit()
+        conn.close()
+
+    print_report(results)
+    print(f"\npanggilan ke server tiruan: {json.dumps(upstreams_stats)}")
+    if "register" in results:
+        print(f"email terkirim ke SMTP tiruan: {results['register']['emails_delivered']}")
+
+    report = {
+        "meta": {"created_at": datetime.now(timezone.utc).isoformat(), "host": platform.node(),
+                 "python": platform.python_version(), "cpus": os.cpu_count(), "duration_s": args.duration,
+                 "seed": seed_loadtest.profile(args), "bcrypt_rounds": seed_loadtest.password_hasher.ROUNDS,
+                 "upstreams": {key: getattr(args, key) for key in ("gemini_latency", "gemini_chunks", "gemini_chunk_delay",
+                                                                   "search_latency", "weather_latency", "smtp_latency")}},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"baseline disimpan ke {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print("belum ada baseline (jalankan dengan --save-baseline)")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if any(baseline.get("meta", {}).get(key) != report["meta"][key] for key in ("seed", "bcrypt_rounds", "upstreams")):
+        print("peringatan: profil seed/bcrypt/server tiruan berbeda dari baseline, perbandingan kurang bermakna")
+    regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+    if regressions:
+        print(f"\nREGRESI terhadap baseline ({baseline['meta'].get('created_at')}):")
+        for line in regressions:
+            print(f"  - {line}")
+        sys.exit(1)
+    print(f"\ntidak ada regresi terhadap baseline ({baseline['meta'].get('created_at')}, toleransi {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
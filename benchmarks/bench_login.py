@@ -0,0 +1,77 @@
+# benchmarks/bench_login.py
+# Mengukur throughput verifikasi password (jalur login) terhadap ukuran pool bcrypt.
+# Klien paralel mensimulasikan badai login; request yang ditolak (503) ikut dihitung.
+#
+#   python benchmarks/bench_login.py                       # pool 1,2,4,8 dengan 16 klien
+#   python benchmarks/bench_login.py --rounds 10 --clients 32 --duration 5 --pools 1 2 4
+
+import os
+import sys
+import time
+import argparse
+import threading
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bcrypt
+
+from password_hasher import PasswordHasher, HasherBusy
+
+PASSWORD = "rahasia-sekali-123"
+
+
+def run(pool_size, max_pending, clients, duration, password_hash, rounds):
+    hasher = PasswordHasher(workers=pool_size, max_pending=max_pending, rounds=rounds, timeout=30)
+    latencies, rejected = [], [0]
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def client():
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            try:
+                assert hasher.verify(PASSWORD, password_hash)
+            except HasherBusy:
+                with lock:
+                    rejected[0] += 1
+                # Klien yang ditolak menunggu sebentar seperti menghormati Retry-After
+                time.sleep(0.05)
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    begin = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - begin
+
+    latencies.sort()
+    p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)] if latencies else 0
+    median = statistics.median(latencies) if latencies else 0
+    print(f"pool {pool_size:>2}  login/detik {len(latencies) / elapsed:8.2f}  "
+          f"median {median * 1000:8.1f} ms  p95 {p95 * 1000:8.1f} ms  ditolak {rejected[0]:>5}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=int(os.getenv("BCRYPT_ROUNDS", "12")))
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--pools", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--max-pending", type=int, default=None,
+                        help="batas antrian (default: 4 x ukuran pool)")
+    args = parser.parse_args()
+
+    password_hash = bcrypt.hashpw(PASSWORD.encode("utf-8"), bcrypt.gensalt(args.rounds)).decode("utf-8")
+    print(f"bcrypt cost {args.rounds}, {args.clients} klien, {args.duration:.0f} detik per pool, "
+          f"{os.cpu_count()} CPU")
+    for pool_size in args.pools:
+        run(pool_size, args.max_pending or pool_size * 4, args.clients, args.duration, password_hash, args.rounds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# benchmarks/bench_search.py
+# Mengukur latensi pencarian full-text (search.search_messages, jalur /search tanpa HTTP) untuk satu
+# user dengan riwayat sangat panjang. User dan pesannya dibuat sekali (search-000@bench.local, ikut
+# terhapus oleh `seed_loadtest.py --reset-only`), lalu setiap kata kunci dijalankan berulang kali.
+#
+#   python benchmarks/bench_search.py                        # user 100 ribu pesan, anggaran p95 50 ms
+#   python benchmarks/bench_search.py --messages 200000 --runs 50 --limit 20
+#   python benchmarks/bench_search.py --reseed
+#
+# Exit code 1 jika p95 salah satu kata kunci melebihi --budget-ms.
+
+import os
+import sys
+import time
+import random
+import argparse
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import migrations
+import seed_loadtest
+from bench_load import percentile
+from seed_loadtest import DOMAIN
+
+EMAIL = f"search-000@{DOMAIN}"
+MESSAGES_PER_CONVERSATION = 100
+# Campuran kata sangat umum, sedang, jarang, frasa, negasi, dan kata yang tidak ada sama sekali
+QUERIES = ("python", "rekursi", "ringkas teks", '"list dan tuple"', "flask -python", "toko kue", "big-o",
+           "tidakada")
+
+
+def ensure_user(conn, messages, reseed=False):
+    """Membuat user pencarian dengan `messages` pesan (sekali saja, kecuali --reseed). Mengembalikan id user."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT id FROM users WHERE email = %s", (EMAIL,))
+        row = cur.fetchone()
+        if row and not reseed:
+            cur.execute("SELECT count(*) FROM messages WHERE user_id = %s", (row[0],))
+            if cur.fetchone()[0] >= messages:
+                return row[0]
+        cur.execute("DELETE FROM users WHERE email = %s", (EMAIL,))
+        cur.execute("INSERT INTO users (email, name, password_hash, is_verified) VALUES (%s, 'Search', 'x', TRUE) RETURNING id",
+                    (EMAIL,))
+        user_id = cur.fetchone()[0]
+        started = time.perf_counter()
+        conversations, rows = seed_loadtest._conversation_rows(
+            random.Random(7), user_id, messages // MESSAGES_PER_CONVERSATION, MESSAGES_PER_CONVERSATION,
+            datetime.now(timezone.utc))
+        seed_loadtest._copy(cur, "conversations", ("id", "title", "user_id", "timestamp", "updated_at"), conversations)
+        # user_id ikut ditulis supaya COPY tidak memanggil trigger messages_fill_user_id per baris
+        by_conversation = {c[0]: c[2] for c in conversations}
+        seed_loadtest._copy(cur, "messages", ("conversation_id", "user_id", "role", "content", "token_count", "timestamp"),
+                            ((m[0], by_conversation[m[0]]) + m[1:] for m in rows))
+    conn.commit()
+    with conn.cursor() as cur:
+        cur.execute("ANALYZE messages")
+    conn.commit()
+    print(f"seed: {len(rows)} pesan dalam {time.perf_counter() - started:.1f} detik")
+    return user_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--runs", type=int, default=20, help="pengulangan per kata kunci")
+    parser.add_argument("--limit", type=int, default=50, help="hasil per halaman")
+    parser.add_argument("--budget-ms", type=float, default=50.0, help="batas p95 per kata kunci")
+    parser.add_argument("--reseed", action="store_true")
+    args = parser.parse_args()
+    if not os.getenv("POSTGRES_URL"):
+        parser.error("POSTGRES_URL belum di-set")
+
+    conn = migrations.connect()
+    try:
+        migrations.migrate(conn)
+        user_id = ensure_user(conn, args.messages, args.reseed)
+    finally:
+        conn.close()
+
+    import search
+    failures = 0
+    print(f"{'query':<20} {'hasil':>6} {'p50':>8} {'p95':>8} {'max':>8}")
+    for query in QUERIES:
+        search.search_messages(user_id, query, args.limit)  # pemanasan (cache, koneksi pool)
+        latencies = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            results, _ = search.search_messages(user_id, query, args.limit)
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        p95 = percentile(latencies, 0.95) * 1000
+        failures += p95 > args.budget_ms
+        print(f"{query:<20} {len(results):>6} {percentile(latencies, 0.5) * 1000:>6.1f}ms {p95:>6.1f}ms "
+              f"{latencies[-1] * 1000:>6.1f}ms" + ("  > anggaran" if p95 > args.budget_ms else ""))
+
+    if failures:
+        print(f"\nGAGAL: {failures} kata kunci melebihi {args.budget_ms:.0f} ms (p95).")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
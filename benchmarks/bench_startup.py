@@ -0,0 +1,96 @@
+# benchmarks/bench_startup.py
+# Mengukur biaya cold start: waktu impor app.py dan waktu sampai respons pertama untuk /login dan /ask.
+# Setiap percobaan dijalankan di proses Python baru supaya cache impor tidak ikut terhitung.
+#
+#   python benchmarks/bench_startup.py                 # /login saja, tidak butuh database
+#   python benchmarks/bench_startup.py --ask           # + /ask (butuh POSTGRES_URL; GOOGLE_API_KEY opsional)
+#   python benchmarks/bench_startup.py --ask --eager   # bandingkan dengan inisialisasi Gemini saat impor
+#
+# Tanpa GOOGLE_API_KEY yang valid, /ask tetap mengimpor dan mengonfigurasi Gemini tetapi panggilannya
+# gagal (status 500); yang diukur tetap biaya inisialisasinya.
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_EMAIL = "bench-startup@example.com"
+
+
+def child(route, eager):
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    os.environ.setdefault("SECRET_KEY", "bench-startup")
+    start = time.perf_counter()
+    import app as app_module
+    if eager:
+        # Perilaku lama: model Gemini dibuat saat modul diimpor
+        app_module.get_model()
+    imported = time.perf_counter()
+
+    client = app_module.app.test_client()
+    if route == "login":
+        status = client.get("/login").status_code
+    else:
+        with app_module.get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """INSERT INTO users (name, email, password_hash, is_verified) VALUES ('Bench', %s, '-', TRUE)
+                       ON CONFLICT (email) DO UPDATE SET is_verified = TRUE RETURNING id""",
+                    (BENCH_EMAIL,)
+                )
+                user_id = cur.fetchone()[0]
+                conversation_id = f"bench-startup-{os.getpid()}"
+                cur.execute("INSERT INTO conversations (id, user_id, title) VALUES (%s, %s, 'bench')",
+                            (conversation_id, user_id))
+            conn.commit()
+        with client.session_transaction() as session:
+            session["_user_id"] = str(user_id)
+            session["_fresh"] = True
+        status = client.post("/ask", json={"prompt": "halo", "conversation_id": conversation_id}).status_code
+        with app_module.get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM conversations WHERE id = %s", (conversation_id,))
+            conn.commit()
+    done = time.perf_counter()
+    print(json.dumps({"import": imported - start, "first_response": done - start, "status": status}))
+
+
+def measure(route, eager, runs):
+    results = []
+    for _ in range(runs):
+        cmd = [sys.executable, os.path.abspath(__file__), "--child", route] + (["--eager"] if eager else [])
+        out = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout.strip().splitlines()[-1]
+        results.append(json.loads(out))
+    label = f"/{route}" + (" (eager)" if eager else "")
+    print(f"{label:<16} impor {statistics.median(r['import'] for r in results) * 1000:8.1f} ms  "
+          f"respons pertama {statistics.median(r['first_response'] for r in results) * 1000:8.1f} ms  "
+          f"status {results[-1]['status']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--ask", action="store_true", help="ukur juga /ask (butuh database)")
+    parser.add_argument("--eager", action="store_true", help="tambahkan baris pembanding dengan Gemini di-init saat impor")
+    parser.add_argument("--child", choices=["login", "ask"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.eager)
+        return
+
+    print(f"median dari {args.runs} proses baru per baris")
+    routes = ["login"] + (["ask"] if args.ask else [])
+    for route in routes:
+        measure(route, False, args.runs)
+        if args.eager:
+            measure(route, True, args.runs)
+
+
+if __name__ == "__main__":
+    main()
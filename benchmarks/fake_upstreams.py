@@ -0,0 +1,381 @@
+# benchmarks/fake_upstreams.py
+# Server tiruan untuk semua layanan luar yang dipanggil app, supaya beban dan regresi performa bisa
+# diukur offline tanpa kuota/biaya API:
+#   Gemini          gRPC + TLS (sertifikat self-signed), GenerateContent dan StreamGenerateContent
+#   SerpAPI, cuaca  HTTP, path /search.json dan /data/2.5/weather
+#   SMTP            cukup untuk Flask-Mail tanpa TLS/AUTH (EHLO, MAIL, RCPT, DATA, QUIT)
+# Latensi tiap layanan bisa diatur (rata-rata + jitter), begitu juga jumlah dan jeda chunk streaming.
+#
+#   python benchmarks/fake_upstreams.py                        # jalankan, cetak env untuk app, Ctrl+C untuk berhenti
+#   python benchmarks/fake_upstreams.py --gemini-latency 800 --gemini-chunks 20 --gemini-chunk-delay 40
+#
+# App diarahkan ke server tiruan lewat env yang dicetak: GEMINI_API_ENDPOINT (+ GRPC_DEFAULT_SSL_ROOTS_FILE_PATH
+# agar grpc mempercayai sertifikatnya), SERPAPI_URL, WEATHER_API_URL, MAIL_SERVER/MAIL_PORT.
+# Butuh paket `cryptography` untuk membuat sertifikat TLS sementara (`pip install -r requirements-dev.txt`).
+
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import datetime
+import tempfile
+import ipaddress
+import threading
+import socketserver
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import grpc
+
+GEMINI_SERVICE = "google.ai.generativelanguage.v1beta.GenerativeService"
+
+CITY_PROMPT_MARKER = "ekstrak HANYA nama kota"
+ANSWER_PARAGRAPHS = (
+    "Berikut penjelasan singkatnya. Konsep ini sering dipakai dalam pengembangan aplikasi web modern, "
+    "terutama ketika data perlu diproses dengan cepat dan konsisten.",
+    "Langkah pertama adalah memahami kebutuhan pengguna, lalu memilih struktur data yang tepat. "
+    "Setelah itu implementasi bisa dibuat bertahap sambil diuji.",
+    "```python\ndef ringkas(teks, batas=80):\n    kata = teks.split()\n    hasil = []\n    for k in kata:\n"
+    "        if len(' '.join(hasil + [k])) > batas:\n            break\n        hasil.append(k)\n"
+    "    return ' '.join(hasil)\n```",
+    "| Opsi | Kelebihan | Kekurangan |\n|---|---|---|\n| A | cepat | boros memori |\n| B | hemat | lebih lambat |",
+    "Semoga membantu! Jika ada pertanyaan lanjutan, silakan tanyakan saja.",
+)
+
+
+class Latency:
+    """Latensi acak (milidetik): normal dengan rata-rata `mean` dan simpangan `jitter`, tidak pernah negatif."""
+
+    def __init__(self, mean_ms, jitter_ms=0.0):
+        self.mean_ms = mean_ms
+        self.jitter_ms = jitter_ms
+
+    def sleep(self):
+        delay = random.gauss(self.mean_ms, self.jitter_ms) if self.jitter_ms else self.mean_ms
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+
+class Counters:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.values = {}
+
+    def incr(self, key, n=1):
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + n
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.values)
+
+
+def make_certificate(directory):
+    """Sertifikat self-signed untuk localhost/127.0.0.1. Mengembalikan (path cert, path key)."""
+    from cryptography import x509
+    from cryptography.x509.oid import NameOID
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (x509.CertificateBuilder()
+            .subject_name(name).issuer_name(name).public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(minutes=5)).not_valid_after(now + datetime.timedelta(days=1))
+            .add_extension(x509.SubjectAlternativeName([x509.DNSName("localhost"),
+                                                        x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]), critical=False)
+            .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+            .sign(key, hashes.SHA256()))
+    cert_path, key_path = os.path.join(directory, "fake-upstreams.crt"), os.path.join(directory, "fake-upstreams.key")
+    with open(cert_path, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, "wb") as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                  serialization.NoEncryption()))
+    return cert_path, key_path
+
+
+class FakeGemini:
+    """
+    Implementasi minimal GenerativeService lewat generic handler grpc; (de)serialisasi memakai tipe
+    proto-plus dari google.ai.generativelanguage, jadi klien SDK asli tidak bisa membedakannya.
+    latency = waktu sampai respons (unary) atau sampai chunk pertama (streaming).
+    """
+
+    def __init__(self, latency, chunks=8, chunk_delay=Latency(30), answer_chars=1200, workers=64):
+        from google.ai import generativelanguage_v1beta as glm
+        self.glm = glm
+        self.latency = latency
+        self.chunks = max(1, chunks)
+        self.chunk_delay = chunk_delay
+        self.answer_chars = answer_chars
+        self.workers = workers
+        self.counters = Counters()
+        self.server = None
+        self.port = None
+
+    def _prompt(self, request):
+        parts = request.contents[-1].parts if request.contents else []
+        return " ".join(part.text for part in parts)
+
+    def _answer(self, prompt):
+        if CITY_PROMPT_MARKER in prompt:
+            return "None"
+        # Jawaban deterministik per prompt, panjangnya kira-kira answer_chars
+        rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).digest())
+        paragraphs = []
+        while sum(len(p) for p in paragraphs) < self.answer_chars:
+            paragraphs.append(rng.choice(ANSWER_PARAGRAPHS))
+        return "\n\n".join(paragraphs)
+
+    def _response(self, text, finished):
+        glm = self.glm
+        candidate = glm.Candidate(content=glm.Content(role="model", parts=[glm.Part(text=text)]), index=0,
+                                  finish_reason=glm.Candidate.FinishReason.STOP if finished else 0)
+        return glm.GenerateContentResponse(candidates=[candidate], usage_metadata=glm.GenerateContentResponse.UsageMetadata(
+            prompt_token_count=10, candidates_token_count=max(1, len(text) // 4), total_token_count=10 + len(text) // 4))
+
+    def generate(self, request, context):
+        self.counters.incr("generate")
+        self.latency.sleep()
+        return self._response(self._answer(self._prompt(request)), True)
+
+    def stream(self, request, context):
+        self.counters.incr("stream")
+        text = self._answer(self._prompt(request))
+        size = -(-len(text) // self.chunks)
+        self.latency.sleep()
+        for i in range(0, len(text), size):
+            if i:
+                self.chunk_delay.sleep()
+            yield self._response(text[i:i + size], i + size >= len(text))
+
+    def count_tokens(self, request, context):
+        self.counters.incr("count_tokens")
+        return self.glm.CountTokensResponse(total_tokens=sum(len(p.text) for c in request.contents for p in c.parts) // 4)
+
+    def start(self, cert_path, key_path, port=0):
+        glm = self.glm
+        handlers = {
+            "GenerateContent": grpc.unary_unary_rpc_method_handler(
+                self.generate, request_deserializer=glm.GenerateContentRequest.deserialize,
+                response_serializer=glm.GenerateContentResponse.serialize),
+            "StreamGenerateContent": grpc.unary_stream_rpc_method_handler(
+                self.stream, request_deserializer=glm.GenerateContentRequest.deserialize,
+                response_serializer=glm.GenerateContentResponse.serialize),
+            "CountTokens": grpc.unary_unary_rpc_method_handler(
+                self.count_tokens, request_deserializer=glm.CountTokensRequest.deserialize,
+                response_serializer=glm.CountTokensResponse.serialize),
+        }
+        self.server = grpc.server(ThreadPoolExecutor(max_workers=self.workers))
+        self.server.add_generic_rpc_handlers((grpc.method_handlers_generic_handler(GEMINI_SERVICE, handlers),))
+        with open(cert_path, "rb") as f:
+            cert = f.read()
+        with open(key_path, "rb") as f:
+            key = f.read()
+        self.port = self.server.add_secure_port(f"127.0.0.1:{port}", grpc.ssl_server_credentials([(key, cert)]))
+        self.server.start()
+        return self
+
+    def stop(self):
+        if self.server:
+            self.server.stop(grace=1)
+
+
+class FakeHttpApis:
+    """SerpAPI (/search.json) dan OpenWeatherMap (/data/2.5/weather) dalam satu server HTTP berthread."""
+
+    def __init__(self, search_latency, weather_latency):
+        self.search_latency = search_latency
+        self.weather_latency = weather_latency
+        self.counters = Counters()
+        self.server = None
+        self.port = None
+
+    def _search(self, params):
+        query = params.get("q", [""])[0]
+        self.search_latency.sleep()
+        return 200, {"search_metadata": {"status": "Success"}, "organic_results": [
+            {"position": i + 1, "title": f"Hasil {i + 1} untuk {query}", "link": f"https://example.com/{i + 1}",
+             "snippet": f"Ringkasan ke-{i + 1} tentang {query}: informasi terkini dari sumber tepercaya."}
+            for i in range(5)]}
+
+    def _weather(self, params):
+        city = params.get("q", [""])[0]
+        self.weather_latency.sleep()
+        if not city or city.lower().startswith("kota-antah"):
+            return 404, {"cod": "404", "message": "city not found"}
+        seed = int(hashlib.sha256(city.lower().encode("utf-8")).hexdigest()[:8], 16)
+        return 200, {"cod": 200, "name": city, "weather": [{"main": "Clouds", "description": "berawan"}],
+                     "main": {"temp": round(24 + seed % 90 / 10, 1), "humidity": 60 + seed % 30}}
+
+    def start(self, port=0):
+        apis = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = parse_qs(url.query)
+                if url.path.endswith("/search.json"):
+                    apis.counters.incr("search")
+                    status, body = apis._search(params)
+                elif url.path.endswith("/weather"):
+                    apis.counters.incr("weather")
+                    status, body = apis._weather(params)
+                else:
+                    status, body = 404, {"error": "not found"}
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, name="fake-http", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+class FakeSmtp:
+    """Server SMTP tanpa TLS/AUTH yang menerima dan membuang email; hanya menghitung yang diterima."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.counters = Counters()
+        self.server = None
+        self.port = None
+
+    def start(self, port=0):
+        smtp = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write(line.encode("ascii") + b"\r\n")
+
+            def handle(self):
+                self.reply("220 fake-smtp ESMTP")
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    command = line.decode("utf-8", "replace").strip().upper()
+                    if command.startswith("EHLO"):
+                        self.wfile.write(b"250-fake-smtp\r\n250-8BITMIME\r\n250 SIZE 10485760\r\n")
+                    elif command.startswith(("HELO", "MAIL", "RCPT", "RSET", "NOOP")):
+                        self.reply("250 OK")
+                    elif command == "DATA":
+                        self.reply("354 End data with <CR><LF>.<CR><LF>")
+                        while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                            pass
+                        smtp.latency.sleep()
+                        smtp.counters.incr("delivered")
+                        self.reply("250 OK queued")
+                    elif command == "QUIT":
+                        self.reply("221 Bye")
+                        return
+                    else:
+                        self.reply("502 Command not implemented")
+
+        class Server(socketserver.ThreadingTCPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        self.server = Server(("127.0.0.1", port), Handler)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, name="fake-smtp", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+class Upstreams:
+    """Menjalankan semua server tiruan sekaligus. env() = variabel environment untuk proses app."""
+
+    def __init__(self, args):
+        self.args = args
+        self.tmpdir = tempfile.mkdtemp(prefix="richatz-fakes-")
+        self.cert_path, key_path = make_certificate(self.tmpdir)
+        self.gemini = FakeGemini(Latency(args.gemini_latency, args.gemini_jitter), chunks=args.gemini_chunks,
+                                 chunk_delay=Latency(args.gemini_chunk_delay), answer_chars=args.answer_chars
+                                 ).start(self.cert_path, key_path)
+        self.http = FakeHttpApis(Latency(args.search_latency, args.search_latency / 4),
+                                 Latency(args.weather_latency, args.weather_latency / 4)).start()
+        self.smtp = FakeSmtp(Latency(args.smtp_latency)).start()
+
+    def env(self):
+        return {
+            "GOOGLE_API_KEY": "fake-gemini-key",
+            "GEMINI_API_ENDPOINT": f"localhost:{self.gemini.port}",
+            "GRPC_DEFAULT_SSL_ROOTS_FILE_PATH": self.cert_path,
+            "SERPAPI_API_KEY": "fake-serpapi-key",
+            "SERPAPI_URL": f"http://127.0.0.1:{self.http.port}/search.json",
+            "OPENWEATHERMAP_API_KEY": "fake-weather-key",
+            "WEATHER_API_URL": f"http://127.0.0.1:{self.http.port}/data/2.5/weather",
+            "MAIL_SERVER": "127.0.0.1",
+            "MAIL_PORT": str(self.smtp.port),
+            "MAIL_USE_TLS": "0",
+            "MAIL_USERNAME": "bench@bench.local",
+            "MAIL_PASSWORD": "",
+        }
+
+    def stats(self):
+        return {"gemini": self.gemini.counters.snapshot(), "http": self.http.counters.snapshot(),
+                "smtp": self.smtp.counters.snapshot()}
+
+    def stop(self):
+        self.gemini.stop()
+        self.http.stop()
+        self.smtp.stop()
+
+
+def add_arguments(parser):
+    group = parser.add_argument_group("server tiruan (milidetik)")
+    group.add_argument("--gemini-latency", type=float, default=600, help="sampai respons/chunk pertama")
+    group.add_argument("--gemini-jitter", type=float, default=150)
+    group.add_argument("--gemini-chunks", type=int, default=8, help="jumlah chunk StreamGenerateContent")
+    group.add_argument("--gemini-chunk-delay", type=float, default=40)
+    group.add_argument("--answer-chars", type=int, default=1200, help="panjang jawaban tiruan")
+    group.add_argument("--search-latency", type=float, default=400)
+    group.add_argument("--weather-latency", type=float, default=150)
+    group.add_argument("--smtp-latency", type=float, default=200)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    add_arguments(parser)
+    upstreams = Upstreams(parser.parse_args())
+    for key, value in upstreams.env().items():
+        print(f"{key}={value}")
+    sys.stdout.flush()
+    try:
+        while True:
+            time.sleep(5)
+    except KeyboardInterrupt:
+        print(json.dumps(upstreams.stats()), file=sys.stderr)
+    finally:
+        upstreams.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+# benchmarks/seed_loadtest.py
+# Mengisi Postgres lokal dengan data uji beban: user biasa dengan beberapa percakapan pendek, dan
+# user "berat" dengan ratusan percakapan dan percakapan sangat panjang (untuk /history dan
+# /conversation). Semua user memakai domain @bench.local sehingga bisa dihapus tanpa menyentuh data lain.
+#
+#   python benchmarks/seed_loadtest.py                      # profil default
+#   python benchmarks/seed_loadtest.py --users 2000 --heavy-users 50 --reset
+#   python benchmarks/seed_loadtest.py --reset-only         # hapus semua data @bench.local
+#
+# Pesan dimuat lewat COPY (format CSV), jadi ratusan ribu baris cukup beberapa detik.
+
+import io
+import os
+import sys
+import csv
+import time
+import uuid
+import random
+import argparse
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bcrypt
+
+import migrations
+import password_hasher
+from fake_upstreams import ANSWER_PARAGRAPHS
+
+DOMAIN = "bench.local"
+PASSWORD = "bench-password-123"
+PROMPTS = (
+    "halo, apa kabar?", "jelaskan perbedaan list dan tuple di python", "buatkan fungsi untuk membalik string",
+    "apa itu rekursi?", "bagaimana cara membuat api dengan flask", "ringkas paragraf berikut ini",
+    "tolong perbaiki bug di kode ini", "kasih ide nama untuk toko kue", "terjemahkan kalimat ini ke bahasa inggris",
+    "bedanya sql dan nosql apa?", "jelaskan big-o notation dengan contoh", "tulis email izin sakit ke atasan",
+)
+
+
+def user_email(index):
+    return f"load-{index:05d}@{DOMAIN}"
+
+
+def heavy_email(index):
+    return f"heavy-{index:03d}@{DOMAIN}"
+
+
+def add_arguments(parser):
+    group = parser.add_argument_group("data seed")
+    group.add_argument("--users", type=int, default=300, help="user biasa")
+    group.add_argument("--conversations", type=int, default=5, help="percakapan per user biasa")
+    group.add_argument("--messages", type=int, default=12, help="pesan per percakapan user biasa")
+    group.add_argument("--heavy-users", type=int, default=10)
+    group.add_argument("--heavy-conversations", type=int, default=300, help="percakapan per user berat")
+    group.add_argument("--heavy-messages", type=int, default=40, help="pesan per percakapan user berat")
+    group.add_argument("--long-messages", type=int, default=1000, help="pesan di satu percakapan terpanjang tiap user berat")
+
+
+def profile(args):
+    return {key: getattr(args, key) for key in ("users", "conversations", "messages", "heavy_users",
+                                                "heavy_conversations", "heavy_messages", "long_messages")}
+
+
+def reset(conn):
+    with conn.cursor() as cur:
+        # conversations dan messages ikut terhapus lewat ON DELETE CASCADE
+        cur.execute("DELETE FROM users WHERE email LIKE %s", (f"%@{DOMAIN}",))
+        deleted = cur.rowcount
+        cur.execute("DELETE FROM outbound_emails WHERE recipient LIKE %s", (f"%@{DOMAIN}",))
+    conn.commit()
+    return deleted
+
+
+def is_seeded(conn, args):
+    with conn.cursor() as cur:
+        cur.execute("SELECT count(*) FROM users WHERE email LIKE %s", (f"%@{DOMAIN}",))
+        users = cur.fetchone()[0]
+        cur.execute("SELECT password_hash FROM users WHERE email = %s", (user_email(0),))
+        row = cur.fetchone()
+    # Hash dengan cost berbeda akan di-rehash saat login dan mengacaukan angka badai login
+    return users >= args.users + args.heavy_users and row is not None and not password_hasher.hasher.needs_rehash(row[0])
+
+
+def _conversation_rows(rng, user_id, count, messages_per_conversation, now):
+    conversations, messages = [], []
+    for n in range(count):
+        conversation_id = str(uuid.uuid4())
+        started = now - timedelta(days=rng.uniform(0, 180))
+        n_messages = messages_per_conversation if n else max(messages_per_conversation, 2)
+        conversations.append((conversation_id, rng.choice(PROMPTS)[:40], user_id, started,
+                              started + timedelta(minutes=n_messages)))
+        for i in range(n_messages):
+            if i % 2 == 0:
+                role, content = "user", rng.choice(PROMPTS)
+            else:
+                role, content = "assistant", "\n\n".join(rng.sample(ANSWER_PARAGRAPHS, rng.randint(1, 4)))
+            messages.append((conversation_id, role, content, len(content) // 4 + 4, started + timedelta(minutes=i)))
+    return conversations, messages
+
+
+def _copy(cur, table, columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(["" if value is None else value.isoformat() if isinstance(value, datetime) else value
+                         for value in row])
+    buffer.seek(0)
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def seed(conn, args, log=print):
+    """Membuat ulang semua data @bench.local sesuai profil `args`."""
+    started = time.perf_counter()
+    rng = random.Random(42)
+    reset(conn)
+    # Satu hash untuk semua user (password sama), dengan cost yang sama dengan app supaya tidak di-rehash
+    password_hash = bcrypt.hashpw(PASSWORD.encode("utf-8"), bcrypt.gensalt(password_hasher.ROUNDS)).decode("utf-8")
+    now = datetime.now(timezone.utc)
+
+    with conn.cursor() as cur:
+        emails = [(user_email(i), f"Load {i}") for i in range(args.users)]
+        emails += [(heavy_email(i), f"Heavy {i}") for i in range(args.heavy_users)]
+        _copy(cur, "users", ("email", "name", "password_hash", "is_verified"),
+              ((email, name, password_hash, "t") for email, name in emails))
+        cur.execute("SELECT id, email FROM users WHERE email LIKE %s", (f"%@{DOMAIN}",))
+        ids = dict((email, user_id) for user_id, email in cur.fetchall())
+
+        conversations, messages = [], []
+        for i in range(args.users):
+            c, m = _conversation_rows(rng, ids[user_email(i)], args.conversations, args.messages, now)
+            conversations += c
+            messages += m
+        for i in range(args.heavy_users):
+            c, m = _conversation_rows(rng, ids[heavy_email(i)], args.heavy_conversations, args.heavy_messages, now)
+            conversations += c
+            messages += m
+            # Satu percakapan sangat panjang per user berat, paling baru supaya muncul di halaman pertama
+            c, m = _conversation_rows(rng, ids[heavy_email(i)], 1, args.long_messages, now + timedelta(minutes=1))
+            conversations += c
+            messages += m
+        _copy(cur, "conversations", ("id", "title", "user_id", "timestamp", "updated_at"), conversations)
+        _copy(cur, "messages", ("conversation_id", "role", "content", "token_count", "timestamp"), messages)
+    conn.commit()
+    with conn.cursor() as cur:
+        cur.execute("ANALYZE users; ANALYZE conversations; ANALYZE messages")
+    conn.commit()
+    log(f"seed: {len(emails)} user, {len(conversations)} percakapan, {len(messages)} pesan "
+        f"dalam {time.perf_counter() - started:.1f} detik")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    add_arguments(parser)
+    parser.add_argument("--reset", action="store_true", help="seed ulang walau data sudah ada")
+    parser.add_argument("--reset-only", action="store_true", help="hapus data @bench.local lalu keluar")
+    args = parser.parse_args()
+
+    conn = migrations.connect()
+    try:
+        migrations.migrate(conn)
+        if args.reset_only:
+            print(f"{reset(conn)} user @{DOMAIN} dihapus")
+        elif args.reset or not is_seeded(conn, args):
+            seed(conn, args)
+        else:
+            print("data seed sudah ada (pakai --reset untuk membuat ulang)")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+# chat_store.py
+# Query baca/tulis untuk tabel conversations dan messages yang dipakai oleh /ask.
+#
+# Setiap giliran /ask hanya butuh dua round-trip ke database: satu query untuk cek kepemilikan +
+# ringkasan + jendela history, dan satu statement untuk menyimpan pertanyaan, jawaban, judul, dan
+# updated_at sekaligus. Dengan WRITE_BEHIND=1 statement kedua dikumpulkan dalam batch (write_behind.py).
+
+import uuid
+import logging
+import threading
+
+from psycopg2.extras import execute_values
+
+from db import get_db_connection
+import context_builder
+import write_behind
+import archive
+import tracing
+
+# Kepemilikan dicek di WHERE: percakapan milik user lain sama dengan tidak ada (0 baris).
+# LEFT JOIN LATERAL tetap menghasilkan satu baris untuk percakapan yang belum punya pesan.
+# Kolom kelima menandai percakapan yang pesannya sedang di arsip (archive.py); exchange_id dipakai untuk
+# melewati exchange write-behind yang ternyata sudah ter-commit.
+HISTORY_SQL = """
+    SELECT s.summary, m.role, m.content, m.token_count, c.archived_at IS NOT NULL, m.exchange_id
+    FROM conversations c
+    LEFT JOIN conversation_summaries s ON s.conversation_id = c.id
+    LEFT JOIN LATERAL (
+        SELECT id, role, content, COALESCE(token_count, length(content) / 4 + %(overhead)s) AS token_count, exchange_id
+        FROM messages
+        WHERE conversation_id = c.id AND id > COALESCE(s.summarized_until, 0)
+        ORDER BY id DESC LIMIT %(limit)s
+    ) m ON TRUE
+    WHERE c.id = %(conversation_id)s AND c.user_id = %(user_id)s
+    ORDER BY m.id DESC
+"""
+
+# Pesan disisipkan lewat CTE yang tidak direferensikan (tetap dieksekusi oleh Postgres), lalu judul
+# dan updated_at diperbarui di statement yang sama. JOIN ke conversations melewati percakapan yang
+# sudah dihapus sebelum batch write-behind sempat di-flush, sekaligus mengisi messages.user_id
+# (tanpa perlu trigger messages_fill_user_id). Jawaban lengkap menghapus jawaban parsial dari exchange yang
+# sama (kolom replaces, lihat partial_exchange_id) di statement yang sama.
+SAVE_SQL = """
+    WITH v (ord, exchange_id, conversation_id, role, content, token_count, title, replaces) AS (VALUES %s),
+    removed AS (
+        DELETE FROM messages m USING v
+        WHERE m.exchange_id = v.replaces AND m.conversation_id = v.conversation_id
+    ),
+    inserted AS (
+        INSERT INTO messages (conversation_id, user_id, role, content, token_count, exchange_id)
+        SELECT v.conversation_id, c.user_id, v.role, v.content, v.token_count, v.exchange_id
+        FROM v JOIN conversations c ON c.id = v.conversation_id
+        ORDER BY v.ord
+        ON CONFLICT (exchange_id, role) WHERE exchange_id IS NOT NULL DO NOTHING
+    )
+    UPDATE conversations c
+    SET title = COALESCE(t.title, c.title), updated_at = now()
+    FROM (SELECT conversation_id, max(title) AS title FROM v GROUP BY conversation_id) t
+    WHERE c.id = t.conversation_id
+"""
+SAVE_TEMPLATE = "(%s, %s::uuid, %s, %s, %s, %s, %s, %s::uuid)"
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = write_behind.WriteBehindBuffer(save_exchanges)
+    return _buffer
+
+@tracing.traced('db.history')
+def load_chat_history(conversation_id, user_id):
+    """Mengambil history percakapan sesuai anggaran token. Mengembalikan None jika percakapan bukan milik user."""
+    params = {
+        'overhead': context_builder.MESSAGE_OVERHEAD_TOKENS, 'limit': context_builder.MAX_MESSAGES,
+        'conversation_id': conversation_id, 'user_id': user_id,
+    }
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(HISTORY_SQL, params)
+            rows = cur.fetchall()
+            if rows and rows[0][4]:
+                # Pesan masih di arsip: kembalikan ke tabel messages, lalu baca ulang
+                archive.restore(conn, conversation_id)
+                cur.execute(HISTORY_SQL, params)
+                rows = cur.fetchall()
+    if not rows:
+        return None
+    messages = [(role, content, token_count) for _, role, content, token_count, _, _ in rows if role is not None]
+    if write_behind.ENABLED:
+        # Exchange yang masih di buffer belum ada di database tapi harus ikut jadi konteks; batch yang sedang
+        # di-flush bisa saja sudah ter-commit dan terbaca di atas
+        stored = {str(row[5]) for row in rows if row[5] is not None}
+        pending = get_buffer().pending_for(conversation_id)
+        replaced = {exchange.get('replaces') for exchange in pending} - {None}
+        if replaced & stored:
+            # Jawaban parsial yang sudah tersimpan akan dihapus oleh jawaban lengkap yang masih di buffer
+            messages = [(role, content, token_count) for _, role, content, token_count, _, exchange_id in rows
+                        if role is not None and str(exchange_id) not in replaced]
+        for exchange in pending:
+            if exchange['exchange_id'] in stored:
+                continue
+            messages[:0] = [
+                ('assistant', exchange['answer'], context_builder.estimate_tokens(exchange['answer'])),
+                ('user', exchange['prompt'], context_builder.estimate_tokens(exchange['prompt'])),
+            ]
+    return context_builder.build_context(rows[0][0], messages)
+
+@tracing.traced('db.save')
+def save_exchanges(exchanges):
+    """Menyimpan banyak exchange (pertanyaan + jawaban) dalam satu statement. Aman diulang: exchange_id unik."""
+    values = []
+    # DELETE dan INSERT di SAVE_SQL melihat snapshot yang sama, jadi jawaban parsial yang digantikan exchange
+    # lain di batch yang sama (write-behind) tidak ikut disisipkan
+    replaced = {exchange.get('replaces') for exchange in exchanges}
+    for exchange in exchanges:
+        if exchange['exchange_id'] in replaced:
+            continue
+        title = exchange['prompt'][:50] if exchange['set_title'] else None
+        for role, content in (('user', exchange['prompt']), ('assistant', exchange['answer'])):
+            values.append((len(values), exchange['exchange_id'], exchange['conversation_id'], role, content,
+                           context_builder.estimate_tokens(content), title if role == 'user' else None,
+                           exchange.get('replaces')))
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            execute_values(cur, SAVE_SQL, values, template=SAVE_TEMPLATE, page_size=len(values))
+        conn.commit()
+
+def partial_exchange_id(exchange_id):
+    """exchange_id untuk jawaban yang terpotong karena dibatalkan; diturunkan dari exchange_id jawaban lengkapnya."""
+    return str(uuid.uuid5(uuid.UUID(exchange_id), "partial"))
+
+def save_exchange(conversation_id, user_prompt_original, ai_answer, set_title, exchange_id=None, partial=False):
+    """
+    exchange_id tetap (mis. dari Idempotency-Key) membuat penyimpanan ulang exchange yang sama jadi no-op.
+    partial=True menyimpan jawaban terpotong di bawah partial_exchange_id(exchange_id); jawaban lengkap
+    dengan exchange_id yang sama (retry) menggantikannya, jadi exchange tidak tersimpan dua kali.
+    """
+    replaces = None
+    if exchange_id and partial:
+        exchange_id = partial_exchange_id(exchange_id)
+    elif exchange_id:
+        replaces = partial_exchange_id(exchange_id)
+    exchange = {
+        'exchange_id': exchange_id or str(uuid.uuid4()),
+        'conversation_id': conversation_id,
+        'prompt': user_prompt_original,
+        'answer': ai_answer,
+        'set_title': set_title,
+        'replaces': replaces,
+    }
+    if write_behind.ENABLED:
+        try:
+            get_buffer().append(exchange)
+            return
+        except Exception as e:
+            logging.error(f"Write-behind tidak tersedia, menyimpan langsung: {e}")
+    try:
+        save_exchanges([exchange])
+    except Exception as e:
+        logging.error(f"Failed to save message: {e}")
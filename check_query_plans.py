@@ -0,0 +1,129 @@
+# check_query_plans.py
+# Memastikan query route di app.py memakai index, bukan sequential scan, pada dataset besar.
+#
+#   python check_query_plans.py --seed     # isi data sintetis (user bench*@example.com) lalu cek
+#   python check_query_plans.py            # cek saja, pakai data yang sudah ada
+#
+# Keluar dengan kode 1 jika ada query yang jatuh ke Seq Scan pada tabel yang dicek.
+
+import sys
+import argparse
+
+from migrations import connect, migrate
+import chat_store
+import search
+import archive
+
+CHECKED_TABLES = {"users", "conversations", "messages"}
+
+# Salinan query dari app.py / chat_store.py (placeholder bernama supaya mudah diisi contoh parameter).
+# Perbarui daftar ini setiap kali query route berubah.
+ROUTE_QUERIES = {
+    "load_user": "SELECT id, email, name FROM users WHERE id = %(user_id)s",
+    "login": "SELECT * FROM users WHERE email = %(email)s",
+    "history etag": "SELECT count(*) AS total, greatest(max(updated_at), (SELECT max(deleted_at) FROM conversation_tombstones WHERE user_id = %(user_id)s)) AS synced_at FROM conversations WHERE user_id = %(user_id)s",
+    "history": "SELECT id, title, timestamp, updated_at FROM conversations WHERE user_id = %(user_id)s ORDER BY timestamp DESC, id DESC LIMIT 51",
+    "history cursor": "SELECT id, title, timestamp, updated_at FROM conversations WHERE user_id = %(user_id)s AND (timestamp, id) < (%(timestamp)s, %(conversation_id)s) ORDER BY timestamp DESC, id DESC LIMIT 51",
+    "history since": "SELECT id, title, timestamp, updated_at FROM conversations WHERE user_id = %(user_id)s AND updated_at > %(timestamp)s ORDER BY updated_at DESC LIMIT 51",
+    "history deleted": "SELECT conversation_id FROM conversation_tombstones WHERE user_id = %(user_id)s AND deleted_at > %(timestamp)s LIMIT 51",
+    "conversation owner": "SELECT user_id, updated_at, archived_at FROM conversations WHERE id = %(conversation_id)s",
+    "conversation messages": "SELECT id, role, content FROM messages WHERE conversation_id = %(conversation_id)s AND role IN ('user', 'assistant') ORDER BY id DESC LIMIT 51",
+    "conversation older": "SELECT id, role, content FROM messages WHERE conversation_id = %(conversation_id)s AND role IN ('user', 'assistant') AND id < %(message_id)s ORDER BY id DESC LIMIT 51",
+    "ask history": chat_store.HISTORY_SQL.replace("%(overhead)s", "4").replace("%(limit)s", "40"),
+    "search recent": search.RECENT_SQL,
+    "search matches": search.MATCHES_SQL,
+    "search archived": search.ARCHIVED_COUNT_SQL,
+    "archive candidates": archive.CANDIDATES_SQL,
+    "delete conversation": "WITH deleted AS (DELETE FROM conversations WHERE id = %(conversation_id)s AND user_id = %(user_id)s RETURNING id) INSERT INTO conversation_tombstones (conversation_id, user_id) SELECT id, %(user_id)s FROM deleted ON CONFLICT (conversation_id) DO UPDATE SET deleted_at = now()",
+}
+
+SEED_SQL = """
+INSERT INTO users (email, password_hash, name, is_verified)
+SELECT 'bench' || g || '@example.com', 'x', 'Bench ' || g, TRUE
+FROM generate_series(1, %(users)s) g
+ON CONFLICT (email) DO NOTHING;
+
+INSERT INTO conversations (id, title, user_id, timestamp, updated_at)
+SELECT md5(u.id || '-' || c), 'Bench conversation ' || c, u.id,
+       now() - c * interval '1 hour', now() - c * interval '1 hour'
+FROM users u, generate_series(1, %(conversations)s) c
+WHERE u.email LIKE 'bench%%@example.com'
+ON CONFLICT (id) DO NOTHING;
+
+INSERT INTO messages (conversation_id, role, content, timestamp)
+SELECT c.id, CASE WHEN m %% 2 = 1 THEN 'user' ELSE 'assistant' END,
+       repeat('lorem ipsum dolor sit amet ', 8), c.timestamp + m * interval '1 second'
+FROM conversations c
+JOIN users u ON u.id = c.user_id AND u.email LIKE 'bench%%@example.com'
+CROSS JOIN generate_series(1, %(messages)s) m
+WHERE NOT EXISTS (SELECT 1 FROM messages WHERE conversation_id = c.id);
+
+ANALYZE users;
+ANALYZE conversations;
+ANALYZE messages;
+"""
+
+def seq_scans(plan):
+    """Semua tabel yang dibaca dengan Seq Scan di dalam pohon plan EXPLAIN (FORMAT JSON)."""
+    found = []
+    if plan.get("Node Type") == "Seq Scan" and plan.get("Relation Name") in CHECKED_TABLES:
+        found.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        found.extend(seq_scans(child))
+    return found
+
+def sample_params(cur):
+    cur.execute("""
+        SELECT c.user_id, u.email, c.id, c.timestamp
+        FROM conversations c JOIN users u ON u.id = c.user_id
+        ORDER BY c.user_id DESC, c.timestamp DESC LIMIT 1
+    """)
+    row = cur.fetchone()
+    if row is None:
+        raise SystemExit("Database kosong; jalankan dengan --seed terlebih dahulu.")
+    user_id, email, conversation_id, timestamp = row
+    cur.execute("SELECT max(id) FROM messages WHERE conversation_id = %s", (conversation_id,))
+    message_id = cur.fetchone()[0] or 0
+    return {"user_id": user_id, "email": email, "conversation_id": conversation_id,
+            "timestamp": timestamp, "message_id": message_id, "query": "lorem", "upper": message_id,
+            "scan": search.SEARCH_RECENT_ROWS, "window": search.SEARCH_WINDOW,
+            "idle_days": archive.IDLE_DAYS, "limit": archive.BATCH_SIZE}
+
+def check(conn):
+    failures = 0
+    with conn.cursor() as cur:
+        params = sample_params(cur)
+        for route, query in ROUTE_QUERIES.items():
+            cur.execute("EXPLAIN (FORMAT JSON) " + query, params)
+            plan = cur.fetchone()[0][0]["Plan"]
+            scans = seq_scans(plan)
+            status = "SEQ SCAN pada " + ", ".join(scans) if scans else "ok"
+            print(f"{route:<24} {plan['Node Type']:<20} {status}")
+            failures += bool(scans)
+    conn.rollback()
+    return failures
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seed", action="store_true", help="isi data sintetis sebelum pengecekan")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--conversations", type=int, default=20, help="per user")
+    parser.add_argument("--messages", type=int, default=10, help="per percakapan")
+    args = parser.parse_args()
+
+    conn = connect()
+    try:
+        migrate(conn)
+        if args.seed:
+            print("Mengisi data sintetis...")
+            with conn.cursor() as cur:
+                cur.execute(SEED_SQL, {"users": args.users, "conversations": args.conversations, "messages": args.messages})
+            conn.commit()
+        failures = check(conn)
+    finally:
+        conn.close()
+
+    if failures:
+        print(f"\nGAGAL: {failures} query masih memakai sequential scan.")
+        sys.exit(1)
+    print("\nSemua query route memakai index.")
@@ -0,0 +1,119 @@
+# context_builder.py
+# Memilih history percakapan untuk Gemini berdasarkan anggaran token, bukan jumlah baris.
+#
+# Jumlah token tiap pesan dihitung sekali saat disimpan (kolom messages.token_count), jadi
+# memilih jendela history tidak perlu menghitung ulang teks panjang di setiap giliran.
+# Opsional (CONTEXT_SUMMARY=1): giliran lama yang sudah keluar dari jendela diringkas menjadi
+# satu "rolling summary" per percakapan (tabel conversation_summaries) agar ukuran prompt tetap
+# terbatas pada percakapan panjang tanpa kehilangan konteks awal.
+
+import os
+from db import get_db_connection
+
+TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+# Batas atas baris yang dibaca per giliran, supaya query tetap kecil walau pesannya pendek-pendek
+MAX_MESSAGES = int(os.getenv("CONTEXT_MAX_MESSAGES", "40"))
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_ENABLED = os.getenv("CONTEXT_SUMMARY", "0") == "1"
+# Pesan terbaru yang tidak pernah diringkas (selalu dikirim utuh)
+SUMMARY_KEEP_MESSAGES = int(os.getenv("CONTEXT_SUMMARY_KEEP", "8"))
+# Ringkasan baru dibuat jika pesan lama yang belum diringkas sudah sebesar ini
+SUMMARY_MIN_TOKENS = int(os.getenv("CONTEXT_SUMMARY_MIN_TOKENS", "1500"))
+
+SUMMARY_INTRO = "Ringkasan percakapan kita sebelumnya (untuk konteks):\n"
+SUMMARY_ACK = "Baik, saya akan mengingat ringkasan tersebut."
+
+def estimate_tokens(text):
+    """Perkiraan jumlah token (~4 karakter per token), cukup akurat untuk anggaran dan jauh lebih murah dari count_tokens."""
+    return len(text) // 4 + MESSAGE_OVERHEAD_TOKENS
+
+def _truncate(content, budget):
+    # Pesan tunggal yang melebihi anggaran (misalnya kode panjang yang ditempel) dipotong di tengah,
+    # awal dan akhirnya tetap dikirim
+    keep_chars = max(budget - MESSAGE_OVERHEAD_TOKENS, 0) * 4
+    half = keep_chars // 2
+    return content[:half] + "\n...[dipotong]...\n" + content[-half:] if half else ""
+
+def select_window(rows, budget=None):
+    """
+    rows: [(role, content, token_count)] dari yang terbaru ke yang terlama.
+    Mengembalikan [(role, content)] urut kronologis yang muat di dalam anggaran.
+    """
+    budget = TOKEN_BUDGET if budget is None else budget
+    selected = []
+    used = 0
+    for role, content, token_count in rows:
+        if used + token_count > budget:
+            # Giliran terakhir (pertanyaan + jawaban) selalu ikut, dipotong jika perlu;
+            # pesan pertama yang kebesaran hanya boleh memakai separuh anggaran
+            if len(selected) < 2:
+                allowed = budget - used if selected else budget // 2
+                truncated = _truncate(content, allowed)
+                if truncated:
+                    selected.append((role, truncated))
+                    used += allowed
+                    continue
+            break
+        selected.append((role, content))
+        used += token_count
+    selected.reverse()
+    # Setelah briefing (giliran 'model'), history harus dimulai dari giliran user
+    while selected and selected[0][0] != 'user':
+        selected.pop(0)
+    return selected
+
+def build_context(summary, rows):
+    """
+    Jendela history (+ ringkasan jika ada) untuk satu percakapan.
+    rows: [(role, content, token_count)] dari yang terbaru, hanya pesan setelah ringkasan.
+    """
+    budget = TOKEN_BUDGET
+    history = []
+    if summary:
+        budget -= estimate_tokens(summary) + estimate_tokens(SUMMARY_ACK)
+        history = [('user', SUMMARY_INTRO + summary), ('assistant', SUMMARY_ACK)]
+    return history + select_window(rows, max(budget, 0))
+
+def pending_summary_input(conversation_id):
+    """
+    Pesan lama yang perlu dimasukkan ke ringkasan, atau None jika belum perlu.
+    Mengembalikan (ringkasan_lama, [(role, content)], id_pesan_terakhir).
+    """
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT summary, summarized_until FROM conversation_summaries WHERE conversation_id = %s", (conversation_id,))
+            summary_row = cur.fetchone()
+            previous_summary, summarized_until = summary_row if summary_row else ("", 0)
+            cur.execute(
+                """SELECT id, role, content, COALESCE(token_count, length(content) / 4 + %s)
+                   FROM messages WHERE conversation_id = %s AND id > %s ORDER BY id DESC OFFSET %s""",
+                (MESSAGE_OVERHEAD_TOKENS, conversation_id, summarized_until, SUMMARY_KEEP_MESSAGES)
+            )
+            rows = cur.fetchall()
+    if not rows or sum(row[3] for row in rows) < SUMMARY_MIN_TOKENS:
+        return None
+    rows.reverse()
+    return previous_summary, [(role, content) for _, role, content, _ in rows], rows[-1][0]
+
+def summary_prompt(previous_summary, messages):
+    transcript = "\n".join(f"{'User' if role == 'user' else 'AI'}: {content}" for role, content in messages)
+    return (
+        "Perbarui ringkasan percakapan berikut secara singkat (maksimal 200 kata) dalam Bahasa Indonesia. "
+        "Pertahankan fakta, keputusan, nama, dan potongan kode penting.\n\n"
+        f"Ringkasan sebelumnya:\n{previous_summary or '(belum ada)'}\n\nPercakapan baru:\n{transcript}"
+    )
+
+def store_summary(conversation_id, summary, summarized_until):
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            # Jangan menimpa ringkasan yang lebih baru dari proses lain
+            cur.execute(
+                """INSERT INTO conversation_summaries (conversation_id, summary, summarized_until, updated_at)
+                   VALUES (%s, %s, %s, now())
+                   ON CONFLICT (conversation_id) DO UPDATE
+                   SET summary = EXCLUDED.summary, summarized_until = EXCLUDED.summarized_until, updated_at = now()
+                   WHERE conversation_summaries.summarized_until < EXCLUDED.summarized_until""",
+                (conversation_id, summary, summarized_until)
+            )
+        conn.commit()
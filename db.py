@@ -0,0 +1,250 @@
+# db.py
+# Lapisan akses database dengan connection pool.
+# Menggantikan pola "buka koneksi TLS baru di setiap query" di app.py.
+
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extras
+import psycopg2.extensions
+
+import tracing
+
+_OPERATIONS = {"select", "insert", "update", "delete", "with"}
+
+
+def _operation(query):
+    if isinstance(query, bytes):
+        query = query[:16].decode("utf-8", "replace")
+    words = query.lstrip(" \t\n(").split(None, 1)
+    op = words[0].lower() if words else ""
+    return op if op in _OPERATIONS else "other"
+
+
+class _TracedExecute:
+    # Setiap query tercatat sebagai span db.<operasi>, tanpa teks SQL supaya label tetap sedikit
+    def execute(self, query, vars=None):
+        with tracing.span(f"db.{_operation(query)}"):
+            return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        with tracing.span(f"db.{_operation(query)}"):
+            return super().executemany(query, vars_list)
+
+
+class TracingCursor(_TracedExecute, psycopg2.extensions.cursor):
+    pass
+
+
+class TracingRealDictCursor(_TracedExecute, psycopg2.extras.RealDictCursor):
+    pass
+
+
+_TRACED_CURSORS = {None: TracingCursor, psycopg2.extras.RealDictCursor: TracingRealDictCursor}
+
+
+class TracingConnection(psycopg2.extensions.connection):
+    def cursor(self, *args, cursor_factory=None, **kwargs):
+        factory = _TRACED_CURSORS.get(cursor_factory, cursor_factory)
+        return super().cursor(*args, cursor_factory=factory, **kwargs)
+
+
+class PoolTimeout(Exception):
+    """Dilempar jika tidak ada koneksi yang tersedia dalam batas waktu checkout."""
+
+
+class ConnectionPool:
+    """Pool koneksi Postgres yang terbatas, thread-safe, dengan health check dan metrik."""
+
+    def __init__(self, dsn, minconn=0, maxconn=5, checkout_timeout=5.0,
+                 max_lifetime=1800.0, max_idle=300.0, health_check_after=30.0):
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.checkout_timeout = checkout_timeout
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.health_check_after = health_check_after
+
+        self._lock = threading.Condition()
+        self._idle = []          # list of (conn, created_at, returned_at)
+        self._created_at = {}    # id(conn) -> created_at
+        self._in_use = 0
+        self._stats = {"created": 0, "recycled": 0, "waits": 0, "wait_time_total": 0.0,
+                       "timeouts": 0, "checkouts": 0, "health_check_failures": 0}
+
+        for _ in range(minconn):
+            conn = self._connect()
+            self._register(conn)
+            self._idle.append((conn, self._created_at[id(conn)], time.monotonic()))
+
+    @tracing.traced("db.connect")
+    def _connect(self):
+        conn = psycopg2.connect(
+            self.dsn, sslmode=os.getenv("DB_SSLMODE", "require"), connect_timeout=10,
+            keepalives=1, keepalives_idle=30, keepalives_interval=10, keepalives_count=3,
+            connection_factory=TracingConnection,
+        )
+        return conn
+
+    def _register(self, conn):
+        self._created_at[id(conn)] = time.monotonic()
+        self._stats["created"] += 1
+
+    def _discard(self, conn):
+        self._created_at.pop(id(conn), None)
+        self._stats["recycled"] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_fresh(self, conn, created_at, returned_at, now):
+        return not conn.closed and now - created_at <= self.max_lifetime and now - returned_at <= self.max_idle
+
+    def _ping(self, conn):
+        # Dijalankan tanpa memegang lock: koneksi yang lambat/setengah mati tidak boleh menahan checkout lain
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _reserve(self, deadline, timeout, waited):
+        """
+        Di bawah lock: mengambil koneksi idle yang belum kedaluwarsa -> (conn, perlu_health_check), atau
+        memesan slot untuk koneksi baru -> (None, False). Slot `_in_use` sudah dihitung di kedua kasus.
+        """
+        with self._lock:
+            while True:
+                now = time.monotonic()
+                while self._idle:
+                    conn, created_at, returned_at = self._idle.pop()
+                    if self._is_fresh(conn, created_at, returned_at, now):
+                        self._in_use += 1
+                        return conn, now - returned_at > self.health_check_after
+                    self._discard(conn)
+                if self._in_use < self.maxconn:
+                    # Slot dipesan dulu agar handshake TLS tidak dilakukan sambil memegang lock.
+                    self._in_use += 1
+                    return None, False
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout(f"Tidak ada koneksi database yang tersedia dalam {timeout} detik.")
+                if not waited[0]:
+                    waited[0] = True
+                    self._stats["waits"] += 1
+                wait_start = time.monotonic()
+                self._lock.wait(remaining)
+                self._stats["wait_time_total"] += time.monotonic() - wait_start
+
+    def getconn(self, timeout=None):
+        timeout = self.checkout_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        waited = [False]
+        while True:
+            conn, needs_check = self._reserve(deadline, timeout, waited)
+            if conn is None:
+                break
+            if not needs_check or self._ping(conn):
+                with self._lock:
+                    self._stats["checkouts"] += 1
+                return conn
+            with self._lock:
+                self._stats["health_check_failures"] += 1
+                self._in_use -= 1
+                self._discard(conn)
+                self._lock.notify()
+
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._lock:
+                self._in_use -= 1
+                self._lock.notify()
+            raise
+        with self._lock:
+            self._register(conn)
+            self._stats["checkouts"] += 1
+        return conn
+
+    def putconn(self, conn, discard=False):
+        # Transaksi yang tidak di-commit oleh route dibatalkan supaya koneksi kembali bersih.
+        if not discard and not conn.closed:
+            try:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                discard = True
+        with self._lock:
+            self._in_use -= 1
+            if discard or conn.closed:
+                self._discard(conn)
+            else:
+                self._idle.append((conn, self._created_at.get(id(conn), time.monotonic()), time.monotonic()))
+            self._lock.notify()
+
+    def closeall(self):
+        with self._lock:
+            while self._idle:
+                conn, _, _ = self._idle.pop()
+                self._discard(conn)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, in_use=self._in_use, idle=len(self._idle), max=self.maxconn)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Membuat pool secara malas pada pemakaian pertama (aman untuk gunicorn maupun Vercel)."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # Di Vercel setiap instance hanya melayani satu request pada satu waktu dan bisa
+                # dibekukan kapan saja, jadi pool-nya sengaja dibuat kecil.
+                serverless = bool(os.getenv("VERCEL"))
+                _pool = ConnectionPool(
+                    os.getenv("POSTGRES_URL"),
+                    minconn=int(os.getenv("DB_POOL_MIN", "0")),
+                    maxconn=int(os.getenv("DB_POOL_MAX", "2" if serverless else "10")),
+                    checkout_timeout=float(os.getenv("DB_POOL_TIMEOUT", "5")),
+                    max_lifetime=float(os.getenv("DB_POOL_MAX_LIFETIME", "1800")),
+                    max_idle=float(os.getenv("DB_POOL_MAX_IDLE", "60" if serverless else "300")),
+                )
+    return _pool
+
+
+@contextmanager
+def get_db_connection():
+    """Meminjam koneksi dari pool dan mengembalikannya setelah blok `with` selesai."""
+    try:
+        pool = get_pool()
+        with tracing.span("db.checkout"):
+            conn = pool.getconn()
+    except Exception:
+        logging.exception("Gagal terhubung ke database Postgres.")
+        raise
+    broken = False
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    finally:
+        pool.putconn(conn, discard=broken)
+
+
+def pool_stats():
+    return get_pool().stats() if _pool is not None else {}
@@ -0,0 +1,86 @@
+# gazetteer.py
+# Ekstraksi nama kota lokal (tanpa LLM) untuk pertanyaan cuaca.
+#
+# Data di data/gazetteer.txt dimuat sekali saat import menjadi dua struktur ringkas:
+#   - _names: n-gram nama/alias yang sudah dinormalisasi -> nama resmi (lookup O(1))
+#   - _fuzzy_buckets: huruf pertama -> nama satu kata, untuk mentoleransi salah ketik
+# Pencarian mencoba n-gram terpanjang dulu (3, 2, lalu 1 kata) agar "Bandar Lampung"
+# tidak terbaca sebagai "Lampung" saja.
+#
+# Nama yang juga kata sehari-hari (COMMON_WORDS: "lima hari", "nasib malang", "kl" = kalau) tidak
+# pernah dipakai sebagai alias maupun target fuzzy. Jika kata itu nama resmi kota, ia hanya cocok
+# setelah penanda lokasi ("di malang", "kota batu"); selain itu find_city mengembalikan None dan
+# tools.extract_city menyerahkannya ke Gemini.
+
+import os
+import re
+import difflib
+
+GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "gazetteer.txt")
+MAX_NGRAM = 3
+FUZZY_CUTOFF = 0.84
+FUZZY_MIN_LENGTH = 5
+
+# Kata umum di pertanyaan cuaca yang tidak boleh dicocokkan secara fuzzy ke nama kota
+STOPWORDS = frozenset("""
+cuaca hari ini besok lusa sekarang nanti malam pagi siang sore bagaimana gimana berapa apakah apa
+di ke dari untuk dong ya yang dan atau akan sedang lagi kota kabupaten daerah wilayah sekitar suhu
+hujan cerah panas dingin mendung berawan prakiraan ramalan info tolong kasih tahu cek minggu depan
+""".split())
+
+# Nama/alias kota yang juga kata umum, singkatan chat, atau dekat dengan kata umum ("bantu" ~ "bantul")
+COMMON_WORDS = frozenset("""
+solo batu malang padang medan metro puncak lima pati banjar batang palu kudus lombok tegal serang
+bantu kl plg smg
+""".split())
+
+# Kata sebelum nama kota yang menandakan lokasi
+LOCATION_CUES = frozenset("di ke dari kota kabupaten kab daerah wilayah sekitar".split())
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+
+def _tokenize(text):
+    return _TOKEN_RE.findall(text.lower())
+
+def _load(path):
+    names = {}
+    fuzzy_buckets = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            canonical, *aliases = line.split("|")
+            for variant in [canonical, *aliases]:
+                tokens = _tokenize(variant)
+                key = " ".join(tokens)
+                if key in COMMON_WORDS and variant != canonical:
+                    continue
+                names.setdefault(key, canonical)
+                # Alias pendek (jkt, sby, ...) dan kata umum hanya dicocokkan persis
+                if len(tokens) == 1 and len(key) >= FUZZY_MIN_LENGTH and key not in COMMON_WORDS:
+                    fuzzy_buckets.setdefault(key[0], []).append(key)
+    return names, {k: tuple(v) for k, v in fuzzy_buckets.items()}
+
+_names, _fuzzy_buckets = _load(GAZETTEER_PATH)
+
+def find_city(text):
+    """Mengembalikan nama resmi kota pertama yang disebut di `text`, atau None."""
+    tokens = _tokenize(text)
+
+    # Tahap 1: cocok persis, n-gram terpanjang lebih dulu
+    for i in range(len(tokens)):
+        for n in range(min(MAX_NGRAM, len(tokens) - i), 0, -1):
+            key = " ".join(tokens[i:i + n])
+            city = _names.get(key)
+            if city and (key not in COMMON_WORDS or (i > 0 and tokens[i - 1] in LOCATION_CUES)):
+                return city
+
+    # Tahap 2: toleransi salah ketik ("surabya", "yogyakrta")
+    for token in tokens:
+        if len(token) < FUZZY_MIN_LENGTH or token in STOPWORDS or token in COMMON_WORDS:
+            continue
+        match = difflib.get_close_matches(token, _fuzzy_buckets.get(token[0], ()), n=1, cutoff=FUZZY_CUTOFF)
+        if match:
+            return _names[match[0]]
+    return None
@@ -0,0 +1,54 @@
+# gemini.py
+# Konfigurasi model Gemini dan "briefing" identitas yang dipakai di setiap sesi chat.
+
+import os
+import logging
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- Konfigurasi AI Gemini ---
+# google.generativeai (beserta grpc/protobuf) butuh hampir satu detik untuk diimpor. Di Vercel itu
+# dibayar setiap cold start, termasuk oleh halaman login yang tidak memakai AI sama sekali, jadi
+# modelnya baru dibuat saat pertama kali dibutuhkan.
+model = None
+_model_ready = False
+_model_lock = threading.Lock()
+
+def get_model():
+    """Model Gemini yang dibuat sekali per proses, atau None jika konfigurasi gagal."""
+    global model, _model_ready
+    if not _model_ready:
+        with _model_lock:
+            if not _model_ready:
+                try:
+                    import google.generativeai as genai
+                    options = {}
+                    # Endpoint lain (host:port gRPC), mis. server tiruan di benchmarks/fake_upstreams.py
+                    if os.getenv("GEMINI_API_ENDPOINT"):
+                        options['client_options'] = {'api_endpoint': os.getenv("GEMINI_API_ENDPOINT")}
+                    genai.configure(api_key=os.getenv("GOOGLE_API_KEY"), **options)
+                    model = genai.GenerativeModel('gemini-1.5-flash')
+                except Exception as e:
+                    model = None
+                    logging.error(f"Error Konfigurasi Gemini: {e}")
+                _model_ready = True
+    return model
+
+briefing_user = """
+PERATURAN UTAMA DAN IDENTITAS DIRI ANDA:
+1. Nama kamu adalah Richatz.AI, dibuat oleh seorang developer Indonesia bernama 'R.ARTCH'. Versi kamu adalah 1.0 SPRO.
+2. Jika ditanya identitasmu, jawab sesuai poin 1. Jangan pernah menjawab "Saya adalah model bahasa besar".
+3. Kamu PUNYA akses internet real-time.
+4. Sangat Penting: Jika kamu memberikan contoh kode, selalu gunakan Markdown Code Blocks.
+"""
+briefing_model = "Siap, saya mengerti. Nama saya Richatz.AI v1.0 SPRO."
+
+def start_chat_session(db_history):
+    history_for_ai = [
+        {"role": 'user', "parts": [briefing_user]},
+        {"role": 'model', "parts": [briefing_model]}
+    ]
+    history_for_ai.extend([{"role": ('model' if role in ['assistant', 'model'] else 'user'), "parts": [content]} for role, content in db_history])
+    return get_model().start_chat(history=history_for_ai)
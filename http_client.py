@@ -0,0 +1,241 @@
+# http_client.py
+# Klien HTTP keluar bersama untuk semua tool eksternal (cuaca, pencarian web).
+#
+# - satu httpx.AsyncClient per host, masing-masing dengan pool koneksi keep-alive sendiri
+# - timeout connect/read per tool
+# - retry dengan backoff eksponensial + jitter untuk error jaringan, 429, dan 5xx
+# - circuit breaker per tool supaya upstream yang sedang mati tidak menahan setiap request
+# - histogram latensi per tool (bucket kumulatif ala Prometheus)
+#
+# Semua fungsi async di sini harus dijalankan di event loop milik pipeline.py.
+# httpx baru diimpor saat request keluar pertama, supaya cold start route tanpa tool tidak membayarnya.
+
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from urllib.parse import urlsplit
+
+import tracing
+
+def _policy(tool, connect, read, retries, failure_threshold, reset_after):
+    prefix = f"HTTP_{tool.upper()}_"
+    return {
+        'connect_timeout': float(os.getenv(prefix + "CONNECT_TIMEOUT", str(connect))),
+        'read_timeout': float(os.getenv(prefix + "READ_TIMEOUT", str(read))),
+        'retries': int(os.getenv(prefix + "RETRIES", str(retries))),
+        'failure_threshold': int(os.getenv(prefix + "FAILURE_THRESHOLD", str(failure_threshold))),
+        'reset_after': float(os.getenv(prefix + "RESET_AFTER", str(reset_after))),
+    }
+
+POLICIES = {
+    'weather': _policy('weather', connect=2.0, read=4.0, retries=2, failure_threshold=5, reset_after=30),
+    'search': _policy('search', connect=2.0, read=8.0, retries=1, failure_threshold=5, reset_after=60),
+}
+DEFAULT_POLICY = _policy('default', connect=3.0, read=10.0, retries=1, failure_threshold=5, reset_after=30)
+
+MAX_CONNECTIONS_PER_HOST = int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", "20"))
+MAX_KEEPALIVE_PER_HOST = int(os.getenv("HTTP_MAX_KEEPALIVE_PER_HOST", "10"))
+BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "0.2"))
+BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "2.0"))
+
+# Batas atas bucket histogram latensi, dalam detik
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class UpstreamError(Exception):
+    """Upstream gagal setelah semua retry habis, atau circuit breaker sedang terbuka."""
+
+    def __init__(self, tool, message):
+        super().__init__(f"{tool}: {message}")
+        self.tool = tool
+
+
+class CircuitOpen(UpstreamError):
+    pass
+
+
+class CircuitBreaker:
+    """closed -> open setelah N kegagalan berturut-turut -> half_open (satu probe) setelah reset_after."""
+
+    def __init__(self, failure_threshold, reset_after):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opened_total = 0
+        self._probe_in_flight = False
+
+    def allow(self):
+        if self.state == 'closed':
+            return True
+        if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_after:
+            self.state = 'half_open'
+        if self.state == 'half_open' and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def release_probe(self):
+        self._probe_in_flight = False
+
+    def record_success(self):
+        self.state = 'closed'
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self._probe_in_flight = False
+        self.failures += 1
+        if self.state == 'half_open' or self.failures >= self.failure_threshold:
+            if self.state != 'open':
+                self.opened_total += 1
+            self.state = 'open'
+            self.opened_at = time.monotonic()
+
+
+class LatencyHistogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.count += 1
+        self.sum += seconds
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+
+    def snapshot(self):
+        cumulative, running = {}, 0
+        for bound, count in zip(self.buckets, self.counts):
+            running += count
+            cumulative["+Inf" if bound == float("inf") else str(bound)] = running
+        return {'count': self.count, 'sum': round(self.sum, 6), 'buckets': cumulative}
+
+
+class HttpClient:
+    def __init__(self, policies=POLICIES, default_policy=DEFAULT_POLICY):
+        self.policies = policies
+        self.default_policy = default_policy
+        self._clients = {}          # origin -> httpx.AsyncClient
+        self._breakers = {}
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def policy(self, tool):
+        return self.policies.get(tool, self.default_policy)
+
+    def _client_for(self, url):
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        client = self._clients.get(origin)
+        if client is None:
+            import httpx
+
+            client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=MAX_CONNECTIONS_PER_HOST,
+                                    max_keepalive_connections=MAX_KEEPALIVE_PER_HOST,
+                                    keepalive_expiry=60.0),
+            )
+            self._clients[origin] = client
+        return client
+
+    def _breaker(self, tool):
+        breaker = self._breakers.get(tool)
+        if breaker is None:
+            policy = self.policy(tool)
+            breaker = self._breakers[tool] = CircuitBreaker(policy['failure_threshold'], policy['reset_after'])
+        return breaker
+
+    def _count(self, tool, key):
+        with self._lock:
+            counters = self._counters.setdefault(tool, {'requests': 0, 'retries': 0, 'failures': 0,
+                                                        'short_circuited': 0})
+            counters[key] += 1
+
+    def _observe(self, tool, seconds):
+        with self._lock:
+            self._histograms.setdefault(tool, LatencyHistogram()).observe(seconds)
+
+    async def request(self, tool, method, url, **kwargs):
+        """Mengirim request atas nama `tool`. 4xx selain 429 dikembalikan apa adanya ke pemanggil."""
+        policy = self.policy(tool)
+        breaker = self._breaker(tool)
+        if not breaker.allow():
+            self._count(tool, 'short_circuited')
+            raise CircuitOpen(tool, "circuit breaker terbuka, upstream dilewati")
+
+        with tracing.span(f"http.{tool}"):
+            return await self._request(tool, policy, breaker, method, url, **kwargs)
+
+    async def _request(self, tool, policy, breaker, method, url, **kwargs):
+        import httpx
+
+        timeout = httpx.Timeout(policy['read_timeout'], connect=policy['connect_timeout'])
+        client = self._client_for(url)
+        attempts = policy['retries'] + 1
+        last_error = None
+        for attempt in range(1, attempts + 1):
+            self._count(tool, 'requests')
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, url, timeout=timeout, **kwargs)
+                self._observe(tool, time.perf_counter() - start)
+                if response.status_code not in RETRY_STATUSES:
+                    breaker.record_success()
+                    return response
+                last_error = f"HTTP {response.status_code}"
+            except httpx.TransportError as e:
+                self._observe(tool, time.perf_counter() - start)
+                last_error = f"{type(e).__name__}: {e}"
+            except asyncio.CancelledError:
+                # Dibatalkan oleh deadline pipeline: bukan kesalahan upstream, lepaskan slot probe saja
+                breaker.release_probe()
+                raise
+
+            if attempt < attempts:
+                self._count(tool, 'retries')
+                # Full jitter: tidur acak antara 0 dan batas eksponensial
+                delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1)))
+                logging.warning(f"Request {tool} gagal ({last_error}), retry {attempt} dalam {delay:.2f} detik")
+                await asyncio.sleep(delay)
+
+        self._count(tool, 'failures')
+        breaker.record_failure()
+        raise UpstreamError(tool, f"gagal setelah {attempts} percobaan: {last_error}")
+
+    async def get(self, tool, url, **kwargs):
+        return await self.request(tool, "GET", url, **kwargs)
+
+    def stats(self):
+        with self._lock:
+            result = {}
+            for tool in set(self._counters) | set(self._breakers):
+                breaker = self._breakers.get(tool)
+                histogram = self._histograms.get(tool)
+                result[tool] = dict(
+                    self._counters.get(tool, {}),
+                    circuit=breaker.state if breaker else 'closed',
+                    circuit_opened=breaker.opened_total if breaker else 0,
+                    latency=histogram.snapshot() if histogram else LatencyHistogram().snapshot(),
+                )
+            result['_pools'] = sorted(self._clients)
+            return result
+
+    async def aclose(self):
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+
+http_client = HttpClient()
@@ -1,42 +1,18 @@
 # init_db.py
 
 import os
-import psycopg2
 from dotenv import load_dotenv
 
+from migrations import MIGRATIONS, connect, migrate
+
 # Memuat semua variabel dari file .env
 load_dotenv()
 
 # Ambil URL koneksi dari environment
 DATABASE_URL = os.getenv("POSTGRES_URL")
 
-# Perintah SQL yang ingin kita jalankan
-SQL_COMMANDS = """
-CREATE TABLE IF NOT EXISTS users (
-    id SERIAL PRIMARY KEY,
-    email TEXT NOT NULL UNIQUE,
-    password_hash TEXT NOT NULL,
-    created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
-);
-
-ALTER TABLE conversations ADD COLUMN IF NOT EXISTS user_id INTEGER;
-
-DO $$
-BEGIN
-    IF NOT EXISTS (
-        SELECT 1 FROM pg_constraint 
-        WHERE conname = 'fk_user' AND conrelid = 'conversations'::regclass
-    ) THEN
-        ALTER TABLE conversations 
-        ADD CONSTRAINT fk_user 
-        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE;
-    END IF;
-END;
-$$;
-"""
-
 def initialize_database():
-    """Fungsi untuk terhubung ke DB dan menjalankan perintah SQL."""
+    """Fungsi untuk terhubung ke DB dan menerapkan semua migrasi skema (lihat migrations.py)."""
     conn = None
     if not DATABASE_URL:
         print("ERROR: Variabel POSTGRES_URL tidak ditemukan di file .env Anda.")
@@ -44,18 +20,17 @@ def initialize_database():
 
     try:
         print("Mencoba terhubung ke database Neon...")
-        conn = psycopg2.connect(DATABASE_URL, sslmode='require')
-        cur = conn.cursor()
+        conn = connect()
         
-        print("Koneksi berhasil. Menjalankan perintah SQL untuk membuat tabel...")
-        cur.execute(SQL_COMMANDS)
-        conn.commit()
+        print("Koneksi berhasil. Menjalankan migrasi skema...")
+        applied = migrate(conn)
         
         print("\n==============================================")
-        print("SUKSES! Tabel berhasil dibuat atau sudah ada.")
+        if applied:
+            print(f"SUKSES! Migrasi {applied} berhasil diterapkan.")
+        else:
+            print(f"SUKSES! Skema sudah versi terbaru (v{MIGRATIONS[-1][0]}).")
         print("==============================================")
-        
-        cur.close()
     except Exception as e:
         print("\n======================================")
         print(f"TERJADI ERROR: {e}")
@@ -67,4 +42,4 @@ def initialize_database():
 
 # Jalankan fungsi utama
 if __name__ == '__main__':
-    initialize_database()
\ No newline at end of file
+    initialize_database()
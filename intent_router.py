@@ -0,0 +1,226 @@
+# intent_router.py
+# Registry tool dan router intent untuk /ask.
+#
+# Semua kata kunci dari semua tool dikompilasi menjadi satu automaton Aho-Corasick, jadi satu kali
+# pemindaian prompt sudah cukup untuk menemukan semua tool yang cocok, berapapun jumlah tool-nya.
+# Jika lebih dari satu tool cocok (mis. "apa itu cuaca ekstrem": search vs weather), classifier
+# lokal opsional (INTENT_CLASSIFIER=1, Naive Bayes kata + bigram) yang memilih; tanpa classifier
+# dipakai prioritas tool.
+
+import os
+import math
+import asyncio
+import logging
+
+import tracing
+from collections import Counter, deque
+
+# Akhiran Indonesia yang boleh menempel pada kata kunci: "cuacanya", "siapakah", "hujanlah"
+SUFFIXES = ("nya", "kah", "lah", "pun")
+CHAT = 'chat'
+
+
+def tokenize(text):
+    return "".join(ch if ch.isalnum() else " " for ch in text.lower()).split()
+
+
+class AhoCorasick:
+    """Automaton multi-pola. search() mengembalikan (start, end, payload) untuk setiap kemunculan."""
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        self._built = False
+
+    def add(self, pattern, payload):
+        state = 0
+        for ch in pattern:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((len(pattern), payload))
+        self._built = False
+
+    def build(self):
+        queue = deque(self._goto[0].values())
+        for state in queue:
+            self._fail[state] = 0
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+        self._built = True
+
+    def search(self, text):
+        if not self._built:
+            self.build()
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            for length, payload in self._out[state]:
+                yield i + 1 - length, i + 1, payload
+
+
+class NaiveBayesClassifier:
+    """Multinomial Naive Bayes atas unigram + bigram kata, cukup untuk beberapa puluh contoh per intent."""
+
+    def __init__(self, examples):
+        self.word_counts = {}
+        self.totals = Counter()
+        self.priors = Counter()
+        vocab = set()
+        for label, text in examples:
+            features = self.features(text)
+            self.priors[label] += 1
+            self.word_counts.setdefault(label, Counter()).update(features)
+            self.totals[label] += len(features)
+            vocab.update(features)
+        self.vocab_size = len(vocab) or 1
+        self.n_examples = sum(self.priors.values())
+
+    @staticmethod
+    def features(text):
+        words = tokenize(text)
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def predict(self, text, labels=None):
+        """Mengembalikan (label, probabilitas) terbaik di antara `labels` (default: semua)."""
+        features = self.features(text)
+        scores = {}
+        for label in labels or self.priors:
+            if label not in self.priors:
+                continue
+            counts, denominator = self.word_counts[label], self.totals[label] + self.vocab_size
+            score = math.log(self.priors[label] / self.n_examples)
+            for feature in features:
+                score += math.log((counts[feature] + 1) / denominator)
+            scores[label] = score
+        if not scores:
+            return None, 0.0
+        best = max(scores, key=scores.get)
+        total = sum(math.exp(s - scores[best]) for s in scores.values())
+        return best, 1.0 / total
+
+    @classmethod
+    def from_file(cls, path):
+        examples = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    label, text = line.split("\t", 1)
+                    examples.append((label, text))
+        return cls(examples)
+
+
+class Tool:
+    """
+    Satu tool /ask. handler: coroutine prompt -> jawaban ("" = serahkan ke Gemini).
+    keywords cocok di mana saja, prefixes hanya di awal prompt. cache_ttl didaftarkan ke tool_cache.
+    """
+
+    def __init__(self, name, handler, keywords=(), prefixes=(), priority=0, timeout=None, cache_ttl=None):
+        self.name = name
+        self.handler = handler
+        self.keywords = tuple(keywords)
+        self.prefixes = tuple(prefixes)
+        self.priority = priority
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+
+
+class IntentRouter:
+    def __init__(self, classifier=None, threshold=0.6, cache=None):
+        self.tools = {}
+        self.classifier = classifier
+        self.threshold = threshold
+        self.cache = cache
+        self._matcher = AhoCorasick()
+
+    def register(self, tool):
+        self.tools[tool.name] = tool
+        if tool.cache_ttl is not None and self.cache is not None:
+            self.cache.register_tool(tool.name, tool.cache_ttl)
+        for keyword in tool.keywords:
+            self._matcher.add(keyword.lower(), (tool.name, False))
+        for prefix in tool.prefixes:
+            self._matcher.add(prefix.lower(), (tool.name, True))
+        return tool
+
+    @staticmethod
+    def _at_boundary(text, start, end):
+        if start > 0 and text[start - 1].isalnum():
+            return False
+        if end == len(text) or not text[end].isalnum():
+            return True
+        for suffix in SUFFIXES:
+            tail = end + len(suffix)
+            if text.startswith(suffix, end) and (tail == len(text) or not text[tail].isalnum()):
+                return True
+        return False
+
+    def candidates(self, prompt):
+        """Nama tool yang kata kuncinya muncul di prompt (dengan batas kata)."""
+        text = prompt.lower()
+        offset = len(text) - len(text.lstrip(" \t\n\"'([¿¡"))
+        found = set()
+        for start, end, (name, prefix_only) in self._matcher.search(text):
+            if prefix_only and start != offset:
+                continue
+            if self._at_boundary(text, start, end):
+                found.add(name)
+        return found
+
+    def route(self, prompt):
+        """Nama tool yang akan menjawab prompt, atau 'chat' (langsung ke Gemini)."""
+        found = self.candidates(prompt)
+        if len(found) == 1:
+            return found.pop()
+        if self.classifier is not None:
+            if found:
+                label, _ = self.classifier.predict(prompt, found)
+                return label or max(found, key=lambda name: self.tools[name].priority)
+            label, probability = self.classifier.predict(prompt)
+            if label in self.tools and probability >= self.threshold:
+                return label
+            return CHAT
+        if found:
+            return max(found, key=lambda name: self.tools[name].priority)
+        return CHAT
+
+    async def dispatch(self, prompt):
+        """Menjalankan handler tool hasil routing. Mengembalikan "" jika tidak ada tool / tool gagal."""
+        with tracing.span('tool.route'):
+            tool = self.tools.get(self.route(prompt))
+        if tool is None or tool.handler is None:
+            return ""
+        try:
+            with tracing.span(f"tool.{tool.name}"):
+                return await asyncio.wait_for(tool.handler(prompt), tool.timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Tool '{tool.name}' melewati batas waktu {tool.timeout} detik.")
+            return ""
+
+
+def load_classifier():
+    if os.getenv("INTENT_CLASSIFIER", "0") != "1":
+        return None
+    path = os.getenv("INTENT_TRAINING_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "intents.txt"))
+    try:
+        return NaiveBayesClassifier.from_file(path)
+    except OSError as e:
+        logging.error(f"Classifier intent tidak bisa dimuat: {e}")
+        return None
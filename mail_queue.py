@@ -0,0 +1,208 @@
+# mail_queue.py
+# Antrian email keluar berbasis Postgres (tabel outbound_emails).
+#
+# Route hanya memasukkan email ke antrian (satu INSERT, bisa di transaksi yang sama dengan data
+# user). Worker mengambil batch dengan FOR UPDATE SKIP LOCKED, sehingga beberapa worker bisa
+# berjalan bersamaan tanpa mengirim email yang sama dua kali, lalu mengirim seluruh batch lewat
+# satu koneksi SMTP. Kegagalan dicoba ulang dengan backoff eksponensial.
+#
+#   python mail_queue.py            # worker terpisah (MAIL_QUEUE_MODE=external)
+#   python mail_queue.py --once     # proses satu batch lalu keluar
+#
+# Di Vercel (MAIL_QUEUE_MODE=inline) hanya email yang baru diantrikan request itu yang dikirim langsung,
+# dengan timeout SMTP pendek (MAIL_INLINE_TIMEOUT) supaya server SMTP yang lambat tidak menahan
+# response; sisanya (retry, antrian lama) dikirim cron /tasks/mail-queue. Plan Hobby hanya mengizinkan
+# cron harian, jadi retry di sana baru jalan sekali sehari; plan Pro bisa memakai `* * * * *`.
+#
+# Untuk pengujian lokal, arahkan MAIL_SERVER/MAIL_PORT ke server SMTP lokal, misalnya:
+#   python -m aiosmtpd -n -l localhost:8025   lalu   MAIL_SERVER=localhost MAIL_PORT=8025 MAIL_USE_TLS=0
+
+import os
+import time
+import random
+import logging
+import threading
+
+from db import get_db_connection
+
+BATCH_SIZE = int(os.getenv("MAIL_QUEUE_BATCH_SIZE", "20"))
+MAX_ATTEMPTS = int(os.getenv("MAIL_QUEUE_MAX_ATTEMPTS", "6"))
+POLL_INTERVAL = float(os.getenv("MAIL_QUEUE_POLL_INTERVAL", "5"))
+BACKOFF_BASE = 30          # detik; percobaan ke-n menunggu ~30 * 2^(n-1) detik
+BACKOFF_MAX = 3600
+# Baris 'sending' yang tidak selesai selama ini dianggap ditinggal worker yang mati
+STALE_LOCK_MINUTES = 10
+# Flask-Mail membuka koneksi SMTP tanpa timeout; server yang hang akan menahan worker selamanya
+SMTP_TIMEOUT = float(os.getenv("MAIL_SMTP_TIMEOUT", "30"))
+
+_wakeup = threading.Event()
+_worker_thread = None
+_worker_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {"sent": 0, "failed": 0, "retried": 0, "batches": 0,
+          "last_batch_seconds": 0.0, "queue_latency_total": 0.0}
+
+def enqueue(cur, recipient, subject, html):
+    """Memasukkan email ke antrian memakai cursor milik pemanggil (ikut transaksinya). Mengembalikan id job."""
+    cur.execute(
+        "INSERT INTO outbound_emails (recipient, subject, html) VALUES (%s, %s, %s) RETURNING id",
+        (recipient, subject, html)
+    )
+    row = cur.fetchone()
+    # Cursor pemanggil bisa berupa RealDictCursor (route /register)
+    return row['id'] if isinstance(row, dict) else row[0]
+
+def notify():
+    """Membangunkan worker thread setelah transaksi yang berisi enqueue() di-commit."""
+    _wakeup.set()
+
+def _backoff(attempts):
+    delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+def _claim_batch(limit, job_ids=None):
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """UPDATE outbound_emails SET status = 'sending', locked_at = now(), attempts = attempts + 1
+                   WHERE id IN (
+                       SELECT id FROM outbound_emails
+                       WHERE ((status = 'pending' AND next_attempt_at <= now())
+                              OR (status = 'sending' AND locked_at < now() - %s * interval '1 minute'))
+                         AND (%s::bigint[] IS NULL OR id = ANY(%s::bigint[]))
+                       ORDER BY next_attempt_at
+                       LIMIT %s
+                       FOR UPDATE SKIP LOCKED
+                   )
+                   RETURNING id, recipient, subject, html, attempts, extract(epoch FROM now() - created_at)""",
+                (STALE_LOCK_MINUTES, job_ids, job_ids, limit)
+            )
+            jobs = cur.fetchall()
+        conn.commit()
+    return jobs
+
+def _record_results(sent_ids, failures):
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            if sent_ids:
+                cur.execute(
+                    "UPDATE outbound_emails SET status = 'sent', sent_at = now(), last_error = NULL WHERE id = ANY(%s)",
+                    (sent_ids,)
+                )
+            for job_id, attempts, error in failures:
+                if attempts >= MAX_ATTEMPTS:
+                    cur.execute("UPDATE outbound_emails SET status = 'failed', last_error = %s WHERE id = %s", (error, job_id))
+                else:
+                    cur.execute(
+                        """UPDATE outbound_emails SET status = 'pending', last_error = %s,
+                           next_attempt_at = now() + %s * interval '1 second' WHERE id = %s""",
+                        (error, _backoff(attempts), job_id)
+                    )
+        conn.commit()
+
+def _connect(mail, timeout):
+    """mail.connect() dengan timeout socket untuk connect, STARTTLS, login, dan setiap perintah SMTP."""
+    import smtplib
+    from flask_mail import Connection
+
+    class TimedConnection(Connection):
+        def configure_host(self):
+            smtp_class = smtplib.SMTP_SSL if self.mail.use_ssl else smtplib.SMTP
+            host = smtp_class(self.mail.server, self.mail.port, timeout=timeout)
+            host.set_debuglevel(int(self.mail.debug))
+            if self.mail.use_tls:
+                host.starttls()
+            if self.mail.username and self.mail.password:
+                host.login(self.mail.username, self.mail.password)
+            return host
+
+    return TimedConnection(mail)
+
+def process_batch(mail, sender, limit=BATCH_SIZE, job_ids=None, timeout=SMTP_TIMEOUT):
+    """
+    Mengirim satu batch email lewat satu koneksi SMTP. Harus dipanggil di dalam app context.
+    job_ids membatasi batch ke job tertentu (pengiriman langsung di request). Mengembalikan jumlah job.
+    """
+    jobs = _claim_batch(limit, job_ids)
+    if not jobs:
+        return 0
+    from flask_mail import Message
+
+    start = time.monotonic()
+    sent_ids, failures, latencies = [], [], []
+    try:
+        with _connect(mail, timeout) as smtp:
+            for job_id, recipient, subject, html, attempts, queued_seconds in jobs:
+                try:
+                    smtp.send(Message(subject, sender=sender, recipients=[recipient], html=html))
+                    sent_ids.append(job_id)
+                    latencies.append(float(queued_seconds))
+                except Exception as e:
+                    logging.error(f"Gagal mengirim email #{job_id} ke {recipient}: {e}")
+                    failures.append((job_id, attempts, str(e)))
+    except Exception as e:
+        # Koneksi SMTP gagal dibuka / putus: semua job yang belum terkirim dijadwalkan ulang
+        logging.error(f"Koneksi SMTP gagal: {e}")
+        done = set(sent_ids) | {job_id for job_id, _, _ in failures}
+        failures.extend((job[0], job[4], str(e)) for job in jobs if job[0] not in done)
+    _record_results(sent_ids, failures)
+
+    with _stats_lock:
+        _stats["batches"] += 1
+        _stats["sent"] += len(sent_ids)
+        _stats["failed"] += sum(1 for _, attempts, _ in failures if attempts >= MAX_ATTEMPTS)
+        _stats["retried"] += sum(1 for _, attempts, _ in failures if attempts < MAX_ATTEMPTS)
+        _stats["last_batch_seconds"] = time.monotonic() - start
+        _stats["queue_latency_total"] += sum(latencies)
+    logging.info(f"Batch email: {len(sent_ids)} terkirim, {len(failures)} gagal")
+    return len(jobs)
+
+def run_worker(app, get_mail, sender, stop_event=None):
+    """Loop worker: proses batch sampai antrian kosong, lalu tunggu notify() atau POLL_INTERVAL."""
+    while stop_event is None or not stop_event.is_set():
+        try:
+            with app.app_context():
+                while process_batch(get_mail(), sender) == BATCH_SIZE:
+                    pass
+        except Exception as e:
+            logging.error(f"Worker antrian email error: {e}")
+        _wakeup.wait(POLL_INTERVAL)
+        _wakeup.clear()
+
+def start_worker_thread(app, get_mail, sender):
+    """Worker di dalam proses web (MAIL_QUEUE_MODE=thread). Dimulai sekali per proses (setelah fork gunicorn)."""
+    global _worker_thread
+    if _worker_thread is None:
+        with _worker_lock:
+            if _worker_thread is None:
+                thread = threading.Thread(target=run_worker, args=(app, get_mail, sender), name="mail-queue", daemon=True)
+                thread.start()
+                _worker_thread = thread
+
+def queue_stats():
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """SELECT count(*) FILTER (WHERE status = 'pending'),
+                          count(*) FILTER (WHERE status = 'sending'),
+                          count(*) FILTER (WHERE status = 'failed'),
+                          coalesce(extract(epoch FROM now() - min(created_at) FILTER (WHERE status = 'pending')), 0)
+                   FROM outbound_emails WHERE status <> 'sent'"""
+            )
+            pending, sending, failed, oldest_pending_seconds = cur.fetchone()
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["avg_queue_latency_seconds"] = stats.pop("queue_latency_total") / stats["sent"] if stats["sent"] else 0.0
+    stats.update(depth=pending, in_flight=sending, dead=failed, oldest_pending_seconds=float(oldest_pending_seconds))
+    return stats
+
+if __name__ == '__main__':
+    import sys
+    from app import app, get_mail, MAIL_SENDER
+
+    if "--once" in sys.argv:
+        with app.app_context():
+            print(f"{process_batch(get_mail(), MAIL_SENDER)} email diproses.")
+    else:
+        logging.info("Worker antrian email berjalan...")
+        run_worker(app, get_mail, MAIL_SENDER)
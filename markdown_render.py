@@ -0,0 +1,138 @@
+# markdown_render.py
+# Render Markdown jawaban AI di server: HTML yang sudah disanitasi dan blok kodenya sudah
+# di-highlight (Pygments), supaya client tidak perlu menjalankan marked + highlight.js untuk
+# setiap pesan saat membuka percakapan panjang.
+#
+# Opt-in lewat SERVER_RENDER=1; client meminta lewat /conversation/<id>?render=html.
+# Hasil render disimpan di tabel rendered_messages dengan kunci sha256(RENDER_PREFIX + konten).
+# Hash yang sama dihitung Postgres di query /conversation (sha256(convert_to(...))), jadi HTML yang
+# sudah ada ikut terbaca dalam satu round trip dan pesan yang tidak berubah tidak pernah dirender ulang.
+# Naikkan RENDERER_VERSION jika aturan render/sanitasi berubah: semua kunci lama otomatis tidak terpakai.
+# markdown-it, Pygments, dan nh3 baru diimpor saat pesan pertama dirender, jadi cold start route lain
+# (dan deployment dengan SERVER_RENDER=0) tidak ikut membayar impornya.
+#
+#   python markdown_render.py --css > static/pygments.css   # stylesheet untuk PYGMENTS_STYLE
+
+import os
+import re
+import sys
+import html
+import hashlib
+import logging
+import threading
+
+from psycopg2.extras import execute_values
+
+import tracing
+
+ENABLED = os.getenv("SERVER_RENDER", "0") == "1"
+RENDERER_VERSION = 1
+RENDER_PREFIX = f"md-v{RENDERER_VERSION}:"
+PYGMENTS_STYLE = "one-dark"
+# Blok kode lebih panjang dari ini tidak di-highlight (tetap di-escape), supaya satu jawaban raksasa
+# tidak menahan request terlalu lama.
+MAX_HIGHLIGHT_CHARS = int(os.getenv("RENDER_MAX_HIGHLIGHT_CHARS", "100000"))
+
+ALLOWED_TAGS = {
+    "p", "br", "hr", "h1", "h2", "h3", "h4", "h5", "h6", "strong", "em", "s", "del", "code", "pre",
+    "blockquote", "ul", "ol", "li", "a", "table", "thead", "tbody", "tr", "th", "td", "span", "img",
+}
+ALLOWED_ATTRIBUTES = {
+    "a": {"href", "title"},
+    "img": {"src", "alt", "title"},
+    "code": {"class"},
+    "span": {"class"},
+    "ol": {"start"},
+    "th": {"style"},
+    "td": {"style"},
+}
+
+_LANG_RE = re.compile(r"[^a-z0-9_+#.-]")
+_md = None
+_formatter = None
+_md_lock = threading.Lock()
+
+
+def _highlight(code, lang, attrs):
+    """Callback highlight markdown-it: mengembalikan <pre><code> lengkap (bertanda class 'highlight')."""
+    from pygments import highlight
+    from pygments.lexers import get_lexer_by_name
+    from pygments.util import ClassNotFound
+
+    lang = _LANG_RE.sub("", (lang or "").strip().lower())
+    body = None
+    if lang and len(code) <= MAX_HIGHLIGHT_CHARS:
+        try:
+            body = highlight(code, get_lexer_by_name(lang), _formatter)
+        except ClassNotFound:
+            pass
+    if body is None:
+        body = html.escape(code, quote=False)
+    css_class = f"language-{lang} highlight" if lang else "highlight"
+    return f'<pre><code class="{css_class}">{body}</code></pre>\n'
+
+
+def _get_md():
+    global _md, _formatter
+    if _md is None:
+        with _md_lock:
+            if _md is None:
+                from markdown_it import MarkdownIt
+                from pygments.formatters import HtmlFormatter
+
+                _formatter = HtmlFormatter(nowrap=True)
+                _md = MarkdownIt("commonmark", {"html": False, "highlight": _highlight}).enable(["table", "strikethrough"])
+    return _md
+
+
+def content_hash(content):
+    return hashlib.sha256((RENDER_PREFIX + content).encode("utf-8")).digest()
+
+
+def render(content):
+    """Markdown -> HTML yang aman disisipkan lewat innerHTML."""
+    import nh3
+
+    return nh3.clean(_get_md().render(content), tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES,
+                     url_schemes={"http", "https", "mailto"}, link_rel="noopener noreferrer nofollow",
+                     filter_style_properties={"text-align"})
+
+
+@tracing.traced('render.markdown')
+def fill_missing(conn, messages):
+    """
+    Melengkapi `html` untuk pesan assistant yang belum punya hasil render di cache (kolom `html` None),
+    lalu menyimpannya ke rendered_messages dalam satu INSERT. Pesan dengan konten sama dirender sekali.
+    """
+    rendered = {}
+    for message in messages:
+        if message['role'] != 'assistant' or message.get('html') is not None:
+            continue
+        key = content_hash(message['content'])
+        if key not in rendered:
+            rendered[key] = render(message['content'])
+        message['html'] = rendered[key]
+    if not rendered:
+        return 0
+    try:
+        with conn.cursor() as cur:
+            execute_values(cur, "INSERT INTO rendered_messages (content_hash, html) VALUES %s ON CONFLICT (content_hash) DO NOTHING",
+                           list(rendered.items()))
+        conn.commit()
+    except Exception as e:
+        # Cache gagal ditulis tidak boleh menggagalkan request; render ulang di lain waktu
+        conn.rollback()
+        logging.warning(f"Gagal menyimpan cache render Markdown: {e}")
+    return len(rendered)
+
+
+def stylesheet():
+    from pygments.formatters import HtmlFormatter
+
+    formatter = HtmlFormatter(style=PYGMENTS_STYLE)
+    return "\n".join(formatter.get_background_style_defs(".highlight") + formatter.get_token_style_defs(".highlight"))
+
+
+if __name__ == '__main__':
+    if "--css" in sys.argv:
+        print(stylesheet())
@@ -0,0 +1,100 @@
+# metrics.py
+# Menyusun teks eksposisi Prometheus untuk endpoint /metrics dari semua subsistem:
+# histogram span/request (tracing.py), pool DB, pool bcrypt, cache tool, response cache,
+# klien HTTP keluar, write-behind, arsip percakapan, dan antrian email.
+
+import logging
+
+import tracing
+import db
+import password_hasher
+import tool_cache
+import response_cache
+import http_client
+import write_behind
+import mail_queue
+import rate_limit
+import archive
+import ask_dedup
+
+CIRCUIT_STATES = {'closed': 0, 'half_open': 1, 'open': 2}
+
+
+def _flat(prefix, documentation, stats, labels=None):
+    """Satu metrik per nilai numerik di dict `stats` (nilai non-numerik dilewati)."""
+    blocks = []
+    for key, value in sorted(stats.items()):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        blocks.append(tracing.render_gauges(f"{prefix}_{key}", documentation, [(labels or {}, value)]))
+    return blocks
+
+
+def _per_label(prefix, documentation, label, stats_by_value):
+    """stats_by_value: {nilai_label: {nama: angka}} -> satu metrik per nama dengan label `label`."""
+    names = sorted({key for values in stats_by_value.values() for key, v in values.items()
+                    if isinstance(v, (int, float)) and not isinstance(v, bool)})
+    return [tracing.render_gauges(f"{prefix}_{name}", documentation,
+                                  [({label: value}, values.get(name)) for value, values in sorted(stats_by_value.items())])
+            for name in names]
+
+
+def _http_blocks():
+    stats = http_client.http_client.stats()
+    stats.pop('_pools', None)
+    blocks = _per_label("richatz_http", "Klien HTTP keluar per tool.", "tool", stats)
+    blocks.append(tracing.render_gauges(
+        "richatz_http_circuit_state", "State circuit breaker (0=closed, 1=half_open, 2=open).",
+        [({'tool': tool}, CIRCUIT_STATES.get(values['circuit'])) for tool, values in sorted(stats.items())]))
+    lines = ["# HELP richatz_http_request_duration_seconds Latensi request HTTP keluar per tool.",
+             "# TYPE richatz_http_request_duration_seconds histogram"]
+    for tool, values in sorted(stats.items()):
+        latency = values['latency']
+        for le, count in latency['buckets'].items():
+            lines.append(f"richatz_http_request_duration_seconds_bucket{tracing.format_labels([('tool', tool)], le=le)} {count}")
+        lines.append(f"richatz_http_request_duration_seconds_count{tracing.format_labels([('tool', tool)])} {latency['count']}")
+        lines.append(f"richatz_http_request_duration_seconds_sum{tracing.format_labels([('tool', tool)])} {latency['sum']}")
+    blocks.append("\n".join(lines))
+    return blocks
+
+
+def render():
+    blocks = [tracing.STAGES.render(), tracing.REQUESTS.render()]
+    blocks += _flat("richatz_db_pool", "Pool koneksi Postgres.", db.pool_stats())
+    blocks += _flat("richatz_password_hasher", "Pool hashing bcrypt.", password_hasher.hasher.stats())
+
+    cache_stats = tool_cache.tool_cache.stats()
+    blocks += _per_label("richatz_tool_cache", "Cache hasil tool per tool.", "tool", cache_stats.pop('tools'))
+    blocks += _flat("richatz_tool_cache", "Cache hasil tool.", cache_stats)
+
+    if response_cache.ENABLED:
+        rc_stats = response_cache.response_cache.stats()
+        blocks += _per_label("richatz_response_cache", "Response cache /ask per route.", "route", rc_stats.pop('routes'))
+        # Totalnya sudah ada sebagai sum() dari seri per route dengan nama yang sama; satu nama metrik
+        # tidak boleh muncul dua kali di eksposisi
+        rc_stats.pop('gemini_calls_saved', None)
+        blocks += _flat("richatz_response_cache", "Response cache /ask.", rc_stats)
+
+    blocks += _http_blocks()
+
+    if rate_limit.ENABLED:
+        rl_stats = rate_limit.limiter.stats()
+        blocks += _per_label("richatz_rate_limit", "Rate limiter per aturan.", "rule", rl_stats.pop('rules'))
+        blocks += _flat("richatz_ask_queue", "Antrian adil /ask.", rl_stats.pop('ask_queue'))
+        blocks += _flat("richatz_rate_limit", "Rate limiter.", rl_stats)
+
+    if write_behind.ENABLED:
+        import chat_store
+        blocks += _flat("richatz_write_behind", "Buffer write-behind pesan chat.", chat_store.get_buffer().stats())
+
+    if ask_dedup.ENABLED:
+        blocks += _flat("richatz_ask_dedup", "Penggabungan dan pembatalan /ask.", ask_dedup.deduplicator.stats())
+
+    blocks += _flat("richatz_archive", "Arsip percakapan (archive.py).", archive.stats())
+
+    try:
+        blocks += _flat("richatz_mail_queue", "Antrian email keluar.", mail_queue.queue_stats())
+    except Exception as e:
+        logging.warning(f"Statistik antrian email tidak tersedia: {e}")
+
+    return "\n".join(blocks) + "\n"
@@ -0,0 +1,484 @@
+# migrations.py
+# Migrasi skema bernomor versi. Setiap migrasi hanya dijalankan sekali dan dicatat di tabel
+# schema_migrations, jadi aman dijalankan berulang kali (misalnya di setiap deploy).
+#
+#   python migrations.py           # jalankan migrasi yang belum diterapkan
+#   python migrations.py --status  # tampilkan versi yang sudah/belum diterapkan
+
+import os
+import sys
+import psycopg2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Ukuran batch backfill: setiap batch satu transaksi pendek, jadi lock baris tidak menahan /ask lama
+BACKFILL_BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", "5000"))
+
+
+def _ensure_messages_id_unique(conn, log):
+    """
+    Tabel messages lama mendapat kolom id dari `ADD COLUMN IF NOT EXISTS id BIGSERIAL` (migrasi 1) tanpa
+    PRIMARY KEY/UNIQUE. Index unik dibangun CONCURRENTLY jika belum ada index unik tunggal pada id.
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT 1 FROM pg_index i JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+            WHERE i.indrelid = 'messages'::regclass AND i.indisunique AND i.indisvalid AND i.indnatts = 1
+              AND i.indpred IS NULL AND a.attname = 'id'
+        """)
+        if cur.fetchone() is None:
+            log("  membangun index unik messages(id)")
+            cur.execute("CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS idx_messages_id ON messages (id)")
+
+
+def _order_legacy_message_ids(conn, log):
+    """
+    Tabel messages dari skema lama (sebelum migrasi 1) tidak punya kolom id. `ADD COLUMN id BIGSERIAL`
+    di migrasi 1 menulis ulang seluruh tabel di bawah ACCESS EXCLUSIVE dan memberi id menurut urutan fisik
+    baris, padahal history dan paginasi mengurutkan pesan berdasarkan id. Di sini id ditambahkan sebagai
+    kolom nullable (hanya ubah katalog), lalu diisi per batch percakapan menurut (conversation_id, timestamp);
+    setelah itu `ADD COLUMN IF NOT EXISTS` di migrasi 1 tidak melakukan apa-apa.
+
+    Database yang sudah terlanjur menjalankan migrasi 1 versi lama (tabel messages tanpa PRIMARY KEY)
+    diurutkan ulang: id milik satu percakapan dipertukarkan di antara pesannya sendiri sesuai timestamp,
+    jadi tidak ada id baru dan tidak bentrok dengan percakapan lain.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('messages') IS NOT NULL, to_regclass('conversation_summaries') IS NOT NULL")
+        has_messages, has_summaries = cur.fetchone()
+        if not has_messages:
+            return
+        cur.execute("SELECT 1 FROM pg_constraint WHERE conrelid = 'messages'::regclass AND contype = 'p'")
+        if cur.fetchone() is not None:
+            # Tabel dibuat oleh migrasi 1 (id BIGSERIAL PRIMARY KEY): id sudah urut sejak awal
+            return
+        cur.execute("SELECT 1 FROM information_schema.columns WHERE table_name = 'messages' AND column_name = 'id'")
+        missing_id = cur.fetchone() is None
+        if missing_id:
+            log("  menambahkan messages.id tanpa menulis ulang tabel")
+            cur.execute("ALTER TABLE messages ADD COLUMN id BIGINT")
+            cur.execute("CREATE SEQUENCE IF NOT EXISTS messages_id_seq OWNED BY messages.id")
+            cur.execute("ALTER TABLE messages ALTER COLUMN id SET DEFAULT nextval('messages_id_seq')")
+            # Index dari migrasi 2 versi awal; supaya setiap batch tidak memindai seluruh tabel
+            cur.execute("""CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_messages_conversation_timestamp
+                           ON messages (conversation_id, timestamp DESC)""")
+
+        log("  mengurutkan id pesan lama menurut (conversation_id, timestamp)")
+        after = ""
+        while True:
+            cur.execute("SELECT id FROM conversations WHERE id > %s ORDER BY id LIMIT %s",
+                        (after, max(1, BACKFILL_BATCH_SIZE // 50)))
+            batch = [row[0] for row in cur.fetchall()]
+            if not batch:
+                break
+            after = batch[-1]
+            cur.execute("BEGIN")
+            try:
+                if missing_id:
+                    cur.execute("""
+                        UPDATE messages m SET id = n.new_id
+                        FROM (
+                            SELECT row_ctid, nextval('messages_id_seq') AS new_id FROM (
+                                SELECT ctid AS row_ctid FROM messages
+                                WHERE conversation_id = ANY(%s) AND id IS NULL
+                                ORDER BY conversation_id, timestamp
+                            ) ordered
+                        ) n
+                        WHERE m.ctid = n.row_ctid
+                    """, (batch,))
+                # Pesan ke-k menurut timestamp mendapat id terkecil ke-k milik percakapannya. Lewat id negatif
+                # dulu karena index unik pada id diperiksa per baris, bukan di akhir statement.
+                cur.execute("""
+                    WITH ranked AS (
+                        SELECT ctid AS row_ctid, conversation_id, id,
+                               row_number() OVER (PARTITION BY conversation_id ORDER BY timestamp, id) AS by_time,
+                               row_number() OVER (PARTITION BY conversation_id ORDER BY id) AS by_id
+                        FROM messages WHERE conversation_id = ANY(%s)
+                    )
+                    UPDATE messages m SET id = -target.id
+                    FROM ranked r JOIN ranked target
+                        ON target.conversation_id = r.conversation_id AND target.by_id = r.by_time
+                    WHERE m.ctid = r.row_ctid AND target.id <> r.id
+                    RETURNING m.conversation_id
+                """, (batch,))
+                reordered = list({row[0] for row in cur.fetchall()})
+                if reordered:
+                    cur.execute("UPDATE messages SET id = -id WHERE conversation_id = ANY(%s) AND id < 0", (reordered,))
+                    if has_summaries:
+                        # summarized_until menunjuk id pesan; ringkasan dibangun ulang oleh context_builder
+                        cur.execute("DELETE FROM conversation_summaries WHERE conversation_id = ANY(%s)", (reordered,))
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+            cur.execute("COMMIT")
+
+        if missing_id:
+            # Pesan tanpa percakapan (data lama yang yatim) tetap butuh id sebelum NOT NULL
+            cur.execute("UPDATE messages SET id = nextval('messages_id_seq') WHERE id IS NULL")
+            # CHECK yang sudah divalidasi membuat SET NOT NULL tidak perlu memindai tabel di bawah lock
+            cur.execute("ALTER TABLE messages ADD CONSTRAINT messages_id_not_null CHECK (id IS NOT NULL) NOT VALID")
+            cur.execute("ALTER TABLE messages VALIDATE CONSTRAINT messages_id_not_null")
+            cur.execute("ALTER TABLE messages ALTER COLUMN id SET NOT NULL")
+            cur.execute("ALTER TABLE messages DROP CONSTRAINT messages_id_not_null")
+
+
+# (versi, nama, sql, transactional)
+# Migrasi non-transaksional dijalankan per statement dengan autocommit, dibutuhkan oleh
+# CREATE INDEX CONCURRENTLY supaya tabel tidak terkunci selama index dibangun. `sql` migrasi
+# non-transaksional boleh berupa fungsi fn(conn, log) untuk langkah yang butuh logika (backfill per batch).
+MIGRATIONS = [
+    # Dijalankan sebelum baseline: database baru dan yang tabel messages-nya dibuat migrasi 1 hanya
+    # melewatinya; lihat _order_legacy_message_ids untuk tabel messages dari skema lama.
+    (0, "legacy message ids", _order_legacy_message_ids, False),
+
+    (1, "baseline schema", """
+CREATE TABLE IF NOT EXISTS users (
+    id SERIAL PRIMARY KEY,
+    email TEXT NOT NULL UNIQUE,
+    password_hash TEXT NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+);
+ALTER TABLE users ADD COLUMN IF NOT EXISTS name TEXT;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS otp TEXT;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS otp_expires_at TIMESTAMPTZ;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS is_verified BOOLEAN NOT NULL DEFAULT FALSE;
+
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    title TEXT,
+    timestamp TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS user_id INTEGER;
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_constraint 
+        WHERE conname = 'fk_user' AND conrelid = 'conversations'::regclass
+    ) THEN
+        ALTER TABLE conversations 
+        ADD CONSTRAINT fk_user 
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE;
+    END IF;
+END;
+$$;
+
+CREATE TABLE IF NOT EXISTS messages (
+    id BIGSERIAL PRIMARY KEY,
+    conversation_id TEXT NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    timestamp TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS id BIGSERIAL;
+
+CREATE TABLE IF NOT EXISTS tool_cache (
+    key TEXT PRIMARY KEY,
+    value JSONB NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL
+);
+""", True),
+
+    # Index untuk query yang benar-benar dijalankan app.py:
+    #   /history          WHERE user_id ORDER BY timestamp DESC, id DESC (+ title, updated_at -> index-only scan)
+    #   /history?since=   WHERE user_id AND updated_at > ... ORDER BY updated_at DESC, juga count/max untuk ETag
+    #   /conversation     WHERE conversation_id ORDER BY id DESC LIMIT n
+    #   /ask (history)    WHERE conversation_id ORDER BY timestamp DESC LIMIT 6
+    #   login/register    WHERE email -> sudah dilayani oleh constraint UNIQUE users.email
+    # messages.content sengaja tidak di-INCLUDE: teks panjang bisa melewati batas ukuran entri btree.
+    (2, "indexes for chat hot paths", """
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_conversations_user_timestamp
+    ON conversations (user_id, timestamp DESC, id DESC) INCLUDE (title, updated_at);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_conversations_user_updated
+    ON conversations (user_id, updated_at DESC);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_messages_conversation_id
+    ON messages (conversation_id, id DESC) INCLUDE (role);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_messages_conversation_timestamp
+    ON messages (conversation_id, timestamp DESC);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tool_cache_expires_at
+    ON tool_cache (expires_at);
+""", False),
+
+    # Context builder: token per pesan dihitung sekali saat insert, plus rolling summary per percakapan
+    (3, "message token counts and conversation summaries", """
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS token_count INTEGER;
+
+CREATE TABLE IF NOT EXISTS conversation_summaries (
+    conversation_id TEXT PRIMARY KEY REFERENCES conversations(id) ON DELETE CASCADE,
+    summary TEXT NOT NULL,
+    summarized_until BIGINT NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+""", True),
+
+    # Antrian email keluar (mail_queue.py). Index parsial hanya berisi baris yang masih menunggu,
+    # jadi tetap kecil walau riwayat email terkirim terus bertambah.
+    (4, "outbound email queue", """
+CREATE TABLE IF NOT EXISTS outbound_emails (
+    id BIGSERIAL PRIMARY KEY,
+    recipient TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    html TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    locked_at TIMESTAMPTZ,
+    last_error TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    sent_at TIMESTAMPTZ
+);
+CREATE INDEX IF NOT EXISTS idx_outbound_emails_pending
+    ON outbound_emails (next_attempt_at) WHERE status IN ('pending', 'sending');
+""", True),
+
+    # exchange_id membuat penyimpanan pesan idempoten (replay journal write-behind, lihat chat_store.py)
+    (5, "message exchange ids", """
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS exchange_id UUID;
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS idx_messages_exchange
+    ON messages (exchange_id, role) WHERE exchange_id IS NOT NULL;
+""", False),
+
+    # Cache HTML hasil render Markdown di server (markdown_render.py), kunci = sha256 konten.
+    # Tidak direferensikan oleh messages: konten yang sama di banyak pesan cukup disimpan sekali.
+    (6, "rendered message cache", """
+CREATE TABLE IF NOT EXISTS rendered_messages (
+    content_hash BYTEA PRIMARY KEY,
+    html TEXT NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+""", True),
+
+    # State rate limiter bersama (rate_limit.py, RATE_LIMIT_BACKEND=postgres). UNLOGGED: tidak ditulis
+    # ke WAL sehingga jauh lebih murah untuk update per request; isinya boleh hilang saat crash.
+    (7, "rate limiter state", """
+CREATE UNLOGGED TABLE IF NOT EXISTS rate_limit_buckets (
+    key TEXT PRIMARY KEY,
+    tokens DOUBLE PRECISION NOT NULL,
+    allowed BOOLEAN NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL
+);
+CREATE UNLOGGED TABLE IF NOT EXISTS rate_limit_leases (
+    id UUID PRIMARY KEY,
+    key TEXT NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_rate_limit_leases_key ON rate_limit_leases (key);
+""", True),
+
+    # Pencarian full-text /search (search.py).
+    # - messages.user_id (denormalisasi dari conversations) supaya pencarian bisa dibatasi ke satu user
+    #   lewat index (user_id, id) tanpa join; diisi trigger untuk penulis yang tidak mengisinya sendiri.
+    # - search_vector adalah kolom generated: dihitung Postgres di setiap INSERT/UPDATE pesan, jadi index
+    #   selalu mutakhir tanpa kode tambahan di jalur tulis. Konfigurasi 'simple' (tanpa stemming) karena
+    #   isi chat campuran Indonesia, Inggris, dan kode.
+    # Catatan: backfill + kolom STORED menulis ulang tabel messages sekali (lock eksklusif selama itu).
+    (8, "message search columns", """
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS user_id INTEGER;
+
+CREATE OR REPLACE FUNCTION messages_fill_user_id() RETURNS trigger AS $$
+BEGIN
+    SELECT user_id INTO NEW.user_id FROM conversations WHERE id = NEW.conversation_id;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_messages_fill_user_id ON messages;
+CREATE TRIGGER trg_messages_fill_user_id BEFORE INSERT ON messages
+    FOR EACH ROW WHEN (NEW.user_id IS NULL) EXECUTE FUNCTION messages_fill_user_id();
+
+UPDATE messages m SET user_id = c.user_id
+FROM conversations c WHERE c.id = m.conversation_id AND m.user_id IS DISTINCT FROM c.user_id;
+
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (to_tsvector('simple'::regconfig, content)) STORED;
+""", True),
+
+    (9, "message search indexes", """
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_messages_search ON messages USING GIN (search_vector);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_messages_user_id ON messages (user_id, id);
+""", False),
+
+    # Arsip percakapan yang lama tidak aktif (archive.py): semua pesannya dipindah dari messages ke satu
+    # baris terkompresi zstd per percakapan, dan dikembalikan ke messages saat percakapan dibuka lagi.
+    # conversations.archived_at menandai percakapan yang pesannya sedang berada di arsip.
+    (10, "conversation archive", """
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS archived_at TIMESTAMPTZ;
+
+CREATE TABLE IF NOT EXISTS archived_conversations (
+    conversation_id TEXT PRIMARY KEY REFERENCES conversations(id) ON DELETE CASCADE,
+    codec TEXT NOT NULL,
+    payload BYTEA NOT NULL,
+    message_count INTEGER NOT NULL,
+    raw_bytes BIGINT NOT NULL,
+    archived_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+-- Payload sudah dikompres zstd; jangan biarkan TOAST mencoba mengompresnya lagi dengan pglz
+ALTER TABLE archived_conversations ALTER COLUMN payload SET STORAGE EXTERNAL;
+""", True),
+
+    # Kandidat arsip: percakapan yang belum diarsipkan, urut dari yang paling lama tidak berubah
+    (11, "conversation archive index", """
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_conversations_archive_candidates
+    ON conversations (updated_at) WHERE archived_at IS NULL;
+""", False),
+
+    # Catatan /ask (ask_dedup.py): hasil request ber-Idempotency-Key (untuk diputar ulang) dan
+    # request yang dibatalkan karena client putus. conversation_id sengaja tanpa foreign key supaya
+    # catatan pembatalan tetap ada walau percakapannya dihapus.
+    (12, "ask request records", """
+CREATE TABLE IF NOT EXISTS ask_requests (
+    id BIGSERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    idempotency_key TEXT,
+    conversation_id TEXT NOT NULL,
+    request_hash BYTEA NOT NULL,
+    status TEXT NOT NULL,
+    answer TEXT,
+    coalesced INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMPTZ
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_ask_requests_key
+    ON ask_requests (user_id, idempotency_key) WHERE idempotency_key IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_ask_requests_created_at ON ask_requests (created_at);
+""", True),
+
+    # History /ask dan paginasi pesan sudah diurutkan berdasarkan id (idx_messages_conversation_id);
+    # index timestamp dari versi lama migrasi 2 tinggal beban di setiap INSERT pesan
+    (13, "drop unused message timestamp index", """
+DROP INDEX CONCURRENTLY IF EXISTS idx_messages_conversation_timestamp;
+""", False),
+
+    # restore() di archive.py memakai ON CONFLICT (id); tabel messages lama tidak punya index unik pada id
+    (14, "unique message ids", _ensure_messages_id_unique, False),
+
+    # Percakapan yang dikembalikan dari arsip dicatat di restored_at supaya tidak langsung diarsipkan lagi
+    # malam berikutnya; kandidat arsip kini diurutkan berdasarkan aktivitas terakhir (pesan atau restore).
+    (15, "conversation restore time", """
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS restored_at TIMESTAMPTZ;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_conversations_archive_idle
+    ON conversations ((greatest(updated_at, restored_at))) WHERE archived_at IS NULL;
+DROP INDEX CONCURRENTLY IF EXISTS idx_conversations_archive_candidates;
+""", False),
+
+    # Percakapan yang dihapus dicatat supaya /history?since= bisa memberi tahu client lain (delta `deleted`)
+    (16, "conversation tombstones", """
+CREATE TABLE IF NOT EXISTS conversation_tombstones (
+    conversation_id TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    deleted_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_conversation_tombstones_user ON conversation_tombstones (user_id, deleted_at);
+""", True),
+
+    # search_vector dari migrasi 8 adalah kolom generated: mengubah ekspresinya nanti menulis ulang seluruh
+    # tabel messages. DROP EXPRESSION (Postgres 13+) hanya mengubah katalog dan mempertahankan isinya;
+    # selanjutnya kolom diisi trigger. Database yang kolomnya sudah biasa hanya memasang ulang trigger.
+    (17, "message search vector trigger", """
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM pg_attribute
+        WHERE attrelid = 'messages'::regclass AND attname = 'search_vector' AND attgenerated = 's'
+    ) THEN
+        ALTER TABLE messages ALTER COLUMN search_vector DROP EXPRESSION;
+    END IF;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION messages_fill_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := to_tsvector('simple'::regconfig, NEW.content);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_messages_fill_search_vector ON messages;
+CREATE TRIGGER trg_messages_fill_search_vector BEFORE INSERT OR UPDATE OF content ON messages
+    FOR EACH ROW EXECUTE FUNCTION messages_fill_search_vector();
+""", True),
+]
+
+def _split_statements(sql):
+    # Cukup untuk migrasi non-transaksional yang berisi statement sederhana (tanpa blok $$).
+    # Catatan: CREATE INDEX CONCURRENTLY yang gagal meninggalkan index INVALID yang akan dilewati
+    # oleh IF NOT EXISTS; hapus dulu index tersebut sebelum menjalankan ulang.
+    return [statement.strip() for statement in sql.split(";") if statement.strip()]
+
+def _ensure_table(conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+    conn.commit()
+
+def applied_versions(conn):
+    _ensure_table(conn)
+    with conn.cursor() as cur:
+        cur.execute("SELECT version FROM schema_migrations")
+        return {row[0] for row in cur.fetchall()}
+
+def migrate(conn, log=print):
+    """Menerapkan semua migrasi yang belum tercatat. Mengembalikan daftar versi yang baru diterapkan."""
+    _ensure_table(conn)
+    newly_applied = []
+    with conn.cursor() as cur:
+        # Cegah dua proses deploy menjalankan migrasi yang sama secara bersamaan
+        cur.execute("SELECT pg_advisory_lock(hashtext('schema_migrations'))")
+    try:
+        done = applied_versions(conn)
+        for version, name, sql, transactional in MIGRATIONS:
+            if version in done:
+                continue
+            log(f"Menerapkan migrasi {version}: {name}")
+            if transactional:
+                with conn.cursor() as cur:
+                    cur.execute(sql)
+                    cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+                conn.commit()
+            else:
+                conn.commit()
+                conn.autocommit = True
+                try:
+                    if callable(sql):
+                        sql(conn, log)
+                    else:
+                        with conn.cursor() as cur:
+                            for statement in _split_statements(sql):
+                                cur.execute(statement)
+                    with conn.cursor() as cur:
+                        cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+                finally:
+                    conn.autocommit = False
+            newly_applied.append(version)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_unlock(hashtext('schema_migrations'))")
+        conn.commit()
+    return newly_applied
+
+def connect():
+    return psycopg2.connect(os.getenv("POSTGRES_URL"), sslmode=os.getenv("DB_SSLMODE", "require"))
+
+if __name__ == '__main__':
+    conn = connect()
+    try:
+        if "--status" in sys.argv:
+            done = applied_versions(conn)
+            for version, name, _, _ in MIGRATIONS:
+                print(f"[{'x' if version in done else ' '}] {version:>3}  {name}")
+        else:
+            applied = migrate(conn)
+            print(f"{len(applied)} migrasi diterapkan." if applied else "Skema sudah versi terbaru.")
+    finally:
+        conn.close()
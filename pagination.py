@@ -0,0 +1,57 @@
+# pagination.py
+# Helper keyset (cursor) pagination dan ETag untuk endpoint JSON (/history, /conversation/<id>).
+
+import json
+import base64
+import hashlib
+from datetime import datetime, timezone
+from flask import Response, request, jsonify
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+def encode_cursor(*values):
+    """Cursor opaque untuk client: base64 dari nilai kunci baris terakhir pada halaman."""
+    payload = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError("Invalid cursor.")
+
+def parse_timestamp(value, error="Invalid timestamp."):
+    """Timestamp ISO 8601 dari client (`since`, isi cursor) -> datetime dengan zona waktu (UTC jika tanpa zona)."""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(error)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def page_limit():
+    try:
+        limit = int(request.args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        limit = DEFAULT_LIMIT
+    return max(1, min(limit, MAX_LIMIT))
+
+def make_etag(*parts):
+    digest = hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+def is_not_modified(etag):
+    return request.if_none_match.contains_weak(etag.removeprefix('W/').strip('"'))
+
+def conditional_json(payload, etag):
+    response = jsonify(payload)
+    response.headers['ETag'] = etag
+    # Browser tetap boleh menyimpan respons, tapi harus selalu revalidasi dengan If-None-Match
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def not_modified_response(etag):
+    response = Response(status=304)
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
@@ -0,0 +1,119 @@
+# password_hasher.py
+# Hashing dan verifikasi bcrypt lewat worker pool terbatas.
+# bcrypt sengaja mahal (CPU-bound); kalau dijalankan langsung di thread request, badai login
+# akan menghabiskan semua worker dan ikut memperlambat route lain seperti chat.
+# Modul pustaka bcrypt melepas GIL selama hashing, jadi thread pool sudah cukup untuk paralel.
+
+import os
+import re
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import bcrypt
+
+import tracing
+
+# Work factor bcrypt. Hash lama dengan cost berbeda di-hash ulang otomatis saat login berhasil.
+ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Jumlah maksimal pekerjaan (sedang berjalan + mengantri). Di atas ini request langsung ditolak 503.
+MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(WORKERS * 4)))
+TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", "10"))
+RETRY_AFTER = int(os.getenv("PASSWORD_HASH_RETRY_AFTER", "2"))
+
+_COST_RE = re.compile(r"^\$2[abxy]?\$(\d{2})\$")
+
+
+class HasherBusy(Exception):
+    """Dilempar jika antrian hashing penuh atau pekerjaan tidak selesai dalam batas waktu."""
+
+
+class PasswordHasher:
+    def __init__(self, workers=WORKERS, max_pending=MAX_PENDING, rounds=ROUNDS, timeout=TIMEOUT):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.rounds = rounds
+        self.timeout = timeout
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._stats_lock = threading.Lock()
+        self._pending = 0
+        self._stats = {"hashed": 0, "verified": 0, "rehashed": 0, "rejected": 0, "timeouts": 0}
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    def _count(self, key, delta=1):
+        with self._stats_lock:
+            self._stats[key] += delta
+
+    def _run(self, fn, *args):
+        # Slot diambil tanpa menunggu: lebih baik cepat 503 daripada menumpuk request yang menggantung.
+        if not self._slots.acquire(blocking=False):
+            self._count("rejected")
+            raise HasherBusy("Antrian hashing password penuh.")
+        with self._stats_lock:
+            self._pending += 1
+
+        def release(_):
+            with self._stats_lock:
+                self._pending -= 1
+            self._slots.release()
+
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            release(None)
+            raise
+        future.add_done_callback(release)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            self._count("timeouts")
+            raise HasherBusy("Hashing password melebihi batas waktu.")
+
+    @tracing.traced("auth.bcrypt_hash")
+    def hash(self, password):
+        hashed = self._run(bcrypt.hashpw, password.encode("utf-8"), bcrypt.gensalt(self.rounds))
+        self._count("hashed")
+        return hashed.decode("utf-8")
+
+    @tracing.traced("auth.bcrypt_verify")
+    def verify(self, password, password_hash):
+        try:
+            ok = self._run(bcrypt.checkpw, password.encode("utf-8"), password_hash.encode("utf-8"))
+        except ValueError:
+            logging.warning("Hash password di database tidak valid.")
+            return False
+        self._count("verified")
+        return ok
+
+    def needs_rehash(self, password_hash):
+        match = _COST_RE.match(password_hash or "")
+        return not match or int(match.group(1)) != self.rounds
+
+    def rehash_if_needed(self, password, password_hash):
+        """Mengembalikan hash baru jika cost berubah, atau None. Tidak pernah menggagalkan login."""
+        if not self.needs_rehash(password_hash):
+            return None
+        try:
+            new_hash = self.hash(password)
+        except HasherBusy:
+            return None
+        self._count("rehashed")
+        return new_hash
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._stats, pending=self._pending, max_pending=self.max_pending,
+                        workers=self.workers, rounds=self.rounds)
+
+
+hasher = PasswordHasher()
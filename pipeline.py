@@ -0,0 +1,212 @@
+# pipeline.py
+# Jalur eksekusi async untuk /ask.
+#
+# Satu event loop per proses berjalan di thread latar belakang. Route Flask (sync) menyerahkan
+# coroutine ke loop ini lewat run(), sehingga semua panggilan ke Gemini, OpenWeatherMap, SerpAPI
+# dan database dari banyak chat sekaligus dimultipleks di satu loop, dan koneksi HTTP keep-alive
+# bisa dipakai ulang antar request.
+
+import os
+import time
+import asyncio
+import logging
+import functools
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+import gemini
+import tools
+import chat_store
+import context_builder
+import response_cache
+import tracing
+
+# Batas waktu per langkah (detik), supaya satu upstream yang lambat tidak menahan request selamanya.
+STEP_TIMEOUTS = {
+    'tool': float(os.getenv("ASK_TOOL_TIMEOUT", "15")),
+    'db': float(os.getenv("ASK_DB_TIMEOUT", "5")),
+    'llm': float(os.getenv("ASK_LLM_TIMEOUT", "60")),
+}
+
+class AccessDenied(Exception):
+    pass
+
+class StepTimeout(Exception):
+    def __init__(self, step):
+        super().__init__(f"Langkah '{step}' melewati batas waktu {STEP_TIMEOUTS[step]} detik.")
+        self.step = step
+
+_loop = None
+_loop_lock = threading.Lock()
+# psycopg2 bersifat blocking, jadi query dijalankan di thread pool terpisah yang ukurannya
+# sebanding dengan pool koneksi database.
+_db_executor = ThreadPoolExecutor(max_workers=int(os.getenv("ASK_DB_THREADS", "10")), thread_name_prefix="ask-db")
+# Event loop hanya menyimpan weak reference ke task; task latar belakang dipegang di sini sampai selesai
+_background_tasks = set()
+
+def get_loop():
+    """Membuat event loop latar belakang secara malas (setelah fork gunicorn, bukan sebelumnya)."""
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="ask-pipeline", daemon=True).start()
+                _loop = loop
+    return _loop
+
+def start(coro):
+    """Memulai coroutine di loop pipeline dengan trace thread pemanggil; future-nya bisa di-cancel()."""
+    return asyncio.run_coroutine_threadsafe(tracing.bind(coro), get_loop())
+
+def run(coro, timeout=None):
+    """Menjalankan coroutine di loop pipeline dan menunggu hasilnya dari thread pemanggil."""
+    return start(coro).result(timeout)
+
+def submit(coro):
+    """Menjadwalkan coroutine di loop pipeline tanpa menunggu hasilnya (pekerjaan latar belakang)."""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+async def run_db(fn, *args, **kwargs):
+    # copy_context() membawa trace request yang sedang berjalan ke thread executor
+    ctx = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(_db_executor, ctx.run, functools.partial(fn, *args, **kwargs))
+
+def _background(coro):
+    """Task latar belakang di loop pipeline; referensinya dipegang sampai selesai."""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+async def with_deadline(awaitable, step):
+    try:
+        return await asyncio.wait_for(awaitable, STEP_TIMEOUTS[step])
+    except asyncio.TimeoutError:
+        raise StepTimeout(step)
+
+async def tool_answer(user_prompt_original):
+    """Jawaban dari tool, atau string kosong jika tidak ada tool yang cocok / tool kehabisan waktu."""
+    try:
+        return await with_deadline(tools.answer_with_tools(user_prompt_original), 'tool')
+    except StepTimeout as e:
+        logging.warning(str(e))
+        return ""
+
+def cached_answer(route, user_prompt_original):
+    """Jawaban dari response cache, atau (None, None) jika cache tidak aktif / tidak ada yang cocok."""
+    if not response_cache.ENABLED:
+        return None, None
+    return response_cache.response_cache.get(route, user_prompt_original)
+
+def remember_answer(route, user_prompt_original, tier, ai_answer):
+    """Dipanggil hanya untuk giliran tanpa history: mencatat hit/miss dan menyimpan jawaban baru."""
+    if not response_cache.ENABLED:
+        return
+    response_cache.response_cache.record(route, tier)
+    if tier is None:
+        response_cache.response_cache.set(route, user_prompt_original, ai_answer)
+
+async def ask(conversation_id, user_id, user_prompt_original, exchange_id=None):
+    route = tools.route_for(user_prompt_original)
+    cached, tier = cached_answer(route, user_prompt_original)
+    # Tool (cuaca/pencarian) dan pengambilan history + cek kepemilikan berjalan bersamaan.
+    # Kalau kandidat jawaban sudah ada di cache, tool baru dipanggil jika ternyata percakapannya punya history.
+    tool_task = None if cached else asyncio.create_task(tool_answer(user_prompt_original))
+    try:
+        db_history = await with_deadline(run_db(chat_store.load_chat_history, conversation_id, user_id), 'db')
+    except BaseException:
+        if tool_task:
+            tool_task.cancel()
+        raise
+    if db_history is None:
+        if tool_task:
+            tool_task.cancel()
+        raise AccessDenied()
+
+    if cached and not db_history:
+        ai_answer = cached
+    else:
+        tier = None
+        ai_answer = await (tool_task or tool_answer(user_prompt_original))
+        if not ai_answer:
+            chat = gemini.start_chat_session(db_history)
+            with tracing.span('llm.gemini'):
+                response = await with_deadline(chat.send_message_async(user_prompt_original), 'llm')
+            ai_answer = response.text
+    if not db_history:
+        remember_answer(route, user_prompt_original, tier, ai_answer)
+
+    await with_deadline(
+        run_db(chat_store.save_exchange, conversation_id, user_prompt_original, ai_answer, set_title=not db_history,
+               exchange_id=exchange_id),
+        'db',
+    )
+    if context_builder.SUMMARY_ENABLED:
+        _background(refresh_summary(conversation_id))
+    return ai_answer
+
+async def _stream_gemini(chat, user_prompt_original, chunks, on_chunk):
+    stream_start = time.perf_counter()
+    response = await chat.send_message_async(user_prompt_original, stream=True)
+    async for chunk in response:
+        text = chunk.text
+        if text:
+            if not chunks:
+                tracing.record('llm.first_token', time.perf_counter() - stream_start)
+            chunks.append(text)
+            on_chunk(text)
+
+async def ask_stream(conversation_id, user_prompt_original, db_history, on_chunk, exchange_id=None):
+    """
+    Versi streaming dari ask() untuk /ask/stream: potongan jawaban diteruskan ke on_chunk(text) begitu
+    diterima dari Gemini. Kepemilikan dan db_history sudah dicek oleh route sebelum stream dimulai.
+    Jika dibatalkan di tengah jawaban Gemini, potongan yang sudah terkirim tetap disimpan.
+    """
+    route = tools.route_for(user_prompt_original)
+    cached, tier = cached_answer(route, user_prompt_original) if not db_history else (None, None)
+    ai_answer = cached or await tool_answer(user_prompt_original)
+    if ai_answer:
+        on_chunk(ai_answer)
+    else:
+        tier = None
+        chunks = []
+        chat = gemini.start_chat_session(db_history)
+        try:
+            with tracing.span('llm.gemini_stream'):
+                await with_deadline(_stream_gemini(chat, user_prompt_original, chunks, on_chunk), 'llm')
+        except (asyncio.CancelledError, StepTimeout):
+            if chunks:
+                # Disimpan sebagai jawaban parsial: retry dengan Idempotency-Key yang sama menggantikannya
+                # dengan jawaban lengkap alih-alih menambah exchange kedua
+                await run_db(chat_store.save_exchange, conversation_id, user_prompt_original, "".join(chunks),
+                             set_title=not db_history, exchange_id=exchange_id, partial=True)
+            raise
+        ai_answer = "".join(chunks)
+    # Jawaban yang terpotong karena dibatalkan/error tidak sampai ke sini, jadi tidak masuk response cache
+    if not db_history:
+        remember_answer(route, user_prompt_original, tier, ai_answer)
+
+    await with_deadline(
+        run_db(chat_store.save_exchange, conversation_id, user_prompt_original, ai_answer, set_title=not db_history,
+               exchange_id=exchange_id),
+        'db',
+    )
+    if context_builder.SUMMARY_ENABLED:
+        _background(refresh_summary(conversation_id))
+    return ai_answer
+
+async def refresh_summary(conversation_id):
+    """Meringkas giliran lama yang sudah keluar dari jendela history. Dijalankan di latar belakang."""
+    try:
+        pending = await run_db(context_builder.pending_summary_input, conversation_id)
+        if pending is None:
+            return
+        previous_summary, messages, last_message_id = pending
+        with tracing.span('llm.summary'):
+            response = await with_deadline(
+                gemini.get_model().generate_content_async(context_builder.summary_prompt(previous_summary, messages)), 'llm'
+            )
+        await run_db(context_builder.store_summary, conversation_id, response.text.strip(), last_message_id)
+    except Exception as e:
+        logging.error(f"Gagal memperbarui ringkasan percakapan {conversation_id}: {e}")
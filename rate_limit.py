@@ -0,0 +1,370 @@
+# rate_limit.py
+# Pembatasan laju dan admission control untuk route yang mahal:
+#   /ask, /ask/stream        memanggil Gemini/SerpAPI berbayar      -> kunci per user
+#   /login                   bcrypt                                  -> kunci per IP
+#   /register                bcrypt + email OTP                      -> kunci per IP
+#   /reset_password          email reset                             -> kunci per IP dan per alamat email
+#
+# Tiga lapis, dari yang paling murah:
+#   1. Token bucket per aturan + kunci: kapasitas = burst, terisi ulang rata sepanjang periode.
+#      RATE_LIMIT_<ATURAN>="<jumlah>/<detik>", mis. RATE_LIMIT_ASK="30/60".
+#   2. Batas request yang sedang berjalan (termasuk yang mengantri) per kunci, ASK_MAX_INFLIGHT_PER_USER.
+#   3. Antrian adil /ask per proses: paling banyak ASK_MAX_ACTIVE /ask berjalan bersamaan; sisanya
+#      menunggu dan dilayani round-robin per user, jadi user yang mengirim banyak request sekaligus
+#      tidak bisa menyerobot giliran user lain.
+# Lapis 1 dan 2 memakai backend memori (per proses) atau Postgres (RATE_LIMIT_BACKEND=postgres,
+# dibagi semua worker/instance). Jika Postgres bermasalah, request tetap diizinkan (fail-open).
+# Penolakan dilempar sebagai RateLimited (429) / QueueTimeout (503), keduanya dengan Retry-After.
+
+import os
+import math
+import time
+import uuid
+import random
+import logging
+import functools
+import threading
+from collections import OrderedDict, deque
+
+from flask import request, Response
+from flask_login import current_user
+
+from db import get_db_connection
+
+ENABLED = os.getenv("RATE_LIMIT", "1") == "1"
+# Di belakang proxy (Vercel) alamat klien asli ada di X-Forwarded-For
+TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "1" if os.getenv("VERCEL") else "0") == "1"
+
+# nama aturan -> (jumlah, periode detik, jenis kunci)
+DEFAULT_RULES = {
+    'ask': (30, 60, ('user',)),
+    'login': (10, 60, ('ip',)),
+    'register': (5, 3600, ('ip',)),
+    'reset_password': (5, 3600, ('ip', 'email')),
+}
+
+ASK_MAX_INFLIGHT_PER_USER = int(os.getenv("ASK_MAX_INFLIGHT_PER_USER", "3"))
+ASK_MAX_ACTIVE = int(os.getenv("ASK_MAX_ACTIVE", "8"))
+ASK_QUEUE_TIMEOUT = float(os.getenv("ASK_QUEUE_TIMEOUT", "15"))
+# Lease in-flight di Postgres kedaluwarsa sendiri jika worker mati sebelum sempat melepasnya
+LEASE_TTL = int(os.getenv("RATE_LIMIT_LEASE_TTL", "300"))
+
+
+class RateLimited(Exception):
+    """Kuota habis (token bucket) atau terlalu banyak request berjalan untuk kunci yang sama -> 429."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class QueueTimeout(Exception):
+    """Menunggu giliran di antrian /ask terlalu lama -> 503."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Rule:
+    def __init__(self, name, count, period, keys):
+        self.name = name
+        self.capacity = count
+        self.rate = count / period     # token per detik
+        self.keys = keys
+
+    @classmethod
+    def from_env(cls, name, count, period, keys):
+        value = os.getenv(f"RATE_LIMIT_{name.upper()}")
+        if value:
+            count, period = value.split("/", 1)
+        return cls(name, int(count), float(period), keys)
+
+
+class MemoryBackend:
+    """Bucket dan hitungan in-flight di memori proses. Thread-safe."""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()   # key -> (tokens, updated monotonic)
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate, cost=1):
+        """Mengembalikan (diizinkan, detik sampai token cukup)."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            # Bucket yang paling lama tidak dipakai dibuang; kalau dipakai lagi mulai dari penuh
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (cost - tokens) / rate
+
+    def acquire(self, key, limit):
+        with self._lock:
+            if self._inflight.get(key, 0) >= limit:
+                return None
+            self._inflight[key] = self._inflight.get(key, 0) + 1
+        return key
+
+    def release(self, lease):
+        with self._lock:
+            count = self._inflight.get(lease, 0) - 1
+            if count > 0:
+                self._inflight[lease] = count
+            else:
+                self._inflight.pop(lease, None)
+
+
+class PostgresBackend:
+    """
+    Bucket dan lease in-flight di tabel UNLOGGED rate_limit_buckets / rate_limit_leases (migrasi 7),
+    dibagi semua worker. Satu statement per pengecekan; isi ulang token dihitung di dalam UPDATE.
+    """
+
+    TAKE_SQL = """
+        INSERT INTO rate_limit_buckets AS b (key, tokens, allowed, updated_at)
+        VALUES (%(key)s, %(capacity)s - %(cost)s, TRUE, now())
+        ON CONFLICT (key) DO UPDATE SET
+            allowed = least(%(capacity)s, b.tokens + extract(epoch FROM now() - b.updated_at) * %(rate)s) >= %(cost)s,
+            tokens = least(%(capacity)s, b.tokens + extract(epoch FROM now() - b.updated_at) * %(rate)s)
+                     - CASE WHEN least(%(capacity)s, b.tokens + extract(epoch FROM now() - b.updated_at) * %(rate)s) >= %(cost)s
+                            THEN %(cost)s ELSE 0 END,
+            updated_at = now()
+        RETURNING tokens, allowed
+    """
+    # Advisory lock per kunci membuat hitung-lalu-sisip atomik tanpa mengunci seluruh tabel
+    ACQUIRE_SQL = """
+        SELECT pg_advisory_xact_lock(hashtext(%(key)s));
+        DELETE FROM rate_limit_leases WHERE key = %(key)s AND expires_at <= now();
+        INSERT INTO rate_limit_leases (id, key, expires_at)
+        SELECT %(id)s, %(key)s, now() + %(ttl)s * interval '1 second'
+        WHERE (SELECT count(*) FROM rate_limit_leases WHERE key = %(key)s) < %(limit)s
+        RETURNING id
+    """
+
+    def __init__(self, lease_ttl=LEASE_TTL):
+        self.lease_ttl = lease_ttl
+
+    def take(self, key, capacity, rate, cost=1):
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(self.TAKE_SQL, {'key': key, 'capacity': capacity, 'rate': rate, 'cost': cost})
+                tokens, allowed = cur.fetchone()
+                # Bucket yang sudah lama tidak dipakai pasti penuh lagi, jadi aman dihapus sesekali
+                if random.random() < 0.001:
+                    cur.execute("DELETE FROM rate_limit_buckets WHERE updated_at < now() - interval '1 day'")
+            conn.commit()
+        return allowed, 0.0 if allowed else (cost - tokens) / rate
+
+    def acquire(self, key, limit):
+        lease = str(uuid.uuid4())
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(self.ACQUIRE_SQL, {'key': key, 'id': lease, 'ttl': self.lease_ttl, 'limit': limit})
+                row = cur.fetchone()
+            conn.commit()
+        return lease if row else None
+
+    def release(self, lease):
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM rate_limit_leases WHERE id = %s", (lease,))
+            conn.commit()
+
+
+class FairQueue:
+    """
+    Slot eksekusi /ask per proses. Jika semua slot terpakai, request menunggu di antrian per user;
+    slot yang lepas diberikan round-robin ke user berikutnya yang sedang menunggu.
+    """
+
+    def __init__(self, max_active, timeout):
+        self.max_active = max_active
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiting = OrderedDict()    # user -> deque[Event], urutan = giliran round-robin
+        self._stats = {'admitted': 0, 'queued': 0, 'timeouts': 0}
+        self._max_wait = 0.0
+
+    def _waiting_count(self):
+        return sum(len(q) for q in self._waiting.values())
+
+    def acquire(self, user):
+        with self._lock:
+            if self._active < self.max_active and not self._waiting:
+                self._active += 1
+                self._stats['admitted'] += 1
+                return
+            event = threading.Event()
+            self._waiting.setdefault(user, deque()).append(event)
+            self._stats['queued'] += 1
+        start = time.monotonic()
+        granted = event.wait(self.timeout)
+        with self._lock:
+            if not granted and not event.is_set():
+                queue = self._waiting.get(user)
+                if queue is not None:
+                    queue.remove(event)
+                    if not queue:
+                        del self._waiting[user]
+                self._stats['timeouts'] += 1
+                raise QueueTimeout("Antrian /ask penuh, silakan coba lagi sebentar lagi.", retry_after=self.timeout / 3)
+            self._stats['admitted'] += 1
+            self._max_wait = max(self._max_wait, time.monotonic() - start)
+
+    def release(self):
+        with self._lock:
+            self._active -= 1
+            while self._active < self.max_active and self._waiting:
+                user, queue = self._waiting.popitem(last=False)
+                event = queue.popleft()
+                if queue:
+                    # User yang masih punya antrian pindah ke belakang giliran
+                    self._waiting[user] = queue
+                self._active += 1
+                event.set()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, active=self._active, max_active=self.max_active,
+                        waiting=self._waiting_count(), users_waiting=len(self._waiting),
+                        max_wait_seconds=round(self._max_wait, 3))
+
+
+class RateLimiter:
+    def __init__(self, backend, rules, ask_queue, max_inflight_per_user=ASK_MAX_INFLIGHT_PER_USER):
+        self.backend = backend
+        self.rules = rules
+        self.ask_queue = ask_queue
+        self.max_inflight_per_user = max_inflight_per_user
+        self._lock = threading.Lock()
+        self._stats = {name: {'allowed': 0, 'limited': 0} for name in rules}
+        self._counters = {'inflight_rejected': 0, 'backend_errors': 0}
+
+    def _count(self, key, name=None):
+        with self._lock:
+            if name is None:
+                self._counters[key] += 1
+            else:
+                self._stats[name][key] += 1
+
+    def _backend_call(self, fn, *args, default=None):
+        try:
+            return fn(*args)
+        except Exception as e:
+            # Limiter tidak boleh menjatuhkan route yang dilindunginya
+            self._count('backend_errors')
+            logging.warning(f"Backend rate limit gagal, request diizinkan: {e}")
+            return default
+
+    def check(self, rule_name, keys):
+        """Mengambil satu token dari bucket setiap kunci. Melempar RateLimited jika salah satunya habis."""
+        rule = self.rules[rule_name]
+        for key in keys:
+            allowed, retry_after = self._backend_call(self.backend.take, f"{rule.name}:{key}", rule.capacity, rule.rate,
+                                                      default=(True, 0.0))
+            if not allowed:
+                self._count('limited', rule.name)
+                raise RateLimited("Terlalu banyak permintaan, silakan coba lagi nanti.", retry_after)
+        self._count('allowed', rule.name)
+
+    def admit_ask(self, user_key):
+        """
+        Masuk ke antrian /ask. Mengembalikan fungsi release() yang wajib dipanggil tepat sekali
+        saat request (atau stream-nya) selesai.
+        """
+        lease = self._backend_call(self.backend.acquire, f"inflight:ask:{user_key}", self.max_inflight_per_user,
+                                   default=False)
+        if lease is None:
+            self._count('inflight_rejected')
+            raise RateLimited("Masih ada pertanyaan lain yang sedang diproses, tunggu sampai selesai.", retry_after=2)
+        try:
+            self.ask_queue.acquire(user_key)
+        except QueueTimeout:
+            if lease:
+                self._backend_call(self.backend.release, lease)
+            raise
+        released = []
+
+        def release():
+            if released:
+                return
+            released.append(True)
+            self.ask_queue.release()
+            if lease:
+                self._backend_call(self.backend.release, lease)
+        return release
+
+    def stats(self):
+        with self._lock:
+            return {'rules': {name: dict(values) for name, values in self._stats.items()},
+                    **self._counters, 'ask_queue': self.ask_queue.stats()}
+
+
+def client_ip():
+    if TRUST_PROXY and request.access_route:
+        return request.access_route[0]
+    return request.remote_addr or "unknown"
+
+
+def _keys(kinds):
+    keys = []
+    for kind in kinds:
+        if kind == 'user':
+            keys.append(f"user:{current_user.id}" if current_user.is_authenticated else f"ip:{client_ip()}")
+        elif kind == 'ip':
+            keys.append(f"ip:{client_ip()}")
+        elif kind == 'email':
+            email = (request.form.get('email') or "").strip().lower()
+            if email:
+                keys.append(f"email:{email}")
+    return keys
+
+
+def limited(rule_name, methods=('POST',), admit=False):
+    """
+    Dekorator view. admit=True juga memakai batas in-flight per user dan antrian adil /ask; untuk
+    respons streaming slot baru dilepas saat stream selesai (call_on_close).
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not ENABLED or request.method not in methods:
+                return view(*args, **kwargs)
+            rule = limiter.rules[rule_name]
+            limiter.check(rule_name, _keys(rule.keys))
+            if not admit:
+                return view(*args, **kwargs)
+            release = limiter.admit_ask(_keys(('user',))[0])
+            try:
+                response = view(*args, **kwargs)
+            except BaseException:
+                release()
+                raise
+            if isinstance(response, Response) and response.is_streamed:
+                response.call_on_close(release)
+            else:
+                release()
+            return response
+        return wrapper
+    return decorator
+
+
+def retry_after_header(seconds):
+    return str(max(1, math.ceil(seconds)))
+
+
+def _build_limiter():
+    rules = {name: Rule.from_env(name, *values) for name, values in DEFAULT_RULES.items()}
+    backend = PostgresBackend() if os.getenv("RATE_LIMIT_BACKEND", "memory") == "postgres" else MemoryBackend()
+    return RateLimiter(backend, rules, FairQueue(ASK_MAX_ACTIVE, ASK_QUEUE_TIMEOUT))
+
+
+limiter = _build_limiter()
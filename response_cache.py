@@ -0,0 +1,169 @@
+# response_cache.py
+# Cache jawaban untuk prompt yang berulang di /ask (mis. "siapa kamu?", "apa itu python").
+#
+# Opt-in lewat RESPONSE_CACHE=1. Hanya dipakai untuk giliran tanpa history (db_history kosong),
+# karena jawaban untuk percakapan yang sudah berjalan bergantung pada konteksnya.
+# Kunci = route (chat / search / weather) + prompt yang dinormalisasi. Dua tingkat lookup:
+#   1. exact   : prompt yang sama persis setelah normalisasi
+#   2. similar : kemiripan Jaccard trigram karakter >= RESPONSE_CACHE_SIMILARITY,
+#                dicari lewat indeks terbalik trigram -> kunci supaya tidak perlu memindai semua entri
+
+import os
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict, Counter
+
+from tool_cache import normalize_key
+
+ROUTES = ('chat', 'search', 'weather')
+DEFAULT_TTLS = {
+    'chat': 86400,
+    'search': 3600,
+    'weather': 600,
+}
+# Panggilan Gemini yang dihemat per hit. Jawaban cuaca disusun dari data API tanpa Gemini.
+GEMINI_CALLS_PER_ROUTE = {'chat': 1, 'search': 1, 'weather': 0}
+
+_DIGITS_RE = re.compile(r"\d+")
+# Ringkasan hit rate ditulis ke log setiap sekian lookup
+LOG_EVERY = int(os.getenv("RESPONSE_CACHE_LOG_EVERY", "100"))
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class ResponseCache:
+    def __init__(self, maxsize=2048, ttls=None, threshold=0.85, routes=ROUTES, max_prompt_chars=300):
+        self.maxsize = maxsize
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.default_ttl = DEFAULT_TTLS['search']
+        self.threshold = threshold
+        self.routes = frozenset(routes)
+        self.max_prompt_chars = max_prompt_chars
+        self._entries = OrderedDict()   # key -> (expires_at, answer, grams, digits)
+        self._index = {}                # (route, trigram) -> set(key)
+        self._lock = threading.Lock()
+        self._stats = {route: {'lookups': 0, 'exact_hits': 0, 'similar_hits': 0, 'misses': 0, 'stores': 0}
+                       for route in ROUTES}
+        self.evictions = 0
+
+    def enabled_for(self, route, prompt):
+        return route in self.routes and len(prompt) <= self.max_prompt_chars
+
+    def _remove(self, key):
+        _, _, grams, _ = self._entries.pop(key)
+        route = key.split(":", 1)[0]
+        for gram in grams:
+            keys = self._index.get((route, gram))
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._index[(route, gram)]
+
+    def _find_similar(self, route, grams, digits, now):
+        overlap = Counter()
+        for gram in grams:
+            for key in self._index.get((route, gram), ()):
+                overlap[key] += 1
+        best_key, best_score = None, 0.0
+        for key, shared in overlap.items():
+            expires_at, _, other_grams, other_digits = self._entries[key]
+            # Angka harus sama persis: "presiden ke 5" dan "presiden ke 6" mirip secara teks tapi beda jawaban
+            if expires_at <= now or other_digits != digits:
+                continue
+            score = shared / (len(grams) + len(other_grams) - shared)
+            if score > best_score:
+                best_key, best_score = key, score
+        if best_score >= self.threshold:
+            return best_key
+        return None
+
+    def get(self, route, prompt):
+        """Mengembalikan (jawaban, tingkat) tanpa mengubah statistik, atau (None, None)."""
+        if not self.enabled_for(route, prompt):
+            return None, None
+        text = normalize_key(prompt)
+        key = f"{route}:{text}"
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    return entry[1], 'exact'
+                self._remove(key)
+            grams = trigrams(text)
+            similar_key = self._find_similar(route, grams, tuple(_DIGITS_RE.findall(text)), now)
+            if similar_key is not None:
+                self._entries.move_to_end(similar_key)
+                return self._entries[similar_key][1], 'similar'
+        return None, None
+
+    def record(self, route, tier):
+        """Mencatat hasil lookup yang benar-benar dipakai (giliran tanpa history)."""
+        with self._lock:
+            stats = self._stats.setdefault(route, {'lookups': 0, 'exact_hits': 0, 'similar_hits': 0,
+                                                   'misses': 0, 'stores': 0})
+            stats['lookups'] += 1
+            stats[f"{tier}_hits" if tier else 'misses'] += 1
+            total = sum(values['lookups'] for values in self._stats.values())
+        if total % LOG_EVERY == 0:
+            summary = self.stats()
+            logging.info(f"Response cache: {total} lookup, hemat {summary['gemini_calls_saved']} panggilan Gemini, "
+                         + ", ".join(f"{r} hit rate {v['hit_rate']:.1%}" for r, v in summary['routes'].items() if v['lookups']))
+
+    def set(self, route, prompt, answer):
+        if not answer or not self.enabled_for(route, prompt):
+            return
+        text = normalize_key(prompt)
+        key = f"{route}:{text}"
+        grams = trigrams(text)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttls.get(route, self.default_ttl), answer, grams,
+                                  tuple(_DIGITS_RE.findall(text)))
+            for gram in grams:
+                self._index.setdefault((route, gram), set()).add(key)
+            self._stats[route]['stores'] += 1
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            routes = {}
+            for route, values in self._stats.items():
+                hits = values['exact_hits'] + values['similar_hits']
+                routes[route] = dict(values, hit_rate=round(hits / values['lookups'], 4) if values['lookups'] else 0.0,
+                                     gemini_calls_saved=hits * GEMINI_CALLS_PER_ROUTE.get(route, 1))
+            return {
+                'routes': routes,
+                'gemini_calls_saved': sum(r['gemini_calls_saved'] for r in routes.values()),
+                'size': len(self._entries),
+                'evictions': self.evictions,
+                'threshold': self.threshold,
+            }
+
+
+ENABLED = os.getenv("RESPONSE_CACHE", "0") == "1"
+
+
+def _build_cache():
+    ttls = {route: int(os.getenv(f"RESPONSE_CACHE_TTL_{route.upper()}", ttl)) for route, ttl in DEFAULT_TTLS.items()}
+    # Cuaca berubah cepat dan datanya sudah di-cache oleh tool_cache, jadi default-nya tidak ikut
+    routes = [r.strip() for r in os.getenv("RESPONSE_CACHE_ROUTES", "chat,search").split(",") if r.strip() in ROUTES]
+    return ResponseCache(
+        maxsize=int(os.getenv("RESPONSE_CACHE_SIZE", "2048")),
+        ttls=ttls,
+        threshold=float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.85")),
+        routes=routes,
+        max_prompt_chars=int(os.getenv("RESPONSE_CACHE_MAX_PROMPT_CHARS", "300")),
+    )
+
+
+response_cache = _build_cache()
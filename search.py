@@ -0,0 +1,153 @@
+# search.py
+# Pencarian full-text atas semua pesan milik user (/search), memakai kolom messages.search_vector
+# (tsvector yang diisi trigger, index GIN idx_messages_search) dan messages.user_id (index idx_messages_user_id).
+#
+# Meranking *semua* pesan yang cocok butuh membaca setiap barisnya; untuk kata umum pada user dengan
+# 100 ribu pesan itu puluhan ribu baris dan ratusan milidetik. Karena itu ranking dilakukan per jendela:
+# SEARCH_WINDOW pesan cocok yang paling baru diranking (ts_rank_cd) dan dipaginasi berdasarkan (rank, id);
+# setelah jendela habis, halaman berikutnya berlanjut ke jendela pesan cocok yang lebih lama.
+#
+# Jendela diambil dengan dua cara, tergantung seberapa sering kata itu muncul:
+# - kata umum: jalan mundur di index (user_id, id) atas SEARCH_RECENT_ROWS pesan terbaru sambil
+#   memfilter search_vector; jendela biasanya sudah penuh setelah beberapa ribu baris. Jika belum penuh
+#   tapi kepadatan kata di situ cukup untuk memenuhinya dalam SEARCH_MAX_SCAN_ROWS baris, jalan diperpanjang.
+# - kata jarang: bitmap scan GIN; barisnya sedikit jadi murah dibaca dan diurutkan.
+#
+# Pesan percakapan yang sedang diarsipkan (archive.py) tidak ikut dicari sampai percakapannya dibuka lagi;
+# archived_count() dipakai /search untuk memberi tahu user.
+
+import os
+import re
+import html
+
+from db import get_db_connection
+import tracing
+
+TS_CONFIG = "simple"
+SEARCH_WINDOW = int(os.getenv("SEARCH_WINDOW", "1000"))
+SEARCH_RECENT_ROWS = int(os.getenv("SEARCH_RECENT_ROWS", "10000"))
+SEARCH_MAX_SCAN_ROWS = int(os.getenv("SEARCH_MAX_SCAN_ROWS", "50000"))
+MAX_QUERY_CHARS = 200
+
+# Penanda highlight dari ts_headline memakai karakter Private Use Area supaya tidak bentrok dengan isi
+# pesan; snippet di-escape dulu, baru penandanya diganti <mark>.
+_MARK_START, _MARK_STOP = "\ue000", "\ue001"
+HEADLINE_OPTIONS = (f"StartSel={_MARK_START}, StopSel={_MARK_STOP}, MaxWords=30, MinWords=12, "
+                    "MaxFragments=2, FragmentDelimiter=\" … \"")
+
+RECENT_SQL = f"""
+    SELECT id, ts_rank_cd(search_vector, websearch_to_tsquery('{TS_CONFIG}', %(query)s))::float8 AS rank
+    FROM (
+        SELECT id, search_vector FROM messages
+        WHERE user_id = %(user_id)s AND id <= %(upper)s
+        ORDER BY id DESC LIMIT %(scan)s
+    ) recent
+    WHERE search_vector @@ websearch_to_tsquery('{TS_CONFIG}', %(query)s)
+    ORDER BY id DESC LIMIT %(window)s
+"""
+
+# `id + 0` mencegah planner memilih jalan mundur di index (user_id, id): jalur ini hanya dipakai untuk
+# kata yang jarang, dan di situ bitmap GIN jauh lebih murah daripada memfilter seluruh pesan user.
+MATCHES_SQL = f"""
+    SELECT id, ts_rank_cd(search_vector, websearch_to_tsquery('{TS_CONFIG}', %(query)s))::float8 AS rank
+    FROM messages
+    WHERE user_id = %(user_id)s AND id <= %(upper)s
+      AND search_vector @@ websearch_to_tsquery('{TS_CONFIG}', %(query)s)
+    ORDER BY id + 0 DESC LIMIT %(window)s
+"""
+
+ARCHIVED_COUNT_SQL = "SELECT count(*) FROM conversations WHERE user_id = %(user_id)s AND archived_at IS NOT NULL"
+
+SNIPPET_SQL = f"""
+    SELECT m.id, m.conversation_id, c.title, m.role, m.timestamp,
+           ts_headline('{TS_CONFIG}', m.content, websearch_to_tsquery('{TS_CONFIG}', %(query)s), %(options)s) AS snippet
+    FROM messages m JOIN conversations c ON c.id = m.conversation_id
+    WHERE m.id = ANY(%(ids)s) AND m.user_id = %(user_id)s
+"""
+
+_WORD_RE = re.compile(r"\w")
+
+
+def _snippet_html(headline):
+    return html.escape(headline, quote=False).replace(_MARK_START, "<mark>").replace(_MARK_STOP, "</mark>")
+
+
+def _window(cur, params):
+    """(id, rank) pesan cocok di jendela, terbaru dulu, maksimal SEARCH_WINDOW baris."""
+    cur.execute(RECENT_SQL, dict(params, scan=SEARCH_RECENT_ROWS))
+    rows = cur.fetchall()
+    if len(rows) == SEARCH_WINDOW:
+        return rows
+    # Perkiraan baris yang perlu dijalani untuk memenuhi jendela, dari kepadatan kata di pesan terbaru
+    needed = SEARCH_RECENT_ROWS * SEARCH_WINDOW * 1.2 / len(rows) if rows else None
+    if needed and needed <= SEARCH_MAX_SCAN_ROWS:
+        # Lanjut dari pesan cocok terakhir, bukan mengulang dari awal
+        cur.execute(RECENT_SQL, dict(params, upper=rows[-1][0] - 1, scan=SEARCH_MAX_SCAN_ROWS - SEARCH_RECENT_ROWS,
+                                     window=SEARCH_WINDOW - len(rows)))
+        rows += cur.fetchall()
+        if len(rows) == SEARCH_WINDOW:
+            return rows
+    cur.execute(MATCHES_SQL, params)
+    return cur.fetchall()
+
+
+@tracing.traced('db.search')
+def search_messages(user_id, query, limit, cursor=None):
+    """
+    Satu halaman hasil pencarian, urut dari yang paling relevan di dalam jendela.
+    `cursor` adalah nilai hasil decode next_cursor halaman sebelumnya: [upper] untuk mulai jendela baru
+    di bawah id `upper`, atau [upper, rank, id] untuk melanjutkan di jendela yang sama.
+    Mengembalikan (hasil, next_cursor_values); next_cursor_values None jika tidak ada halaman lagi.
+    """
+    query = query[:MAX_QUERY_CHARS]
+    if not _WORD_RE.search(query):
+        return [], None
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            if cursor:
+                upper = cursor[0]
+            else:
+                # Batas atas dikunci di cursor supaya pesan baru tidak menggeser jendela antar halaman
+                cur.execute("SELECT max(id) FROM messages WHERE user_id = %s", (user_id,))
+                upper = cur.fetchone()[0]
+                if upper is None:
+                    return [], None
+            params = {'user_id': user_id, 'query': query, 'upper': upper, 'window': SEARCH_WINDOW}
+            window = _window(cur, params)
+
+            ranked = sorted(window, key=lambda row: (row[1], row[0]), reverse=True)
+            if cursor and len(cursor) == 3:
+                after = (cursor[1], cursor[2])
+                ranked = [row for row in ranked if (row[1], row[0]) < after]
+            page = ranked[:limit]
+
+            results = []
+            if page:
+                cur.execute(SNIPPET_SQL, {'ids': [row[0] for row in page], 'user_id': user_id,
+                                          'query': query, 'options': HEADLINE_OPTIONS})
+                found = {row[0]: row for row in cur.fetchall()}
+                for message_id, rank in page:
+                    if message_id not in found:
+                        continue  # percakapan dihapus di antara dua query
+                    _, conversation_id, title, role, timestamp, snippet = found[message_id]
+                    results.append({
+                        'message_id': message_id, 'conversation_id': conversation_id, 'title': title,
+                        'role': role, 'timestamp': timestamp.isoformat(), 'rank': rank,
+                        'snippet': _snippet_html(snippet),
+                    })
+
+    if len(ranked) > limit:
+        last_id, last_rank = page[-1]
+        return results, (upper, last_rank, last_id)
+    if len(window) == SEARCH_WINDOW:
+        # Jendela ini habis; masih mungkin ada pesan cocok yang lebih lama
+        return results, (min(row[0] for row in window) - 1,)
+    return results, None
+
+
+def archived_count(user_id):
+    """Jumlah percakapan user yang pesannya sedang di arsip (tidak terjangkau pencarian)."""
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(ARCHIVED_COUNT_SQL, {'user_id': user_id})
+            return cur.fetchone()[0]
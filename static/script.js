@@ -10,6 +10,7 @@ document.addEventListener('DOMContentLoaded', () => {
     const historySidebar = document.getElementById('history-sidebar');
     const closeHistoryBtn = document.getElementById('close-history-btn');
     const historyList = document.getElementById('history-list');
+    const historySearch = document.getElementById('history-search');
     const sidebarOverlay = document.getElementById('sidebar-overlay');
     const profileBtn = document.getElementById('profile-icon-btn');
     const profileDropdown = document.getElementById('profile-dropdown');
@@ -18,14 +19,24 @@ document.addEventListener('DOMContentLoaded', () => {
     // === 2. State Aplikasi ===
     let currentConversationId = null;
     let isLoading = false;
+    let historyItems = new Map();   // id -> {id, title, timestamp, updated_at}
+    let historySyncedAt = null;     // `synced_at` terakhir dari /history, untuk mode ?since=
+    let historyNextCursor = null;   // cursor halaman history berikutnya
+    let searchQuery = '';           // kata kunci aktif di kotak pencarian sidebar ('' = tampilkan history)
+    let searchNextCursor = null;    // cursor halaman hasil /search berikutnya
+    let searchTimer = null;
+    // SERVER_RENDER=1: pesan AI lama diterima sebagai HTML jadi (sudah disanitasi + di-highlight server)
+    const serverRender = document.body.dataset.serverRender === '1';
+    const renderParam = serverRender ? '&render=html' : '';
+    const MAX_STREAM_ATTEMPTS = 3;  // percobaan /ask/stream per pesan (koneksi putus, server sibuk)
 
     // === 3. Fungsi-fungsi Inti ===
 
     /** Menampilkan pesan di UI, dengan parsing Markdown untuk AI */
     // static/script.js
 
-/** Menampilkan pesan di UI, dengan parsing Markdown untuk AI */
-const appendMessage = (text, sender) => {
+/** Menampilkan pesan di UI, dengan parsing Markdown untuk AI (atau `html` yang sudah dirender server) */
+const appendMessage = (text, sender, html) => {
     const chatContainer = document.getElementById('chat-area'); // Pastikan ini didefinisikan di atas
     
     // Hapus indikator loading jika ada
@@ -36,22 +47,31 @@ const appendMessage = (text, sender) => {
     messageDiv.className = `chat-message ${sender}-message`;
 
     // Ubah Markdown menjadi HTML
-    if (sender === 'ai' && window.marked) {
+    if (sender === 'ai' && html) {
+        messageDiv.innerHTML = html;
+    } else if (sender === 'ai' && window.marked) {
         messageDiv.innerHTML = marked.parse(text, { sanitize: true });
     } else {
         messageDiv.textContent = text;
     }
     
     chatContainer.appendChild(messageDiv);
+    enhanceCodeBlocks(messageDiv);
 
+    chatContainer.scrollTop = chatContainer.scrollHeight;
+    return messageDiv;
+};
+
+/** Syntax highlighting + tombol "Copy" untuk semua blok kode di dalam sebuah pesan */
+const enhanceCodeBlocks = (messageDiv) => {
     // --- 👇 BAGIAN BARU UNTUK TOMBOL COPY & SYNTAX HIGHLIGHTING 👇 ---
 
     // Cari semua blok kode di dalam pesan yang baru ditambahkan
     const codeBlocks = messageDiv.querySelectorAll('pre code');
     
     codeBlocks.forEach((block) => {
-        // 1. Terapkan pewarnaan (Syntax Highlighting)
-        if (window.hljs) {
+        // 1. Terapkan pewarnaan (Syntax Highlighting), kecuali blok yang sudah di-highlight server
+        if (window.hljs && !block.classList.contains('highlight')) {
             hljs.highlightElement(block);
         }
 
@@ -80,8 +100,6 @@ const appendMessage = (text, sender) => {
         });
     });
     // --- 👆 AKHIR BAGIAN BARU 👆 ---
-
-    chatContainer.scrollTop = chatContainer.scrollHeight;
 };
     
     /** Menampilkan indikator "mengetik..." */
@@ -93,38 +111,249 @@ const appendMessage = (text, sender) => {
         chatContainer.scrollTop = chatContainer.scrollHeight;
     };
 
-    /** Mengambil dan menampilkan daftar history di sidebar */
+    /** Idempotency-Key baru per pesan; crypto.randomUUID hanya ada di secure context (https/localhost) */
+    const newIdempotencyKey = () => (window.crypto && crypto.randomUUID)
+        ? crypto.randomUUID()
+        : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}${Math.random().toString(36).slice(2)}`;
+
+    /** Error jaringan/server sibuk yang boleh dicoba ulang dengan Idempotency-Key yang sama */
+    const retryableError = (message) => Object.assign(new Error(message), { retryable: true });
+
+    /**
+     * Mengirim prompt ke /ask/stream dan merender jawaban AI sedikit demi sedikit.
+     * Markdown di-parse ulang per frame; highlight.js baru dijalankan setelah stream selesai.
+     * Koneksi putus atau server sibuk dicoba ulang dengan Idempotency-Key yang sama: server menyambung ke
+     * jawaban yang masih berjalan atau memutar ulang yang sudah jadi, jadi pertanyaan tidak diproses
+     * (dan tidak tersimpan) dua kali.
+     */
+    const streamAnswer = async (userText, conversationId) => {
+        const idempotencyKey = newIdempotencyKey();
+        const state = { messageDiv: null };
+        for (let attempt = 1; ; attempt++) {
+            try {
+                await streamAttempt(userText, conversationId, idempotencyKey, state);
+                return;
+            } catch (error) {
+                if (!error.retryable || attempt >= MAX_STREAM_ATTEMPTS) throw error;
+                await new Promise(resolve => setTimeout(resolve, 1000 * attempt));
+            }
+        }
+    };
+
+    const streamAttempt = async (userText, conversationId, idempotencyKey, state) => {
+        let response;
+        try {
+            response = await fetch('/ask/stream', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json', 'Idempotency-Key': idempotencyKey },
+                body: JSON.stringify({ prompt: userText, conversation_id: conversationId }),
+            });
+        } catch (error) {
+            throw retryableError('Koneksi ke server terputus.');
+        }
+        if (response.status === 429 || response.status === 503) {
+            const data = await response.json().catch(() => null);
+            const message = (data && data.error) || 'Server sedang sibuk, silakan coba lagi sebentar lagi.';
+            throw response.status === 503 ? retryableError(message) : new Error(message);
+        }
+        if (!response.ok || !response.body) throw new Error('Respons dari server tidak baik.');
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        // Setiap percobaan menerima jawaban dari awal, jadi jawaban percobaan sebelumnya ditimpa
+        let answer = '';
+        let finished = false;
+        let renderPending = false;
+
+        const render = () => {
+            renderPending = false;
+            state.messageDiv.innerHTML = window.marked ? marked.parse(answer, { sanitize: true }) : answer;
+            chatContainer.scrollTop = chatContainer.scrollHeight;
+        };
+
+        while (true) {
+            let chunk;
+            try {
+                chunk = await reader.read();
+            } catch (error) {
+                throw retryableError('Koneksi ke server terputus.');
+            }
+            const { value, done } = chunk;
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            // Setiap event SSE dipisahkan oleh baris kosong
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let eventName = 'message';
+                let dataLine = '';
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event: ')) eventName = line.slice(7);
+                    else if (line.startsWith('data: ')) dataLine += line.slice(6);
+                });
+                if (!dataLine) continue;
+                const payload = JSON.parse(dataLine);
+
+                if (eventName === 'error') throw new Error(payload.error);
+                if (eventName === 'done') {
+                    finished = true;
+                    continue;
+                }
+
+                if (!state.messageDiv) state.messageDiv = appendMessage('', 'ai');
+                answer += payload.delta;
+                if (!renderPending) {
+                    renderPending = true;
+                    requestAnimationFrame(render);
+                }
+            }
+        }
+        // Stream berakhir tanpa event 'done': koneksi putus di tengah jawaban
+        if (!finished) throw retryableError('Koneksi ke server terputus.');
+
+        if (!state.messageDiv) state.messageDiv = appendMessage('', 'ai');
+        render();
+        enhanceCodeBlocks(state.messageDiv);
+    };
+
+    /** Menampilkan daftar history dari state lokal (tanpa request ke server) */
+    const renderHistory = () => {
+        if (searchQuery) return; // sidebar sedang menampilkan hasil pencarian
+        historyList.innerHTML = '';
+
+        if (historyItems.size === 0) {
+            historyList.innerHTML = '<li class="empty-history">Belum ada riwayat.</li>';
+            return;
+        }
+
+        const conversations = [...historyItems.values()].sort((a, b) => b.timestamp.localeCompare(a.timestamp));
+        conversations.forEach(conv => {
+            const li = document.createElement('li');
+            li.dataset.id = conv.id;
+            // Menambahkan highlight jika ID-nya sama dengan chat yang sedang aktif
+            if (conv.id == currentConversationId) {
+                li.classList.add('active');
+            }
+            li.innerHTML = `
+                <span class="history-title">${conv.title}</span>
+                <button class="delete-chat-btn" data-id="${conv.id}">
+                    <svg xmlns="http://www.w3.org/2000/svg" width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><polyline points="3 6 5 6 21 6"></polyline><path d="M19 6v14a2 2 0 0 1-2 2H7a2 2 0 0 1-2-2V6m3 0V4a2 2 0 0 1 2-2h4a2 2 0 0 1 2 2v2"></path></svg>
+                </button>
+            `;
+            historyList.appendChild(li);
+        });
+
+        if (historyNextCursor) {
+            const loadMore = document.createElement('li');
+            loadMore.className = 'empty-history load-more-history';
+            loadMore.textContent = 'Muat lebih banyak...';
+            historyList.appendChild(loadMore);
+        }
+    };
+
+    /**
+     * Sinkronisasi history di sidebar.
+     * Request pertama memuat halaman terbaru; setelahnya hanya percakapan yang berubah sejak
+     * sinkronisasi terakhir (?since=). Respons yang tidak berubah dijawab 304 oleh server.
+     */
     const fetchAndRenderHistory = async () => {
         try {
-            const response = await fetch('/history');
+            const url = historySyncedAt ? `/history?since=${encodeURIComponent(historySyncedAt)}` : '/history';
+            const response = await fetch(url);
             if (!response.ok) throw new Error('Gagal mengambil riwayat.');
-            
-            const conversations = await response.json();
-            historyList.innerHTML = '';
-            
-            if (conversations.length === 0) {
-                historyList.innerHTML = '<li class="empty-history">Belum ada riwayat.</li>';
-                return;
+
+            const data = await response.json();
+            if (data.resync) {
+                // Terlalu banyak perubahan untuk satu delta, mulai ulang dari halaman pertama
+                historySyncedAt = null;
+                return fetchAndRenderHistory();
+            }
+            if (!historySyncedAt) {
+                historyItems.clear();
+                historyNextCursor = data.next_cursor;
             }
+            data.conversations.forEach(conv => historyItems.set(conv.id, conv));
+            // Percakapan yang dihapus di tab/perangkat lain
+            (data.deleted || []).forEach(id => historyItems.delete(id));
+            historySyncedAt = data.synced_at || historySyncedAt;
+            renderHistory();
+        } catch (error) {
+            console.error('Error fetching history:', error);
+            historyList.innerHTML = '<li class="empty-history">Gagal memuat.</li>';
+        }
+    };
 
-            conversations.forEach(conv => {
-                const li = document.createElement('li');
-                li.dataset.id = conv.id;
-                // Menambahkan highlight jika ID-nya sama dengan chat yang sedang aktif
-                if (conv.id == currentConversationId) {
-                    li.classList.add('active');
+    /** Menambahkan hasil /search ke sidebar; snippet sudah berupa HTML ter-escape dari server (<mark> saja) */
+    const appendSearchResults = (results) => {
+        historyList.querySelector('.load-more-search')?.remove();
+        results.forEach(result => {
+            const li = document.createElement('li');
+            li.dataset.id = result.conversation_id;
+            li.className = 'search-result';
+            const title = document.createElement('span');
+            title.className = 'history-title';
+            title.textContent = result.title;
+            const snippet = document.createElement('div');
+            snippet.className = 'search-snippet';
+            snippet.innerHTML = result.snippet;
+            li.append(title, snippet);
+            historyList.appendChild(li);
+        });
+        if (searchNextCursor) {
+            const loadMore = document.createElement('li');
+            loadMore.className = 'empty-history load-more-search';
+            loadMore.textContent = 'Hasil lainnya...';
+            historyList.appendChild(loadMore);
+        }
+    };
+
+    /** Pencarian full-text di semua percakapan; tanpa cursor memulai daftar hasil baru */
+    const searchHistory = async (cursor = null) => {
+        const query = searchQuery;
+        const params = new URLSearchParams({ q: query, limit: 20 });
+        if (cursor) params.set('cursor', cursor);
+        try {
+            const response = await fetch(`/search?${params}`);
+            if (!response.ok) throw new Error('Gagal mencari.');
+            const data = await response.json();
+            if (query !== searchQuery) return; // kata kunci sudah berubah selagi menunggu
+            if (!cursor) {
+                historyList.innerHTML = '';
+                if (data.results.length === 0) {
+                    historyList.innerHTML = '<li class="empty-history">Tidak ada hasil.</li>';
                 }
-                li.innerHTML = `
-                    <span class="history-title">${conv.title}</span>
-                    <button class="delete-chat-btn" data-id="${conv.id}">
-                        <svg xmlns="http://www.w3.org/2000/svg" width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><polyline points="3 6 5 6 21 6"></polyline><path d="M19 6v14a2 2 0 0 1-2 2H7a2 2 0 0 1-2-2V6m3 0V4a2 2 0 0 1 2-2h4a2 2 0 0 1 2 2v2"></path></svg>
-                    </button>
-                `;
-                historyList.appendChild(li);
-            });
+            }
+            searchNextCursor = data.next_cursor;
+            appendSearchResults(data.results);
+            if (data.archived_conversations > 0) {
+                // Pesan percakapan arsip baru ikut dicari setelah percakapannya dibuka lagi
+                const note = document.createElement('li');
+                note.className = 'empty-history search-archived-note';
+                note.textContent = `${data.archived_conversations} percakapan lama diarsipkan dan tidak ikut dicari sampai dibuka lagi.`;
+                historyList.prepend(note);
+            }
+        } catch (error) {
+            console.error('Error searching history:', error);
+            historyList.innerHTML = '<li class="empty-history">Gagal mencari.</li>';
+        }
+    };
+
+    /** Memuat halaman history berikutnya (lebih lama) */
+    const loadMoreHistory = async () => {
+        if (!historyNextCursor) return;
+        try {
+            const response = await fetch(`/history?cursor=${encodeURIComponent(historyNextCursor)}`);
+            if (!response.ok) throw new Error('Gagal mengambil riwayat.');
+            const data = await response.json();
+            data.conversations.forEach(conv => historyItems.set(conv.id, conv));
+            historyNextCursor = data.next_cursor;
+            renderHistory();
         } catch (error) {
             console.error('Error fetching history:', error);
-            historyList.innerHTML = '<li class="empty-history">Gagal memuat.</li>';
         }
     };
     
@@ -146,15 +375,16 @@ const appendMessage = (text, sender) => {
         showTypingIndicator();
 
         try {
-            const response = await fetch(`/conversation/${id}`);
+            const response = await fetch(`/conversation/${id}${serverRender ? '?render=html' : ''}`);
             if (!response.ok) throw new Error('Gagal memuat percakapan.');
             
-            const messages = await response.json();
+            const data = await response.json();
             chatContainer.innerHTML = ''; 
             
-            messages.forEach(msg => {
-                appendMessage(msg.content, msg.role === 'assistant' ? 'ai' : 'user');
+            data.messages.forEach(msg => {
+                appendMessage(msg.content, msg.role === 'assistant' ? 'ai' : 'user', msg.html);
             });
+            showOlderMessagesButton(id, data.next_cursor);
             promptInput.focus();
             await fetchAndRenderHistory(); // Muat ulang history untuk menandai item aktif
         } catch (error) {
@@ -163,11 +393,47 @@ const appendMessage = (text, sender) => {
         }
     };
 
+    /** Tombol di atas chat untuk memuat pesan yang lebih lama (percakapan panjang dimuat per halaman) */
+    const showOlderMessagesButton = (id, cursor) => {
+        const existing = chatContainer.querySelector('.load-older-messages');
+        if (existing) existing.remove();
+        if (!cursor) return;
+
+        const button = document.createElement('button');
+        button.className = 'nav-button load-older-messages';
+        button.textContent = 'Muat pesan sebelumnya';
+        button.addEventListener('click', () => loadOlderMessages(id, cursor));
+        chatContainer.prepend(button);
+    };
+
+    const loadOlderMessages = async (id, cursor) => {
+        try {
+            const response = await fetch(`/conversation/${id}?before=${encodeURIComponent(cursor)}${renderParam}`);
+            if (!response.ok) throw new Error('Gagal memuat percakapan.');
+            const data = await response.json();
+            if (currentConversationId != id) return;
+
+            // Pertahankan posisi scroll saat pesan lama disisipkan di atas
+            const previousHeight = chatContainer.scrollHeight;
+            const previousTop = chatContainer.scrollTop;
+            const anchor = chatContainer.querySelector('.load-older-messages').nextSibling;
+            data.messages.forEach(msg => {
+                const messageDiv = appendMessage(msg.content, msg.role === 'assistant' ? 'ai' : 'user', msg.html);
+                chatContainer.insertBefore(messageDiv, anchor);
+            });
+            showOlderMessagesButton(id, data.next_cursor);
+            chatContainer.scrollTop = chatContainer.scrollHeight - previousHeight + previousTop;
+        } catch (error) {
+            console.error('Error loading older messages:', error);
+        }
+    };
+
     /** Menghapus percakapan */
     const handleDelete = async (id, listItemElement) => {
         if (!confirm('Anda yakin ingin menghapus percakapan ini secara permanen?')) return;
         try {
             await fetch(`/delete_conversation/${id}`, { method: 'DELETE' });
+            historyItems.delete(id);
             listItemElement.remove();
             if (historyList.children.length === 0) {
                 historyList.innerHTML = '<li class="empty-history">Belum ada riwayat.</li>';
@@ -216,15 +482,7 @@ const appendMessage = (text, sender) => {
                 conversationIdForRequest = currentConversationId;
             }
 
-            const response = await fetch('/ask', { 
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ prompt: userText, conversation_id: conversationIdForRequest }),
-            });
-
-            if (!response.ok) throw new Error('Respons dari server tidak baik.');
-            const data = await response.json();
-            appendMessage(data.answer, 'ai');
+            await streamAnswer(userText, conversationIdForRequest);
 
             await fetchAndRenderHistory(); // Selalu update history setelah ada pesan baru
 
@@ -245,11 +503,28 @@ const appendMessage = (text, sender) => {
     //     await fetchAndRenderHistory();
     //     toggleSidebar();
     // });
+    historySearch.addEventListener('input', () => {
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(() => {
+            searchQuery = historySearch.value.trim();
+            searchNextCursor = null;
+            if (searchQuery) searchHistory();
+            else renderHistory();
+        }, 300);
+    });
     closeHistoryBtn.addEventListener('click', () => toggleSidebar(true));
     sidebarOverlay.addEventListener('click', () => toggleSidebar(true));
 
     /** Listener untuk daftar history (memuat dan menghapus) */
     historyList.addEventListener('click', (e) => {
+        if (e.target.closest('.load-more-history')) {
+            loadMoreHistory();
+            return;
+        }
+        if (e.target.closest('.load-more-search')) {
+            searchHistory(searchNextCursor);
+            return;
+        }
         const targetListItem = e.target.closest('li[data-id]');
         if (!targetListItem) return;
 
@@ -0,0 +1,6 @@
+# Modul aplikasi ada di root repo (tanpa package); tes di sini tidak butuh Postgres maupun API eksternal,
+# kecuali tes antrian email yang dilewati jika TEST_POSTGRES_URL tidak diset.
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
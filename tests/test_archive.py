@@ -0,0 +1,32 @@
+import datetime
+
+import pytest
+
+import archive
+
+pytest.importorskip("zstandard")
+
+
+def test_pack_unpack_round_trip():
+    rows = [
+        [1, "user", "Halo, apa kabar? 你好 🌏", 12, "2024-01-02 03:04:05+00:00", None],
+        [2, "assistant", "Baik! " + "x" * 5000, 1300, "2024-01-02 03:04:06+00:00", "ex-1"],
+    ]
+    raw_len, payload = archive._pack(rows)
+    assert raw_len > len(payload)
+    restored = archive._unpack(archive.CODEC, payload)
+    assert restored == [dict(zip(archive.COLUMNS, row)) for row in rows]
+    # Payload dari kolom bytea (memoryview) juga bisa dibuka
+    assert archive._unpack(archive.CODEC, memoryview(payload)) == restored
+
+
+def test_timestamps_are_stored_as_text():
+    ts = datetime.datetime(2024, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc)
+    _, payload = archive._pack([[1, "user", "hai", 4, ts, None]])
+    assert archive._unpack(archive.CODEC, payload)[0]["timestamp"] == str(ts)
+
+
+def test_unknown_codec_is_rejected():
+    _, payload = archive._pack([])
+    with pytest.raises(ValueError):
+        archive._unpack("gzip+json", payload)
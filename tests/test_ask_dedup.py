@@ -0,0 +1,306 @@
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime, timezone
+
+import pytest
+
+import ask_dedup
+from ask_dedup import AskDeduplicator, ClientDisconnected, IdempotencyConflict, exchange_id_for, request_hash
+
+CLAIM = (7, datetime(2026, 1, 1, tzinfo=timezone.utc))
+
+
+@pytest.fixture(autouse=True)
+def fast_poll(monkeypatch):
+    monkeypatch.setattr(ask_dedup, "POLL_INTERVAL", 0.01)
+
+
+class FakeStore:
+    """Pengganti RequestStore: claim() mengembalikan `claim_result`, panggilan lain dicatat."""
+
+    def __init__(self, claim_result=(CLAIM, None, None, None)):
+        self.claim_result = claim_result
+        self.calls = []
+
+    def claim(self, *args):
+        self.calls.append(('claim',) + args)
+        if isinstance(self.claim_result, Exception):
+            raise self.claim_result
+        return self.claim_result
+
+    def finish(self, *args):
+        self.calls.append(('finish',) + args)
+
+    def release(self, *args):
+        self.calls.append(('release',) + args)
+
+    def cancelled(self, *args):
+        self.calls.append(('cancelled',) + args)
+
+    def names(self):
+        return [call[0] for call in self.calls]
+
+
+class Pipeline:
+    """start() palsu: setiap panggilan membuat Future yang diselesaikan sendiri oleh tes."""
+
+    def __init__(self):
+        self.futures = []
+        self.exchange_ids = []
+        self.on_chunk = None
+
+    def start(self, exchange_id, on_chunk):
+        self.exchange_ids.append(exchange_id)
+        self.on_chunk = on_chunk
+        future = Future()
+        self.futures.append(future)
+        return future
+
+
+def _wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timeout"
+        time.sleep(0.005)
+
+
+def _run_in_thread(dedup, pipeline, results, prompt="halo", key=None, gone=lambda: False):
+    def target():
+        try:
+            results.append(dedup.run(1, "c1", prompt, key, pipeline.start, gone))
+        except Exception as e:
+            results.append(e)
+    t = threading.Thread(target=target)
+    t.start()
+    return t
+
+
+def test_identical_requests_share_one_pipeline_run():
+    store, pipeline = FakeStore(), Pipeline()
+    dedup = AskDeduplicator(store)
+    results = []
+    threads = [_run_in_thread(dedup, pipeline, results) for _ in range(3)]
+    _wait_for(lambda: dedup.stats()['waiting'] == 3)
+
+    pipeline.futures[0].set_result("jawaban")
+    for t in threads:
+        t.join()
+
+    assert results == ["jawaban"] * 3
+    assert len(pipeline.futures) == 1
+    # Tanpa Idempotency-Key tidak ada yang dicatat di ask_requests
+    assert store.calls == [] and pipeline.exchange_ids == [None]
+    stats = dedup.stats()
+    assert stats['started'] == 1 and stats['coalesced'] == 2 and stats['in_flight'] == 0
+
+
+def test_different_prompts_run_separately():
+    pipeline = Pipeline()
+    dedup = AskDeduplicator(FakeStore())
+    results = []
+    threads = [_run_in_thread(dedup, pipeline, results, prompt=p) for p in ("satu", "dua")]
+    _wait_for(lambda: len(pipeline.futures) == 2)
+    for future in pipeline.futures:
+        future.set_result("ok")
+    for t in threads:
+        t.join()
+    assert dedup.stats()['coalesced'] == 0
+
+
+def test_idempotency_key_claim_finish_and_replay():
+    store, pipeline = FakeStore(), Pipeline()
+    dedup = AskDeduplicator(store)
+    results = []
+    t = _run_in_thread(dedup, pipeline, results, key="k1")
+    _wait_for(lambda: pipeline.futures)
+    pipeline.futures[0].set_result("jawaban")
+    t.join()
+
+    assert results == ["jawaban"]
+    assert pipeline.exchange_ids == [exchange_id_for(1, "k1", CLAIM)]
+    assert store.calls[-1] == ('finish', 7, "jawaban", 0)
+
+    # Request ulang dengan key yang sama: jawaban tersimpan diputar ulang tanpa pipeline
+    store.claim_result = (None, 'done', "jawaban", request_hash("c1", "halo"))
+    assert dedup.run(1, "c1", "halo", "k1", pipeline.start, lambda: False) == "jawaban"
+    assert len(pipeline.futures) == 1 and dedup.stats()['replayed'] == 1
+
+
+def test_exchange_id_changes_with_claim():
+    first = exchange_id_for(1, "k1", CLAIM)
+    assert first == exchange_id_for(1, "k1", CLAIM)
+    # Key yang dipakai ulang setelah TTL mendapat klaim baru, jadi exchange_id baru
+    assert first != exchange_id_for(1, "k1", (7, datetime(2026, 1, 2, tzinfo=timezone.utc)))
+    assert first != exchange_id_for(2, "k1", CLAIM)
+
+
+def test_idempotency_key_reused_for_other_prompt_conflicts():
+    store = FakeStore((None, 'done', "jawaban", request_hash("c1", "prompt lain")))
+    dedup = AskDeduplicator(store)
+    with pytest.raises(IdempotencyConflict):
+        dedup.run(1, "c1", "halo", "k1", Pipeline().start, lambda: False)
+    assert dedup.stats()['conflicts'] == 1
+
+
+def test_failed_pipeline_releases_claim():
+    store, pipeline = FakeStore(), Pipeline()
+    dedup = AskDeduplicator(store)
+    results = []
+    t = _run_in_thread(dedup, pipeline, results, key="k1")
+    _wait_for(lambda: pipeline.futures)
+    pipeline.futures[0].set_exception(RuntimeError("gemini error"))
+    t.join()
+    assert isinstance(results[0], RuntimeError)
+    assert store.calls[-1] == ('release', 7)
+
+
+def test_store_errors_fail_open():
+    pipeline = Pipeline()
+    dedup = AskDeduplicator(FakeStore(RuntimeError("database down")))
+    results = []
+    t = _run_in_thread(dedup, pipeline, results, key="k1")
+    _wait_for(lambda: pipeline.futures)
+    pipeline.futures[0].set_result("jawaban")
+    t.join()
+    assert results == ["jawaban"] and pipeline.exchange_ids == [None]
+    assert dedup.stats()['store_errors'] == 1
+
+
+def test_pipeline_cancelled_only_when_last_waiter_leaves():
+    store, pipeline = FakeStore(), Pipeline()
+    dedup = AskDeduplicator(store)
+    gone = [False, False]
+    results = []
+    threads = [_run_in_thread(dedup, pipeline, results, key="k1", gone=lambda i=i: gone[i]) for i in range(2)]
+    _wait_for(lambda: dedup.stats()['waiting'] == 2)
+    future = pipeline.futures[0]
+
+    gone[0] = True
+    threads[0].join()
+    assert isinstance(results[0], ClientDisconnected)
+    assert not future.cancelled()
+
+    gone[1] = True
+    threads[1].join()
+    assert isinstance(results[1], ClientDisconnected)
+    assert future.cancelled()
+    assert store.names() == ['claim', 'cancelled']
+    assert store.calls[-1][1:5] == (7, 1, "c1", request_hash("c1", "halo"))
+    stats = dedup.stats()
+    assert stats['cancelled'] == 1 and stats['disconnects'] == 2 and stats['in_flight'] == 0
+
+
+def test_finished_pipeline_is_recorded_even_if_client_left():
+    store, pipeline = FakeStore(), Pipeline()
+    dedup = AskDeduplicator(store)
+    stream = dedup.stream(1, "c1", "halo", "k1", pipeline.start, lambda: False)
+    t = threading.Thread(target=lambda: next(stream))
+    t.start()
+    _wait_for(lambda: pipeline.on_chunk)
+    pipeline.on_chunk("Halo")
+    t.join()
+    # Pipeline selesai tepat sebelum client pergi: jawaban tetap dicatat untuk diputar ulang
+    pipeline.futures[0].set_result("Halo")
+    stream.close()
+    assert store.calls[-1] == ('finish', 7, "Halo", 0)
+    assert dedup.stats()['cancelled'] == 0
+
+
+def test_stream_follower_receives_earlier_chunks():
+    pipeline = Pipeline()
+    dedup = AskDeduplicator(FakeStore())
+    leader = dedup.stream(1, "c1", "halo", None, pipeline.start, lambda: False)
+    # Pipeline mulai saat generator pertama kali diminta potongan
+    chunks = [None]
+
+    def first_chunk():
+        chunks[0] = next(leader)
+    t = threading.Thread(target=first_chunk)
+    t.start()
+    _wait_for(lambda: pipeline.on_chunk)
+    pipeline.on_chunk("Halo ")
+    t.join()
+    assert chunks == ["Halo "]
+
+    follower = dedup.stream(1, "c1", "halo", None, pipeline.start, lambda: False)
+    assert next(follower) == "Halo "
+    pipeline.on_chunk("dunia")
+    pipeline.futures[0].set_result("Halo dunia")
+
+    assert list(leader) == ["dunia"]
+    assert list(follower) == ["dunia"]
+    assert len(pipeline.futures) == 1 and dedup.stats()['coalesced'] == 1
+
+
+def test_stream_joining_non_streaming_run_gets_whole_answer():
+    pipeline = Pipeline()
+    dedup = AskDeduplicator(FakeStore())
+    results = []
+    t = _run_in_thread(dedup, pipeline, results)
+    _wait_for(lambda: pipeline.futures)
+    stream = dedup.stream(1, "c1", "halo", None, pipeline.start, lambda: False)
+    pipeline.futures[0].set_result("jawaban")
+    assert list(stream) == ["jawaban"]
+    t.join()
+    assert results == ["jawaban"]
+
+
+def test_stream_replay_yields_stored_answer():
+    store = FakeStore((None, 'done', "jawaban", request_hash("c1", "halo")))
+    pipeline = Pipeline()
+    dedup = AskDeduplicator(store)
+    assert list(dedup.stream(1, "c1", "halo", "k1", pipeline.start, lambda: False)) == ["jawaban"]
+    assert pipeline.futures == []
+
+
+def test_closed_stream_cancels_pipeline():
+    store, pipeline = FakeStore(), Pipeline()
+    dedup = AskDeduplicator(store)
+    stream = dedup.stream(1, "c1", "halo", "k1", pipeline.start, lambda: False)
+    t = threading.Thread(target=lambda: next(stream))
+    t.start()
+    _wait_for(lambda: pipeline.on_chunk)
+    pipeline.on_chunk("Halo")
+    t.join()
+
+    # Client putus saat potongan dikirim: server menutup generator
+    stream.close()
+    assert pipeline.futures[0].cancelled()
+    assert store.names() == ['claim', 'cancelled']
+
+
+def test_stream_disconnect_while_waiting_cancels_pipeline():
+    pipeline = Pipeline()
+    dedup = AskDeduplicator(FakeStore())
+    gone = [False]
+    stream = dedup.stream(1, "c1", "halo", None, pipeline.start, lambda: gone[0])
+    errors = []
+
+    def consume():
+        try:
+            list(stream)
+        except ClientDisconnected as e:
+            errors.append(e)
+    t = threading.Thread(target=consume)
+    t.start()
+    # Belum ada potongan sama sekali (mis. masih di tahap tool)
+    _wait_for(lambda: pipeline.futures)
+    gone[0] = True
+    t.join()
+    assert errors and pipeline.futures[0].cancelled()
+
+
+def test_stream_without_coalescing_runs_each_request():
+    pipeline = Pipeline()
+    dedup = AskDeduplicator(FakeStore())
+    streams = [dedup.stream(1, "c1", "halo", "k1", pipeline.start, lambda: False, coalesce=False) for _ in range(2)]
+    threads = [threading.Thread(target=lambda s=s: list(s)) for s in streams]
+    for t in threads:
+        t.start()
+    _wait_for(lambda: len(pipeline.futures) == 2)
+    for future in pipeline.futures:
+        future.set_result("ok")
+    for t in threads:
+        t.join()
+    assert pipeline.exchange_ids == [None, None] and dedup.stats()['coalesced'] == 0
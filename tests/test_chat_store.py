@@ -0,0 +1,72 @@
+import uuid
+from contextlib import contextmanager
+
+import chat_store
+
+
+def test_partial_answer_id_is_derived_from_exchange_id():
+    exchange_id = str(uuid.uuid4())
+    partial = chat_store.partial_exchange_id(exchange_id)
+    assert partial == chat_store.partial_exchange_id(exchange_id) != exchange_id
+    assert chat_store.partial_exchange_id(str(uuid.uuid4())) != partial
+
+
+def _capture_saves(monkeypatch):
+    saved = []
+    monkeypatch.setattr(chat_store.write_behind, "ENABLED", False)
+    monkeypatch.setattr(chat_store, "save_exchanges", saved.extend)
+    return saved
+
+
+def test_full_answer_replaces_partial_one(monkeypatch):
+    saved = _capture_saves(monkeypatch)
+    exchange_id = str(uuid.uuid4())
+    chat_store.save_exchange("c1", "tanya", "sebagian", False, exchange_id=exchange_id, partial=True)
+    chat_store.save_exchange("c1", "tanya", "lengkap", False, exchange_id=exchange_id)
+    partial, full = saved
+    # Pembatalan lalu retry dengan Idempotency-Key yang sama: satu exchange, bukan dua
+    assert partial['exchange_id'] == chat_store.partial_exchange_id(exchange_id) and partial['replaces'] is None
+    assert full['exchange_id'] == exchange_id and full['replaces'] == partial['exchange_id']
+
+
+def test_partial_answer_without_key_gets_random_id(monkeypatch):
+    saved = _capture_saves(monkeypatch)
+    chat_store.save_exchange("c1", "tanya", "sebagian", False, partial=True)
+    chat_store.save_exchange("c1", "tanya", "jawab", False)
+    assert saved[0]['exchange_id'] != saved[1]['exchange_id']
+    assert saved[0]['replaces'] is None and saved[1]['replaces'] is None
+
+
+class FakeConn:
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def commit(self):
+        pass
+
+
+def test_replaced_partial_in_same_batch_is_not_inserted(monkeypatch):
+    inserted = []
+
+    @contextmanager
+    def get_db_connection():
+        yield FakeConn()
+
+    monkeypatch.setattr(chat_store, "get_db_connection", get_db_connection)
+    monkeypatch.setattr(chat_store, "execute_values", lambda cur, sql, values, **kwargs: inserted.extend(values))
+    exchange_id = str(uuid.uuid4())
+    partial_id = chat_store.partial_exchange_id(exchange_id)
+    chat_store.save_exchanges([
+        {'exchange_id': partial_id, 'conversation_id': "c1", 'prompt': "tanya", 'answer': "sebagian",
+         'set_title': False, 'replaces': None},
+        {'exchange_id': exchange_id, 'conversation_id': "c1", 'prompt': "tanya", 'answer': "lengkap",
+         'set_title': False, 'replaces': partial_id},
+    ])
+    assert [(row[1], row[3], row[4]) for row in inserted] == [(exchange_id, 'user', "tanya"), (exchange_id, 'assistant', "lengkap")]
+    assert {row[7] for row in inserted} == {partial_id}
@@ -0,0 +1,107 @@
+from contextlib import contextmanager
+
+import context_builder
+from context_builder import SUMMARY_ACK, SUMMARY_INTRO, build_context, estimate_tokens, select_window, summary_prompt
+
+
+def _rows(*messages):
+    """[(role, content)] kronologis -> [(role, content, token_count)] dari yang terbaru, seperti query app.py."""
+    return [(role, content, estimate_tokens(content)) for role, content in reversed(messages)]
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 4
+    assert estimate_tokens("a" * 400) == 104
+
+
+def test_window_keeps_newest_turns_within_budget():
+    messages = [('user', "q1" * 40), ('model', "a1" * 40), ('user', "q2" * 40), ('model', "a2" * 40)]
+    # Setiap pesan 24 token: anggaran 50 hanya muat giliran terakhir
+    assert select_window(_rows(*messages), budget=50) == messages[2:]
+    assert select_window(_rows(*messages), budget=1000) == messages
+
+
+def test_window_starts_with_user_turn():
+    messages = [('user', "q1" * 40), ('model', "a1" * 40), ('user', "q2" * 40), ('model', "a2" * 40)]
+    # Muat tiga pesan terakhir, tetapi 'model' di depan dibuang
+    assert select_window(_rows(*messages), budget=75) == messages[2:]
+
+
+def test_oversized_last_turn_is_truncated_not_dropped():
+    question, answer = "tanya " * 10, "awal" + "x" * 4000 + "akhir"
+    window = select_window(_rows(('user', question), ('model', answer)), budget=200)
+    assert [role for role, _ in window] == ['user', 'model']
+    content = window[1][1]
+    # Pesan pertama yang kebesaran memakai separuh anggaran, awal dan akhirnya tetap ada
+    assert content.startswith("awal") and content.endswith("akhir") and "[dipotong]" in content
+    assert len(content) < (200 // 2) * 4 + 20
+    assert window[0] == ('user', question)
+
+
+def test_older_messages_are_not_truncated():
+    messages = [('user', "q" * 4000), ('model', "a" * 40), ('user', "q2"), ('model', "a2")]
+    assert select_window(_rows(*messages), budget=100) == messages[2:]
+
+
+def test_build_context_prepends_summary_and_charges_it(monkeypatch):
+    monkeypatch.setattr(context_builder, "TOKEN_BUDGET", 60)
+    messages = [('user', "q1" * 40), ('model', "a1" * 40)]
+    assert build_context("", _rows(*messages)) == messages
+
+    history = build_context("user suka kopi", _rows(*messages))
+    assert history[:2] == [('user', SUMMARY_INTRO + "user suka kopi"), ('assistant', SUMMARY_ACK)]
+    # Sisa anggaran setelah ringkasan hanya muat jawaban terakhir utuh; pertanyaannya dipotong
+    assert history[2][0] == 'user' and "[dipotong]" in history[2][1]
+    assert history[3] == messages[1]
+
+
+def test_summary_prompt_labels_roles():
+    prompt = summary_prompt("", [('user', "halo"), ('model', "hai")])
+    assert "(belum ada)" in prompt and "User: halo\nAI: hai" in prompt
+
+
+class FakeCursor:
+    def __init__(self, summary_row, message_rows):
+        self.results = [summary_row, message_rows]
+        self.queries = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, vars=None):
+        self.queries.append(vars)
+
+    def fetchone(self):
+        return self.results.pop(0)
+
+    def fetchall(self):
+        return self.results.pop(0)
+
+
+def _fake_db(monkeypatch, cursor):
+    class Conn:
+        def cursor(self):
+            return cursor
+
+    @contextmanager
+    def get_db_connection():
+        yield Conn()
+
+    monkeypatch.setattr(context_builder, "get_db_connection", get_db_connection)
+
+
+def test_pending_summary_waits_for_enough_tokens(monkeypatch):
+    cursor = FakeCursor(("lama", 7), [(12, 'model', "a", 10), (11, 'user', "q", 10)])
+    _fake_db(monkeypatch, cursor)
+    assert context_builder.pending_summary_input("c1") is None
+    # Hanya pesan setelah summarized_until, melewati SUMMARY_KEEP_MESSAGES pesan terbaru
+    assert cursor.queries[1][1:] == ("c1", 7, context_builder.SUMMARY_KEEP_MESSAGES)
+
+
+def test_pending_summary_returns_oldest_first(monkeypatch):
+    big = context_builder.SUMMARY_MIN_TOKENS
+    _fake_db(monkeypatch, FakeCursor(None, [(12, 'model', "a", big), (11, 'user', "q", 1)]))
+    assert context_builder.pending_summary_input("c1") == ("", [('user', "q"), ('model', "a")], 12)
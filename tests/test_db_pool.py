@@ -0,0 +1,160 @@
+import threading
+import time
+
+import psycopg2.extensions
+import pytest
+
+from db import ConnectionPool, PoolTimeout
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, vars=None):
+        self.conn.pings += 1
+        if self.conn.ping_gate is not None:
+            self.conn.ping_gate.wait(2)
+        if self.conn.dead:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+
+class FakeConnection:
+    def __init__(self, n):
+        self.n = n
+        self.closed = 0
+        self.dead = False
+        self.pings = 0
+        self.rollbacks = 0
+        self.ping_gate = None
+        self.status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+        self.rollback_fails = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        if self.rollback_fails:
+            raise psycopg2.InterfaceError("connection already closed")
+        self.rollbacks += 1
+        self.status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def get_transaction_status(self):
+        return self.status
+
+    def close(self):
+        self.closed = 1
+
+
+class FakePool(ConnectionPool):
+    def __init__(self, **kwargs):
+        self.connections = []
+        self.connect_error = None
+        super().__init__("postgresql://fake", **kwargs)
+
+    def _connect(self):
+        if self.connect_error is not None:
+            raise self.connect_error
+        conn = FakeConnection(len(self.connections))
+        self.connections.append(conn)
+        return conn
+
+
+def test_connection_is_reused():
+    pool = FakePool(maxconn=2)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    assert pool.getconn() is conn
+    stats = pool.stats()
+    assert stats["created"] == 1 and stats["checkouts"] == 2 and stats["in_use"] == 1
+
+
+def test_checkout_times_out_when_pool_exhausted():
+    pool = FakePool(maxconn=1)
+    pool.getconn()
+    with pytest.raises(PoolTimeout):
+        pool.getconn(timeout=0.05)
+    stats = pool.stats()
+    assert stats["timeouts"] == 1 and stats["waits"] == 1 and stats["created"] == 1
+
+
+def test_waiter_gets_returned_connection():
+    pool = FakePool(maxconn=1)
+    conn = pool.getconn()
+    got = []
+    t = threading.Thread(target=lambda: got.append(pool.getconn(timeout=2)))
+    t.start()
+    time.sleep(0.05)
+    pool.putconn(conn)
+    t.join()
+    assert got == [conn] and pool.stats()["waits"] == 1
+
+
+def test_failed_health_check_discards_and_reconnects():
+    pool = FakePool(maxconn=1, health_check_after=0)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    conn.dead = True
+    time.sleep(0.01)
+
+    fresh = pool.getconn()
+    assert fresh is not conn and conn.closed
+    stats = pool.stats()
+    assert stats["health_check_failures"] == 1 and stats["recycled"] == 1 and stats["in_use"] == 1
+
+
+def test_health_check_does_not_block_other_checkouts():
+    pool = FakePool(maxconn=2, health_check_after=0)
+    slow = pool.getconn()
+    pool.putconn(slow)
+    slow.ping_gate = threading.Event()
+    time.sleep(0.01)
+
+    t = threading.Thread(target=pool.getconn)
+    t.start()
+    while slow.pings == 0:
+        time.sleep(0.005)
+    # Ping koneksi lama masih menggantung, checkout lain tetap jalan dengan koneksi baru
+    other = pool.getconn(timeout=0.5)
+    assert other is not slow
+    slow.ping_gate.set()
+    t.join()
+    assert pool.stats()["in_use"] == 2
+
+
+def test_expired_connection_is_recycled():
+    pool = FakePool(maxconn=1, max_lifetime=0)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    assert pool.getconn() is not conn
+    assert conn.closed and pool.stats()["recycled"] == 1
+
+
+def test_putconn_rolls_back_open_transaction():
+    pool = FakePool(maxconn=1)
+    conn = pool.getconn()
+    conn.status = psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+    pool.putconn(conn)
+    assert conn.rollbacks == 1 and pool.stats()["idle"] == 1
+
+    conn = pool.getconn()
+    conn.status = psycopg2.extensions.TRANSACTION_STATUS_INERROR
+    conn.rollback_fails = True
+    pool.putconn(conn)
+    assert conn.closed and pool.stats()["idle"] == 0
+
+
+def test_connect_failure_frees_slot():
+    pool = FakePool(maxconn=1)
+    pool.connect_error = psycopg2.OperationalError("could not connect")
+    with pytest.raises(psycopg2.OperationalError):
+        pool.getconn()
+    assert pool.stats()["in_use"] == 0
+    pool.connect_error = None
+    assert pool.getconn() is pool.connections[0]
@@ -0,0 +1,49 @@
+import pytest
+
+import gazetteer
+
+
+@pytest.mark.parametrize("prompt, city", [
+    ("cuaca di bandung hari ini?", "Bandung"),
+    ("cuaca jaksel siang ini", "Jakarta"),
+    ("cuaca di bandar lampung", "Bandar Lampung"),
+    ("cuaca di kuala lumpur", "Kuala Lumpur"),
+    ("cuaca new york besok", "New York"),
+    ("cuaca surabya", "Surabaya"),
+    ("cuaca di yogyakrta", "Yogyakarta"),
+    # Nama kota yang juga kata umum butuh penanda lokasi
+    ("cuaca di malang", "Malang"),
+    ("cuaca di kota batu", "Batu"),
+    ("cuaca ke padang besok", "Padang"),
+])
+def test_finds_city(prompt, city):
+    assert gazetteer.find_city(prompt) == city
+
+
+@pytest.mark.parametrize("prompt", [
+    "cuaca hari ini",
+    "ramalan cuaca minggu depan",
+    "cuaca lima hari ke depan",
+    "tolong bantu cek cuaca",
+    "cuaca lagi panas, kl hujan bawa payung ya",
+    "smg cuaca besok cerah",
+    "liburan solo enaknya pas cuaca cerah",
+    "malang banget cuaca hari ini hujan terus",
+    "sambal lombok cocok buat cuaca dingin",
+    "cuaca panas plg kerja enaknya minum apa",
+])
+def test_common_words_are_not_cities(prompt):
+    assert gazetteer.find_city(prompt) is None
+
+
+def test_common_words_never_become_aliases_or_fuzzy_targets():
+    for word in gazetteer.COMMON_WORDS:
+        assert word not in gazetteer._fuzzy_buckets.get(word[0], ())
+    assert "kl" not in gazetteer._names and "solo" not in gazetteer._names
+    # Nama resmi tetap ada, hanya dicocokkan setelah penanda lokasi
+    assert gazetteer._names["malang"] == "Malang"
+
+
+def test_short_tokens_are_not_fuzzy_matched():
+    # "medn" hanya 4 huruf: tidak ditebak sebagai Medan
+    assert gazetteer.find_city("cuaca medn") is None
@@ -0,0 +1,163 @@
+import asyncio
+
+import httpx
+import pytest
+
+import http_client
+from http_client import CircuitBreaker, CircuitOpen, HttpClient, UpstreamError
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(http_client.time, "monotonic", clock)
+    return clock
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_after=30)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.record_success()
+    assert breaker.failures == 0
+
+    for _ in range(3):
+        breaker.record_failure()
+    assert breaker.state == 'open' and breaker.opened_total == 1
+    assert not breaker.allow()
+
+
+def test_breaker_half_open_allows_single_probe(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_after=30)
+    breaker.record_failure()
+    clock.now += 29.9
+    assert not breaker.allow()
+
+    clock.now += 0.1
+    assert breaker.allow()
+    assert breaker.state == 'half_open'
+    # Selama probe berjalan, request lain tetap dilewati
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    assert breaker.allow() and breaker.allow()
+
+
+def test_breaker_failed_probe_reopens(clock):
+    breaker = CircuitBreaker(failure_threshold=5, reset_after=30)
+    for _ in range(5):
+        breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open' and breaker.opened_total == 2
+    assert not breaker.allow()
+    clock.now += 30
+    assert breaker.allow()
+
+
+def test_breaker_cancelled_probe_frees_slot(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_after=30)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    breaker.release_probe()
+    assert breaker.state == 'half_open'
+    assert breaker.allow()
+
+
+POLICY = {'connect_timeout': 1.0, 'read_timeout': 1.0, 'retries': 1, 'failure_threshold': 2, 'reset_after': 60}
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(http_client, "BACKOFF_BASE", 0.0)
+
+
+def _client(handler):
+    client = HttpClient(policies={'weather': POLICY}, default_policy=POLICY)
+    client._clients["https://upstream.test"] = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+
+async def _get(client, times=1):
+    results = []
+    for _ in range(times):
+        try:
+            results.append((await client.get('weather', "https://upstream.test/now")).status_code)
+        except UpstreamError as e:
+            results.append(type(e).__name__)
+    await client.aclose()
+    return results
+
+
+def test_client_retries_then_succeeds(no_backoff):
+    statuses = iter([503, 200])
+    client = _client(lambda request: httpx.Response(next(statuses)))
+    assert asyncio.run(_get(client)) == [200]
+    stats = client.stats()['weather']
+    assert stats['requests'] == 2 and stats['retries'] == 1 and stats['failures'] == 0
+    assert stats['circuit'] == 'closed' and stats['latency']['count'] == 2
+
+
+def test_client_does_not_retry_client_errors(no_backoff):
+    calls = []
+    client = _client(lambda request: calls.append(request) or httpx.Response(404))
+    assert asyncio.run(_get(client)) == [404]
+    assert len(calls) == 1
+
+
+def test_client_opens_circuit_and_short_circuits(no_backoff):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        raise httpx.ConnectError("connection refused", request=request)
+
+    client = _client(handler)
+    assert asyncio.run(_get(client, times=3)) == ["UpstreamError", "UpstreamError", "CircuitOpen"]
+    # 2 request x (1 + 1 retry); request ketiga tidak sampai ke upstream
+    assert len(calls) == 4
+    stats = client.stats()['weather']
+    assert stats['failures'] == 2 and stats['short_circuited'] == 1
+    assert stats['circuit'] == 'open' and stats['circuit_opened'] == 1
+    assert issubclass(CircuitOpen, UpstreamError)
+
+
+def test_client_cancellation_is_not_a_failure():
+    async def scenario():
+        started = asyncio.Event()
+
+        async def handler(request):
+            started.set()
+            await asyncio.sleep(10)
+            return httpx.Response(200)
+
+        client = _client(handler)
+        breaker = client._breaker('weather')
+        breaker.record_failure()
+        breaker.record_failure()
+        breaker.opened_at -= POLICY['reset_after']
+        task = asyncio.ensure_future(client.get('weather', "https://upstream.test/now"))
+        await started.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await client.aclose()
+        return breaker
+
+    breaker = asyncio.run(scenario())
+    # Probe yang dibatalkan melepas slotnya tanpa membuka breaker lagi
+    assert breaker.state == 'half_open' and breaker.failures == 2
+    assert breaker.allow()
@@ -0,0 +1,105 @@
+import asyncio
+import os
+
+from intent_router import CHAT, AhoCorasick, IntentRouter, NaiveBayesClassifier, Tool, tokenize
+
+INTENTS_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "intents.txt")
+
+
+def _router(classifier=None):
+    # Susunan tool yang sama dengan tools.router
+    router = IntentRouter(classifier=classifier)
+    router.register(Tool('chat', None, keywords=("siapa kamu", "kamu siapa"), priority=30))
+    router.register(Tool('weather', None, keywords=("cuaca", "prakiraan cuaca", "weather"), priority=20))
+    router.register(Tool('search', None, prefixes=("siapa", "apa itu", "presiden"), priority=10))
+    return router
+
+
+def test_tokenize():
+    assert tokenize("Cuaca di Jakarta, hari-ini?") == ["cuaca", "di", "jakarta", "hari", "ini"]
+
+
+def test_aho_corasick_finds_overlapping_patterns():
+    matcher = AhoCorasick()
+    for pattern in ("he", "she", "his", "hers"):
+        matcher.add(pattern, pattern)
+    found = sorted((start, end, payload) for start, end, payload in matcher.search("ushers"))
+    assert found == [(1, 4, "she"), (2, 4, "he"), (2, 6, "hers")]
+
+
+def test_keywords_need_word_boundaries():
+    router = _router()
+    assert router.candidates("bagaimana cuaca bandung") == {'weather'}
+    # Akhiran Indonesia boleh menempel, kata lain yang kebetulan memuat kata kunci tidak
+    assert router.candidates("cuacanya gimana?") == {'weather'}
+    assert router.candidates("percuacaan") == set()
+    assert router.candidates("weathering") == set()
+
+
+def test_prefixes_only_match_at_start():
+    router = _router()
+    assert router.route("Siapa presiden pertama Indonesia?") == 'search'
+    assert router.route('"apa itu inflasi"') == 'search'
+    assert router.route("tolong jelaskan apa itu inflasi") == CHAT
+
+
+def test_priority_breaks_ties_without_classifier():
+    router = _router()
+    assert router.candidates("siapa kamu") == {'chat', 'search'}
+    assert router.route("siapa kamu") == 'chat'
+    assert router.route("apa itu cuaca ekstrem") == 'weather'
+    assert router.route("tulis puisi tentang laut") == CHAT
+
+
+def test_classifier_picks_among_matches_and_respects_threshold():
+    classifier = NaiveBayesClassifier([
+        ('weather', "cuaca jakarta hari ini"), ('weather', "apakah besok hujan di bogor"),
+        ('search', "apa itu cuaca ekstrem"), ('search', "apa itu fenomena el nino"),
+    ])
+    router = _router(classifier)
+    # Dua tool cocok: classifier yang memilih, bukan prioritas
+    assert router.route("apa itu cuaca ekstrem") == 'search'
+    # Tanpa kata kunci, classifier hanya dipakai jika cukup yakin
+    assert router.route("besok hujan di bogor") == 'weather'
+    router.threshold = 1.01
+    assert router.route("besok hujan di bogor") == CHAT
+
+
+def test_classifier_from_training_file():
+    classifier = NaiveBayesClassifier.from_file(INTENTS_FILE)
+    label, probability = classifier.predict("bagaimana cuaca bandung sekarang")
+    assert label == 'weather' and 0.5 < probability <= 1.0
+    assert classifier.predict("x", labels={'tidak-ada'}) == (None, 0.0)
+
+
+def test_dispatch_runs_handler_and_times_out():
+    async def slow(prompt):
+        await asyncio.sleep(1)
+        return "terlambat"
+
+    async def echo(prompt):
+        return f"cuaca: {prompt}"
+
+    router = IntentRouter()
+    router.register(Tool('weather', echo, keywords=("cuaca",)))
+    router.register(Tool('search', slow, prefixes=("siapa",), timeout=0.01))
+
+    async def scenario():
+        return [await router.dispatch(p) for p in ("cuaca bandung", "siapa itu", "halo")]
+
+    assert asyncio.run(scenario()) == ["cuaca: cuaca bandung", "", ""]
+
+
+def test_register_declares_cache_ttl():
+    class Cache:
+        def __init__(self):
+            self.ttls = {}
+
+        def register_tool(self, name, ttl):
+            self.ttls[name] = ttl
+
+    cache = Cache()
+    router = IntentRouter(cache=cache)
+    router.register(Tool('weather', None, keywords=("cuaca",), cache_ttl=600))
+    router.register(Tool('chat', None))
+    assert cache.ttls == {'weather': 600}
@@ -0,0 +1,194 @@
+# Klaim batch, retry, dan reclaim lock basi adalah SQL, jadi tes ini butuh Postgres sungguhan:
+#   TEST_POSTGRES_URL=postgresql://... python -m pytest -q tests/test_mail_queue.py
+# Tabel outbound_emails dibuat sebagai TEMP table di satu koneksi, jadi data database tidak tersentuh.
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import pytest
+from flask import Flask
+
+import mail_queue
+
+aiosmtpd_controller = pytest.importorskip("aiosmtpd.controller")
+TEST_POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+pytestmark = pytest.mark.skipif(not TEST_POSTGRES_URL, reason="TEST_POSTGRES_URL tidak diset")
+
+
+class Sink:
+    """Server SMTP di dalam proses: menyimpan email yang diterima, menolak sementara penerima di `reject`."""
+
+    def __init__(self):
+        self.received = []
+        self.reject = set()
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address in self.reject:
+            return "451 4.3.0 coba lagi nanti"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received.extend(envelope.rcpt_tos)
+        return "250 OK"
+
+
+@pytest.fixture
+def conn(monkeypatch):
+    conn = psycopg2.connect(TEST_POSTGRES_URL)
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TEMP TABLE outbound_emails (
+                id BIGSERIAL PRIMARY KEY,
+                recipient TEXT NOT NULL,
+                subject TEXT NOT NULL,
+                html TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                locked_at TIMESTAMPTZ,
+                last_error TEXT,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                sent_at TIMESTAMPTZ
+            )
+        """)
+    conn.commit()
+
+    @contextmanager
+    def get_db_connection():
+        yield conn
+
+    monkeypatch.setattr(mail_queue, "get_db_connection", get_db_connection)
+    yield conn
+    conn.close()
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def sink():
+    sink = Sink()
+    # Controller aiosmtpd tidak mendukung port=0, jadi cari port bebas dulu
+    controller = aiosmtpd_controller.Controller(sink, hostname="127.0.0.1", port=_free_port())
+    controller.start()
+    yield sink, controller.port
+    controller.stop()
+
+
+def _app(port):
+    from flask_mail import Mail
+
+    app = Flask(__name__)
+    app.config.update(MAIL_SERVER="127.0.0.1", MAIL_PORT=port, MAIL_USE_TLS=False, MAIL_USERNAME=None)
+    return app, Mail(app)
+
+
+def _enqueue(conn, *recipients):
+    with conn.cursor() as cur:
+        ids = [mail_queue.enqueue(cur, recipient, "OTP", "<p>123456</p>") for recipient in recipients]
+    conn.commit()
+    return ids
+
+
+def _rows(conn):
+    with conn.cursor() as cur:
+        cur.execute("""SELECT recipient, status, attempts, extract(epoch FROM next_attempt_at - now())
+                       FROM outbound_emails ORDER BY id""")
+        rows = cur.fetchall()
+    conn.commit()
+    return {recipient: (status, attempts, float(delay)) for recipient, status, attempts, delay in rows}
+
+
+def test_batch_sent_over_one_connection(conn, sink):
+    sink, port = sink
+    app, mail = _app(port)
+    _enqueue(conn, "a@x.com", "b@x.com")
+    with app.app_context():
+        assert mail_queue.process_batch(mail, "noreply@x.com") == 2
+        assert mail_queue.process_batch(mail, "noreply@x.com") == 0
+    assert sink.received == ["a@x.com", "b@x.com"]
+    assert {status for status, _, _ in _rows(conn).values()} == {"sent"}
+
+
+def test_rejected_recipient_is_retried_with_backoff(conn, sink):
+    sink, port = sink
+    app, mail = _app(port)
+    sink.reject.add("b@x.com")
+    _enqueue(conn, "a@x.com", "b@x.com")
+    with app.app_context():
+        mail_queue.process_batch(mail, "noreply@x.com")
+    rows = _rows(conn)
+    assert rows["a@x.com"][:2] == ("sent", 1)
+    status, attempts, delay = rows["b@x.com"]
+    # Percobaan pertama menunggu BACKOFF_BASE detik +-20% jitter
+    assert (status, attempts) == ("pending", 1)
+    assert mail_queue.BACKOFF_BASE * 0.8 - 1 < delay < mail_queue.BACKOFF_BASE * 1.2
+
+    # Belum jatuh tempo: tidak ikut batch berikutnya
+    with app.app_context():
+        assert mail_queue.process_batch(mail, "noreply@x.com") == 0
+
+    # Percobaan terakhir yang gagal menandai email 'failed' alih-alih dijadwalkan lagi
+    with conn.cursor() as cur:
+        cur.execute("UPDATE outbound_emails SET next_attempt_at = now(), attempts = %s WHERE recipient = 'b@x.com'",
+                    (mail_queue.MAX_ATTEMPTS - 1,))
+    conn.commit()
+    with app.app_context():
+        assert mail_queue.process_batch(mail, "noreply@x.com") == 1
+    assert _rows(conn)["b@x.com"][:2] == ("failed", mail_queue.MAX_ATTEMPTS)
+    assert sink.received == ["a@x.com"]
+
+
+def test_stale_sending_row_is_reclaimed(conn, sink):
+    sink, port = sink
+    app, mail = _app(port)
+    _enqueue(conn, "stale@x.com", "busy@x.com")
+    # Dua baris diklaim worker yang lalu mati; hanya yang lock-nya sudah lewat STALE_LOCK_MINUTES yang diambil alih
+    with conn.cursor() as cur:
+        cur.execute("""UPDATE outbound_emails SET status = 'sending', attempts = 1,
+                       locked_at = now() - CASE recipient WHEN 'stale@x.com' THEN %s ELSE 1 END * interval '1 minute'""",
+                    (mail_queue.STALE_LOCK_MINUTES + 1,))
+    conn.commit()
+    with app.app_context():
+        assert mail_queue.process_batch(mail, "noreply@x.com") == 1
+    rows = _rows(conn)
+    assert rows["stale@x.com"][:2] == ("sent", 2)
+    assert rows["busy@x.com"][:2] == ("sending", 1)
+    assert sink.received == ["stale@x.com"]
+
+
+def test_job_ids_limit_the_batch(conn, sink):
+    sink, port = sink
+    app, mail = _app(port)
+    _, new_id = _enqueue(conn, "old@x.com", "new@x.com")
+    with app.app_context():
+        assert mail_queue.process_batch(mail, "noreply@x.com", job_ids=[new_id]) == 1
+    assert sink.received == ["new@x.com"]
+    assert _rows(conn)["old@x.com"][0] == "pending"
+
+
+def test_unresponsive_smtp_server_times_out(conn):
+    # Server yang menerima koneksi tetapi tidak pernah mengirim greeting
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen()
+    accepted = []
+    threading.Thread(target=lambda: accepted.append(listener.accept()), daemon=True).start()
+    app, mail = _app(listener.getsockname()[1])
+    _enqueue(conn, "a@x.com")
+    try:
+        start = time.monotonic()
+        with app.app_context():
+            assert mail_queue.process_batch(mail, "noreply@x.com", timeout=0.2) == 1
+        assert time.monotonic() - start < 2
+    finally:
+        listener.close()
+    status, attempts, delay = _rows(conn)["a@x.com"]
+    assert (status, attempts) == ("pending", 1) and delay > 0
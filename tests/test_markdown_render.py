@@ -0,0 +1,99 @@
+import pytest
+
+import markdown_render
+from markdown_render import content_hash, fill_missing, render
+
+pytest.importorskip("nh3")
+pytest.importorskip("markdown_it")
+
+
+def test_script_and_event_handlers_are_stripped():
+    out = render('<script>alert(1)</script>\n\n<img src="x" onerror="alert(1)">\n\n**tebal**')
+    # HTML mentah di Markdown dinonaktifkan: tampil sebagai teks, bukan elemen
+    assert "<script" not in out and "<img" not in out
+    assert "&lt;script&gt;" in out and "<strong>tebal</strong>" in out
+
+
+def test_unsafe_link_schemes_are_dropped():
+    out = render("[klik](javascript:alert(1)) [situs](https://contoh.id)")
+    # Tautan javascript: tidak pernah menjadi <a>, hanya teks
+    assert out.count("<a ") == 1 and 'href="javascript' not in out
+    assert 'href="https://contoh.id"' in out and 'rel="noopener noreferrer nofollow"' in out
+
+
+def test_table_alignment_keeps_only_text_align():
+    out = render("| a |\n|:-:|\n| b |")
+    assert "<table>" in out and 'style="text-align:center"' in out
+
+
+def test_code_block_is_highlighted():
+    pytest.importorskip("pygments")
+    out = render("```python\ndef f():\n    return 1\n```")
+    assert '<code class="language-python highlight">' in out
+    assert '<span class="k">def</span>' in out
+
+
+def test_unknown_language_and_oversized_code_are_escaped(monkeypatch):
+    out = render("```bahasa-fiktif\n<b>x</b>\n```")
+    assert '<code class="language-bahasa-fiktif highlight">' in out and "&lt;b&gt;x&lt;/b&gt;" in out
+
+    monkeypatch.setattr(markdown_render, "MAX_HIGHLIGHT_CHARS", 5)
+    out = render("```python\ndef panjang(): pass\n```")
+    assert "<span" not in out and "def panjang(): pass" in out
+
+
+def test_content_hash_includes_renderer_version():
+    import hashlib
+
+    assert content_hash("halo") == hashlib.sha256(f"md-v{markdown_render.RENDERER_VERSION}:halo".encode()).digest()
+
+
+class FakeConn:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.inserted = []
+        self.committed = self.rolled_back = False
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        self.rolled_back = True
+
+
+def _fake_execute_values(cur, sql, rows):
+    if cur.fail:
+        raise RuntimeError("db mati")
+    cur.inserted.extend(rows)
+
+
+def test_fill_missing_renders_each_content_once(monkeypatch):
+    monkeypatch.setattr(markdown_render, "execute_values", _fake_execute_values)
+    messages = [
+        {'role': 'user', 'content': "**x**", 'html': None},
+        {'role': 'assistant', 'content': "**x**", 'html': None},
+        {'role': 'assistant', 'content': "**x**", 'html': None},
+        {'role': 'assistant', 'content': "lama", 'html': "<p>cache</p>"},
+    ]
+    conn = FakeConn()
+    assert fill_missing(conn, messages) == 1
+    assert messages[0]['html'] is None and messages[3]['html'] == "<p>cache</p>"
+    assert messages[1]['html'] == messages[2]['html'] == "<p><strong>x</strong></p>\n"
+    assert conn.inserted == [(content_hash("**x**"), messages[1]['html'])] and conn.committed
+
+
+def test_fill_missing_survives_cache_write_failure(monkeypatch):
+    monkeypatch.setattr(markdown_render, "execute_values", _fake_execute_values)
+    messages = [{'role': 'assistant', 'content': "halo", 'html': None}]
+    conn = FakeConn(fail=True)
+    assert fill_missing(conn, messages) == 1
+    assert conn.rolled_back and messages[0]['html'] == "<p>halo</p>\n"
@@ -0,0 +1,42 @@
+import os
+
+import pytest
+
+os.environ.setdefault("SECRET_KEY", "test")
+
+import app as app_module
+import metrics
+
+
+@pytest.fixture
+def client(monkeypatch):
+    for name in ("METRICS_TOKEN", "METRICS_PUBLIC", "VERCEL"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setattr(metrics, "render", lambda: "richatz_up 1\n")
+    monkeypatch.setattr(app_module.app, "debug", False)
+    return app_module.app.test_client()
+
+
+def test_denied_without_token_by_default(client):
+    assert client.get("/metrics").status_code == 401
+
+
+def test_token_required_when_configured(client, monkeypatch):
+    monkeypatch.setenv("METRICS_TOKEN", "rahasia")
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer salah"}).status_code == 401
+    response = client.get("/metrics", headers={"Authorization": "Bearer rahasia"})
+    assert response.status_code == 200 and response.text == "richatz_up 1\n"
+
+
+def test_open_without_token_only_outside_vercel(client, monkeypatch):
+    monkeypatch.setenv("METRICS_PUBLIC", "1")
+    assert client.get("/metrics").status_code == 200
+    monkeypatch.setenv("VERCEL", "1")
+    assert client.get("/metrics").status_code == 401
+
+    monkeypatch.delenv("METRICS_PUBLIC")
+    monkeypatch.setattr(app_module.app, "debug", True)
+    assert client.get("/metrics").status_code == 401
+    monkeypatch.delenv("VERCEL")
+    assert client.get("/metrics").status_code == 200
@@ -0,0 +1,52 @@
+from datetime import datetime, timezone
+
+import pytest
+from flask import Flask
+
+from pagination import (conditional_json, decode_cursor, encode_cursor, is_not_modified, make_etag,
+                        not_modified_response, page_limit, parse_timestamp)
+
+app = Flask(__name__)
+
+
+def test_cursor_round_trip():
+    ts = datetime(2026, 3, 1, 12, 30, tzinfo=timezone.utc)
+    assert decode_cursor(encode_cursor(ts, "abc")) == [ts.isoformat(), "abc"]
+    assert decode_cursor(encode_cursor(42)) == [42]
+
+
+@pytest.mark.parametrize("cursor", ["!!!", "bm90IGpzb24", ""])
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor(cursor)
+
+
+def test_parse_timestamp():
+    assert parse_timestamp("2026-03-01T12:30:00+07:00") == datetime(2026, 3, 1, 5, 30, tzinfo=timezone.utc)
+    # Tanpa zona waktu dianggap UTC
+    assert parse_timestamp("2026-03-01T12:30:00").tzinfo == timezone.utc
+    for value in ("kemarin", "2026-13-01", None, 5):
+        with pytest.raises(ValueError, match="Invalid since"):
+            parse_timestamp(value, "Invalid since.")
+
+
+@pytest.mark.parametrize("query, expected", [("", 50), ("?limit=10", 10), ("?limit=0", 1),
+                                             ("?limit=100000", 200), ("?limit=abc", 50)])
+def test_page_limit(query, expected):
+    with app.test_request_context("/history" + query):
+        assert page_limit() == expected
+
+
+def test_etag_and_conditional_responses():
+    etag = make_etag('history', 1, 3, None, 50, None, None)
+    assert etag == make_etag('history', 1, 3, None, 50, None, None)
+    assert etag != make_etag('history', 1, 4, None, 50, None, None)
+
+    with app.test_request_context("/history", headers={'If-None-Match': etag}):
+        assert is_not_modified(etag)
+        response = not_modified_response(etag)
+        assert response.status_code == 304 and response.headers['ETag'] == etag
+    with app.test_request_context("/history", headers={'If-None-Match': make_etag('lain')}):
+        assert not is_not_modified(etag)
+        response = conditional_json({'ok': True}, etag)
+        assert response.headers['ETag'] == etag and response.headers['Cache-Control'] == 'private, no-cache'
@@ -0,0 +1,104 @@
+import threading
+import time
+
+import pytest
+
+from password_hasher import HasherBusy, PasswordHasher
+
+
+def _hasher(**kwargs):
+    # Cost 4 (minimum bcrypt) supaya tes tetap cepat
+    kwargs.setdefault("rounds", 4)
+    return PasswordHasher(**kwargs)
+
+
+def _blocked(hasher, count):
+    """Mengisi `count` slot dengan pekerjaan yang menunggu sampai gate dibuka."""
+    gate, started = threading.Event(), threading.Semaphore(0)
+
+    def work():
+        started.release()
+        gate.wait(5)
+        return "selesai"
+
+    callers = [threading.Thread(target=hasher._run, args=(work,)) for _ in range(count)]
+    for caller in callers:
+        caller.start()
+    return gate, started, callers
+
+
+def _wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timeout"
+        time.sleep(0.005)
+
+
+def test_hash_and_verify_round_trip():
+    hasher = _hasher()
+    hashed = hasher.hash("rahasia")
+    assert hashed.startswith("$2b$04$")
+    assert hasher.verify("rahasia", hashed) and not hasher.verify("salah", hashed)
+    stats = hasher.stats()
+    assert stats["hashed"] == 1 and stats["verified"] == 2 and stats["pending"] == 0
+
+
+def test_invalid_stored_hash_fails_closed():
+    assert _hasher().verify("rahasia", "bukan-hash-bcrypt") is False
+
+
+def test_needs_rehash_when_cost_changes():
+    old = _hasher(rounds=4).hash("rahasia")
+    hasher = _hasher(rounds=5)
+    assert hasher.needs_rehash(old) and hasher.needs_rehash("") and hasher.needs_rehash(None)
+    new = hasher.rehash_if_needed("rahasia", old)
+    assert new.startswith("$2b$05$") and hasher.verify("rahasia", new)
+    assert hasher.rehash_if_needed("rahasia", new) is None
+    assert hasher.stats()["rehashed"] == 1
+
+
+def test_full_queue_rejects_immediately():
+    hasher = _hasher(workers=1, max_pending=2)
+    gate, started, callers = _blocked(hasher, 2)
+    # Satu pekerjaan berjalan, satu mengantri: slot habis, pekerjaan ketiga langsung ditolak
+    _wait_for(lambda: hasher.stats()["pending"] == 2)
+    with pytest.raises(HasherBusy):
+        hasher.hash("rahasia")
+    # Login dengan hash lama tetap jalan walau rehash tidak kebagian slot
+    assert hasher.rehash_if_needed("rahasia", "$2b$10$" + "x" * 53) is None
+
+    gate.set()
+    for caller in callers:
+        caller.join()
+    stats = hasher.stats()
+    assert stats["rejected"] == 2 and stats["pending"] == 0
+    assert hasher.verify("rahasia", hasher.hash("rahasia"))
+
+
+def test_timeout_raises_busy_and_frees_slot_when_work_ends():
+    hasher = _hasher(workers=1, max_pending=1, timeout=0.05)
+    gate = threading.Event()
+    with pytest.raises(HasherBusy):
+        hasher._run(gate.wait, 5)
+    assert hasher.stats()["timeouts"] == 1
+    # Slot baru kembali setelah pekerjaan yang terlambat benar-benar selesai
+    assert hasher.stats()["pending"] == 1
+    gate.set()
+    hasher._get_executor().submit(lambda: None).result(timeout=2)
+    assert hasher.stats()["pending"] == 0
+
+
+def test_queued_work_is_cancelled_on_timeout():
+    hasher = _hasher(workers=1, max_pending=3, timeout=0.05)
+    # Satu-satunya worker sibuk, jadi pekerjaan berikutnya hanya mengantri
+    gate = threading.Event()
+    busy = hasher._get_executor().submit(gate.wait, 5)
+    ran = []
+    with pytest.raises(HasherBusy):
+        hasher._run(ran.append, "tidak pernah jalan")
+    # Pekerjaan yang masih mengantri dibatalkan, jadi tidak memakan worker setelah pemanggilnya menyerah
+    assert hasher.stats()["pending"] == 0
+    gate.set()
+    busy.result(timeout=2)
+    hasher._get_executor().submit(lambda: None).result(timeout=2)
+    assert ran == []
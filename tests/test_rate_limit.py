@@ -0,0 +1,195 @@
+import threading
+import time
+
+import pytest
+
+import rate_limit
+from rate_limit import FairQueue, MemoryBackend, QueueTimeout, RateLimited, RateLimiter, Rule
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    return clock
+
+
+def test_token_bucket_burst_then_refill(clock):
+    backend = MemoryBackend()
+    # 3 token, terisi 1 token per detik
+    assert [backend.take("k", 3, 1.0)[0] for _ in range(3)] == [True, True, True]
+    allowed, retry_after = backend.take("k", 3, 1.0)
+    assert not allowed
+    assert retry_after == pytest.approx(1.0)
+
+    clock.now += 0.5
+    allowed, retry_after = backend.take("k", 3, 1.0)
+    assert not allowed
+    assert retry_after == pytest.approx(0.5)
+
+    clock.now += 0.5
+    assert backend.take("k", 3, 1.0)[0]
+    # Kunci lain punya bucket sendiri
+    assert backend.take("other", 3, 1.0)[0]
+
+
+def test_token_bucket_never_exceeds_capacity(clock):
+    backend = MemoryBackend()
+    backend.take("k", 2, 1.0)
+    clock.now += 3600
+    assert [backend.take("k", 2, 1.0)[0] for _ in range(3)] == [True, True, False]
+
+
+def test_token_bucket_evicts_least_recently_used(clock):
+    backend = MemoryBackend(max_keys=2)
+    backend.take("a", 1, 0.001)
+    backend.take("b", 1, 0.001)
+    backend.take("a", 1, 0.001)
+    backend.take("c", 1, 0.001)
+    # "b" paling lama tidak dipakai sehingga dibuang; "a" yang baru dipakai tetap habis
+    assert not backend.take("a", 1, 0.001)[0]
+    assert list(backend._buckets) == ["c", "a"]
+    assert backend.take("b", 1, 0.001)[0]
+
+
+def test_inflight_limit_and_release():
+    backend = MemoryBackend()
+    leases = [backend.acquire("u", 2) for _ in range(3)]
+    assert leases[:2] == ["u", "u"] and leases[2] is None
+    backend.release(leases[0])
+    assert backend.acquire("u", 2) == "u"
+    backend.release("u")
+    backend.release("u")
+    assert backend._inflight == {}
+
+
+def _waiter(queue, user, admitted, errors):
+    try:
+        queue.acquire(user)
+        admitted.append(user)
+    except QueueTimeout as e:
+        errors.append(e)
+
+
+def _wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timeout"
+        time.sleep(0.005)
+
+
+def test_fair_queue_round_robin_between_users():
+    queue = FairQueue(max_active=1, timeout=5)
+    queue.acquire("holder")
+    admitted, errors, threads = [], [], []
+    # User A mengantri tiga kali lebih dulu, lalu B dan C masing-masing sekali
+    for user in ["A", "A", "A", "B", "C"]:
+        t = threading.Thread(target=_waiter, args=(queue, user, admitted, errors))
+        t.start()
+        threads.append(t)
+        _wait_for(lambda: queue.stats()['waiting'] == len(threads))
+
+    for served in range(1, 6):
+        queue.release()
+        _wait_for(lambda: len(admitted) == served)
+    for t in threads:
+        t.join()
+
+    assert admitted == ["A", "B", "C", "A", "A"]
+    assert errors == []
+    stats = queue.stats()
+    assert stats['active'] == 1 and stats['waiting'] == 0 and stats['queued'] == 5
+
+
+def test_fair_queue_admits_directly_while_slots_free():
+    queue = FairQueue(max_active=2, timeout=5)
+    queue.acquire("A")
+    queue.acquire("A")
+    assert queue.stats()['active'] == 2 and queue.stats()['queued'] == 0
+    queue.release()
+    queue.release()
+    assert queue.stats()['active'] == 0
+
+
+def test_fair_queue_timeout_leaves_queue():
+    queue = FairQueue(max_active=1, timeout=0.05)
+    queue.acquire("holder")
+    with pytest.raises(QueueTimeout) as exc:
+        queue.acquire("A")
+    assert exc.value.retry_after == pytest.approx(0.05 / 3)
+    stats = queue.stats()
+    assert stats['timeouts'] == 1 and stats['waiting'] == 0 and stats['users_waiting'] == 0
+    # Slot yang lepas tidak diberikan ke request yang sudah menyerah
+    queue.release()
+    assert queue.stats()['active'] == 0
+
+
+def _limiter(backend=None, max_active=1, timeout=5, max_inflight=2):
+    rules = {'ask': Rule('ask', 2, 60, ('user',))}
+    return RateLimiter(backend or MemoryBackend(), rules, FairQueue(max_active, timeout), max_inflight)
+
+
+def test_limiter_check_raises_when_bucket_empty(clock):
+    limiter = _limiter()
+    limiter.check('ask', ["user:1"])
+    limiter.check('ask', ["user:1"])
+    with pytest.raises(RateLimited) as exc:
+        limiter.check('ask', ["user:1"])
+    assert exc.value.retry_after == pytest.approx(30.0)
+    assert limiter.stats()['rules']['ask'] == {'allowed': 2, 'limited': 1}
+
+
+def test_admit_ask_releases_lease_and_slot_once():
+    limiter = _limiter(max_active=2, max_inflight=2)
+    first = limiter.admit_ask("user:1")
+    second = limiter.admit_ask("user:1")
+    with pytest.raises(RateLimited):
+        limiter.admit_ask("user:1")
+    assert limiter.stats()['inflight_rejected'] == 1
+
+    first()
+    first()
+    assert limiter.ask_queue.stats()['active'] == 1
+    third = limiter.admit_ask("user:1")
+    second()
+    third()
+    assert limiter.ask_queue.stats()['active'] == 0
+    assert limiter.backend._inflight == {}
+
+
+def test_admit_ask_queue_timeout_returns_lease():
+    limiter = _limiter(max_active=1, timeout=0.05)
+    release = limiter.admit_ask("user:1")
+    with pytest.raises(QueueTimeout):
+        limiter.admit_ask("user:2")
+    assert "inflight:ask:user:2" not in limiter.backend._inflight
+    release()
+
+
+class BrokenBackend:
+    def take(self, *args):
+        raise RuntimeError("database down")
+
+    def acquire(self, *args):
+        raise RuntimeError("database down")
+
+    def release(self, *args):
+        raise AssertionError("lease gagal tidak boleh dilepas")
+
+
+def test_backend_errors_fail_open():
+    limiter = _limiter(backend=BrokenBackend())
+    limiter.check('ask', ["user:1"])
+    release = limiter.admit_ask("user:1")
+    release()
+    stats = limiter.stats()
+    assert stats['backend_errors'] == 2
+    assert stats['rules']['ask']['allowed'] == 1
@@ -0,0 +1,92 @@
+import pytest
+
+import response_cache
+from response_cache import ResponseCache, trigrams
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(response_cache.time, "monotonic", clock)
+    return clock
+
+
+def test_trigrams_are_padded():
+    assert trigrams("ab") == frozenset({"  a", " ab", "ab "})
+
+
+def test_exact_hit_after_normalization(clock):
+    cache = ResponseCache()
+    cache.set('chat', "Siapa kamu?", "Saya Richatz.AI")
+    assert cache.get('chat', "  siapa   KAMU ") == ("Saya Richatz.AI", 'exact')
+    # Route lain punya ruang kunci sendiri
+    assert cache.get('search', "siapa kamu") == (None, None)
+
+
+def test_similar_prompt_hits_above_threshold(clock):
+    cache = ResponseCache(threshold=0.7)
+    cache.set('chat', "apa itu bahasa pemrograman python", "Python adalah ...")
+    assert cache.get('chat', "apa itu bahasa pemrograman python?!") == ("Python adalah ...", 'exact')
+    assert cache.get('chat', "apa itu bahasa pemrogramn python") == ("Python adalah ...", 'similar')
+    assert cache.get('chat', "apa itu bahasa pemrograman rust") == (None, None)
+
+
+def test_numbers_must_match_exactly(clock):
+    cache = ResponseCache(threshold=0.5)
+    cache.set('chat', "siapa presiden indonesia ke 5", "Susilo Bambang Yudhoyono")
+    assert cache.get('chat', "siapa presiden indonesia ke 6") == (None, None)
+    assert cache.get('chat', "siapa presiden ri ke 5") == ("Susilo Bambang Yudhoyono", 'similar')
+
+
+def test_entries_expire_per_route_ttl(clock):
+    cache = ResponseCache(ttls={'search': 60})
+    cache.set('search', "harga emas hari ini", "Rp 1.000.000")
+    cache.set('chat', "siapa kamu", "Saya Richatz.AI")
+    clock.now += 61
+    assert cache.get('search', "harga emas hari ini") == (None, None)
+    assert cache.get('search', "harga emas hari ini!") == (None, None)
+    assert cache.get('chat', "siapa kamu") == ("Saya Richatz.AI", 'exact')
+    # Entri kedaluwarsa dibuang beserta trigram-nya dari indeks
+    assert not any(route == 'search' for route, _ in cache._index)
+
+
+def test_disabled_routes_and_long_prompts_are_skipped(clock):
+    cache = ResponseCache(routes=('chat',), max_prompt_chars=20)
+    cache.set('weather', "cuaca jakarta", "cerah")
+    cache.set('chat', "x" * 21, "panjang")
+    cache.set('chat', "kosong", "")
+    assert cache.stats()['size'] == 0
+    assert cache.get('weather', "cuaca jakarta") == (None, None)
+
+
+def test_lru_eviction_keeps_index_consistent(clock):
+    cache = ResponseCache(maxsize=2)
+    cache.set('chat', "satu", "1")
+    cache.set('chat', "dua", "2")
+    cache.get('chat', "satu")
+    cache.set('chat', "tiga", "3")
+    assert cache.get('chat', "dua") == (None, None)
+    assert cache.get('chat', "satu") == ("1", 'exact')
+    assert cache.evictions == 1
+    indexed = set().union(*cache._index.values())
+    assert indexed == {"chat:satu", "chat:tiga"}
+
+
+def test_stats_count_hits_and_saved_gemini_calls(clock):
+    cache = ResponseCache(routes=('chat', 'weather'))
+    cache.record('chat', 'exact')
+    cache.record('chat', 'similar')
+    cache.record('chat', None)
+    cache.record('weather', 'exact')
+    stats = cache.stats()
+    assert stats['routes']['chat']['hit_rate'] == pytest.approx(2 / 3, abs=1e-4)
+    # Jawaban cuaca disusun tanpa Gemini, jadi hit-nya tidak menghemat panggilan
+    assert stats['gemini_calls_saved'] == 2
@@ -0,0 +1,199 @@
+import asyncio
+
+import pytest
+
+import tool_cache
+from tool_cache import MemoryBackend, ToolCache, normalize_key
+
+
+class Upstream:
+    """fetch() palsu yang menunggu sampai tes melepasnya."""
+
+    def __init__(self, value="cerah"):
+        self.value = value
+        self.calls = 0
+        self.cancelled = 0
+        self.release = None
+
+    def fetch(self):
+        async def call():
+            self.calls += 1
+            try:
+                await self.release.wait()
+            except asyncio.CancelledError:
+                self.cancelled += 1
+                raise
+            if isinstance(self.value, Exception):
+                raise self.value
+            return self.value
+        return call()
+
+
+def _cache():
+    return ToolCache(MemoryBackend(maxsize=2), ttls={'weather': 600})
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_normalize_key():
+    assert normalize_key("  Cuaca   di JAKARTA?! ") == "cuaca di jakarta"
+
+
+def test_result_is_cached_until_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(tool_cache.time, "monotonic", lambda: now[0])
+
+    async def scenario():
+        cache, upstream = _cache(), Upstream()
+        upstream.release = asyncio.Event()
+        upstream.release.set()
+        first = await cache.get_or_fetch('weather', "Jakarta", upstream.fetch)
+        second = await cache.get_or_fetch('weather', "jakarta ", upstream.fetch)
+        now[0] += 601
+        third = await cache.get_or_fetch('weather', "jakarta", upstream.fetch)
+        return cache, upstream, [first, second, third]
+
+    cache, upstream, values = asyncio.run(scenario())
+    assert values == ["cerah"] * 3 and upstream.calls == 2
+    stats = cache.stats()
+    assert stats['tools']['weather'] == {'hits': 1, 'misses': 2, 'coalesced': 0, 'shared_hits': 0}
+    assert stats['expirations'] == 1
+
+
+def test_uncacheable_result_is_not_stored():
+    async def scenario():
+        cache, upstream = _cache(), Upstream(value="")
+        upstream.release = asyncio.Event()
+        upstream.release.set()
+        await cache.get_or_fetch('weather', "x", upstream.fetch)
+        await cache.get_or_fetch('weather', "x", upstream.fetch)
+        return upstream
+
+    assert asyncio.run(scenario()).calls == 2
+
+
+def test_concurrent_lookups_share_one_fetch():
+    async def scenario():
+        cache, upstream = _cache(), Upstream()
+        upstream.release = asyncio.Event()
+        tasks = [asyncio.ensure_future(cache.get_or_fetch('weather', "Bandung", upstream.fetch)) for _ in range(3)]
+        await _settle()
+        upstream.release.set()
+        return cache, upstream, await asyncio.gather(*tasks)
+
+    cache, upstream, values = asyncio.run(scenario())
+    assert values == ["cerah"] * 3 and upstream.calls == 1
+    assert cache.stats()['tools']['weather']['coalesced'] == 2
+
+
+def test_cancelled_leader_does_not_cancel_follower():
+    async def scenario():
+        cache, upstream = _cache(), Upstream()
+        upstream.release = asyncio.Event()
+        leader = asyncio.ensure_future(cache.get_or_fetch('weather', "Bandung", upstream.fetch))
+        await _settle()
+        follower = asyncio.ensure_future(cache.get_or_fetch('weather', "Bandung", upstream.fetch))
+        await _settle()
+
+        leader.cancel()
+        await _settle()
+        upstream.release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return cache, upstream, await follower
+
+    cache, upstream, value = asyncio.run(scenario())
+    assert value == "cerah"
+    assert upstream.calls == 1 and upstream.cancelled == 0
+    assert cache.memory.get("weather:bandung") == "cerah"
+
+
+def test_leader_timeout_does_not_fail_follower():
+    async def scenario():
+        cache, upstream = _cache(), Upstream()
+        upstream.release = asyncio.Event()
+        # Seperti IntentRouter.dispatch: pemanggil pertama dibungkus asyncio.wait_for(handler, tool.timeout)
+        leader = asyncio.ensure_future(asyncio.wait_for(cache.get_or_fetch('weather', "Bandung", upstream.fetch), 0.05))
+        await _settle()
+        follower = asyncio.ensure_future(cache.get_or_fetch('weather', "Bandung", upstream.fetch))
+        with pytest.raises(asyncio.TimeoutError):
+            await leader
+        upstream.release.set()
+        return await follower
+
+    assert asyncio.run(scenario()) == "cerah"
+
+
+def test_fetch_cancelled_when_every_caller_left():
+    async def scenario():
+        cache, upstream = _cache(), Upstream()
+        upstream.release = asyncio.Event()
+        callers = [asyncio.ensure_future(cache.get_or_fetch('weather', "Bandung", upstream.fetch)) for _ in range(2)]
+        await _settle()
+        for caller in callers:
+            caller.cancel()
+        await _settle()
+
+        # Lookup berikutnya memulai panggilan baru, tidak menumpang task yang sudah dibatalkan
+        upstream.release.set()
+        value = await cache.get_or_fetch('weather', "Bandung", upstream.fetch)
+        return cache, upstream, value
+
+    cache, upstream, value = asyncio.run(scenario())
+    assert upstream.cancelled == 1 and upstream.calls == 2
+    assert value == "cerah" and cache._inflight == {}
+
+
+def test_fetch_error_reaches_every_caller_and_is_not_cached():
+    async def scenario():
+        cache, upstream = _cache(), Upstream(value=RuntimeError("upstream down"))
+        upstream.release = asyncio.Event()
+        tasks = [asyncio.ensure_future(cache.get_or_fetch('weather', "Bandung", upstream.fetch)) for _ in range(2)]
+        await _settle()
+        upstream.release.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        return cache, results
+
+    cache, results = asyncio.run(scenario())
+    assert [type(r) for r in results] == [RuntimeError, RuntimeError]
+    assert cache.memory.get("weather:bandung") is None and cache._inflight == {}
+
+
+class SharedBackend:
+    blocking = False
+
+    def __init__(self, data):
+        self.data = data
+        self.writes = []
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ttl):
+        self.writes.append((key, value, ttl))
+
+
+def test_shared_backend_hit_fills_memory():
+    async def scenario():
+        shared = SharedBackend({"weather:bandung": "hujan"})
+        cache = ToolCache(MemoryBackend(), shared=shared, ttls={'weather': 600})
+        upstream = Upstream()
+        value = await cache.get_or_fetch('weather', "Bandung", upstream.fetch)
+        return cache, shared, upstream, value
+
+    cache, shared, upstream, value = asyncio.run(scenario())
+    assert value == "hujan" and upstream.calls == 0 and shared.writes == []
+    assert cache.memory.get("weather:bandung") == "hujan"
+    assert cache.stats()['tools']['weather']['shared_hits'] == 1
+
+
+def test_memory_backend_evicts_least_recently_used():
+    memory = MemoryBackend(maxsize=2)
+    memory.set("a", 1, 60)
+    memory.set("b", 2, 60)
+    memory.get("a")
+    memory.set("c", 3, 60)
+    assert memory.get("b") is None and memory.get("a") == 1 and memory.evictions == 1
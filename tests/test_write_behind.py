@@ -0,0 +1,180 @@
+import importlib
+import json
+import os
+import threading
+import time
+
+import psycopg2
+import pytest
+
+import write_behind
+from write_behind import DEAD_LETTER_FILE, WriteBehindBuffer
+
+
+@pytest.fixture(autouse=True)
+def no_atexit(monkeypatch):
+    # drain() saat proses tes selesai tidak berguna: direktori sementara sudah dihapus
+    monkeypatch.setattr(write_behind.atexit, "register", lambda fn: None)
+
+
+def _record(n, conversation_id="c1", text="halo"):
+    return {"exchange_id": f"e{n}", "conversation_id": conversation_id, "user": text, "answer": "jawab"}
+
+
+class Database:
+    """flush_fn palsu: menolak exchange berisi NUL (seperti psycopg2) dan bisa dibuat gagal sementara."""
+
+    def __init__(self, transient_failures=0):
+        self.saved = []
+        self.batches = []
+        self.transient_failures = transient_failures
+
+    def __call__(self, records):
+        self.batches.append(len(records))
+        if self.transient_failures:
+            self.transient_failures -= 1
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        for record in records:
+            if "\0" in record["user"]:
+                raise ValueError("A string literal cannot contain NUL (0x00) characters.")
+        self.saved.extend(r["exchange_id"] for r in records)
+
+
+def _orphan(directory, lines):
+    path = os.path.join(directory, "journal-999-dead.jsonl")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("".join(lines))
+    return path
+
+
+def _dead_letters(directory):
+    with open(os.path.join(directory, DEAD_LETTER_FILE), encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timeout"
+        time.sleep(0.01)
+
+
+def test_recovers_orphaned_journal(tmp_path):
+    path = _orphan(tmp_path, [json.dumps(_record(n)) + "\n" for n in range(5)] + ['{"exchange_id": "e5", "conv'])
+    db = Database()
+    buffer = WriteBehindBuffer(db, directory=str(tmp_path), batch_size=2)
+    buffer.start()
+
+    # Baris terakhir yang terpotong dilewati, sisanya ditulis dalam batch berukuran batch_size
+    assert db.saved == ["e0", "e1", "e2", "e3", "e4"]
+    assert db.batches == [2, 2, 1]
+    assert not os.path.exists(path)
+    assert buffer.stats()["recovered"] == 5
+
+
+def test_recovery_dead_letters_poison_exchange(tmp_path):
+    records = [_record(0), _record(1, text="a\0b"), _record(2)]
+    _orphan(tmp_path, [json.dumps(r) + "\n" for r in records])
+    db = Database()
+    buffer = WriteBehindBuffer(db, directory=str(tmp_path))
+    buffer.start()
+
+    assert db.saved == ["e0", "e2"]
+    dead = _dead_letters(tmp_path)
+    assert [d["record"]["exchange_id"] for d in dead] == ["e1"]
+    assert dead[0]["error"].startswith("ValueError")
+    assert buffer.stats()["dead_lettered"] == 1
+
+
+def test_recovery_keeps_journal_on_transient_error(tmp_path):
+    path = _orphan(tmp_path, [json.dumps(_record(0)) + "\n"])
+    db = Database(transient_failures=1)
+    buffer = WriteBehindBuffer(db, directory=str(tmp_path))
+    with pytest.raises(psycopg2.OperationalError):
+        buffer.start()
+    assert os.path.exists(path) and db.saved == []
+
+    # Percobaan berikutnya memulihkan journal yang sama
+    buffer.start()
+    assert db.saved == ["e0"] and not os.path.exists(path)
+
+
+def test_write_bisects_failing_batch(tmp_path):
+    db = Database()
+    buffer = WriteBehindBuffer(db, directory=str(tmp_path))
+    records = [_record(n, text="a\0b" if n in (2, 5) else "halo") for n in range(8)]
+    buffer._write(records)
+
+    assert sorted(db.saved) == ["e0", "e1", "e3", "e4", "e6", "e7"]
+    assert [d["record"]["exchange_id"] for d in _dead_letters(tmp_path)] == ["e2", "e5"]
+
+
+def test_flush_retries_transient_errors(tmp_path):
+    db = Database(transient_failures=1)
+    buffer = WriteBehindBuffer(db, directory=str(tmp_path), flush_interval=0)
+    buffer.append(_record(0))
+    buffer.append(_record(1, text="a\0b"))
+    _wait_for(lambda: buffer.stats()["flushed"] == 2)
+
+    stats = buffer.stats()
+    assert db.saved == ["e0"]
+    assert stats["failures"] == 1 and stats["dead_lettered"] == 1 and stats["pending"] == 0
+    assert buffer.pending_for("c1") == []
+    # Hanya journal aktif yang tersisa; journal batch yang sudah ter-commit dihapus
+    assert sorted(name for name in os.listdir(tmp_path) if name.startswith("journal-")) == \
+        [os.path.basename(buffer._journal.path)]
+
+
+def test_pending_for_skips_duplicate_exchanges(tmp_path):
+    buffer = WriteBehindBuffer(Database(), directory=str(tmp_path))
+    first, other = _record(0), _record(1, conversation_id="c2")
+    buffer._flushing = [first]
+    buffer._pending = [dict(first), _record(2), other]
+    assert [r["exchange_id"] for r in buffer.pending_for("c1")] == ["e0", "e2"]
+    assert buffer.pending_for("c2") == [other]
+
+
+def test_pending_for_drops_replaced_partial_answer(tmp_path):
+    buffer = WriteBehindBuffer(Database(), directory=str(tmp_path))
+    partial, full = _record(0), dict(_record(1), replaces="e0")
+    buffer._pending = [partial, full]
+    assert buffer.pending_for("c1") == [full]
+
+
+def test_fsync_does_not_block_readers(tmp_path, monkeypatch):
+    buffer = WriteBehindBuffer(Database(), directory=str(tmp_path), flush_interval=0)
+    buffer.start()
+    disk, in_fsync = threading.Event(), threading.Event()
+    real_fsync = os.fsync
+
+    def slow_fsync(fd):
+        in_fsync.set()
+        disk.wait(5)
+        real_fsync(fd)
+
+    monkeypatch.setattr(write_behind.os, "fsync", slow_fsync)
+    writer = threading.Thread(target=buffer.append, args=(_record(0),))
+    writer.start()
+    assert in_fsync.wait(2)
+
+    # Disk lambat hanya menahan append lain, bukan pembaca history maupun statistik
+    reader = threading.Thread(target=lambda: (buffer.pending_for("c1"), buffer.stats()))
+    reader.start()
+    reader.join(1)
+    assert not reader.is_alive()
+
+    disk.set()
+    writer.join()
+    _wait_for(lambda: buffer.stats()["flushed"] == 1)
+
+
+def test_disabled_on_vercel(monkeypatch):
+    monkeypatch.setenv("WRITE_BEHIND", "1")
+    monkeypatch.setenv("VERCEL", "1")
+    try:
+        assert importlib.reload(write_behind).ENABLED is False
+        monkeypatch.delenv("VERCEL")
+        assert importlib.reload(write_behind).ENABLED is True
+    finally:
+        monkeypatch.undo()
+        importlib.reload(write_behind)
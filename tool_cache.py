@@ -0,0 +1,184 @@
+# tool_cache.py
+# Cache hasil tool eksternal (cuaca, pencarian web) dengan TTL per tool.
+#
+# Lapisan 1 selalu LRU+TTL di memori proses. Lapisan 2 opsional (TOOL_CACHE_BACKEND=postgres)
+# memakai tabel tool_cache supaya hasilnya bisa dibagi antar worker / instance serverless.
+# Lookup identik yang datang bersamaan digabung menjadi satu panggilan upstream.
+
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+
+from db import get_db_connection
+
+DEFAULT_TTLS = {
+    'weather': 600,    # data cuaca OpenWeatherMap diperbarui kira-kira tiap 10 menit
+    'search': 1800,
+}
+
+def normalize_key(text):
+    """Kunci cache yang tidak peka huruf besar/kecil, spasi berlebih, dan tanda baca di ujung."""
+    return " ".join(text.lower().split()).strip(" ?!.,")
+
+class MemoryBackend:
+    """LRU dengan TTL per entri. Thread-safe."""
+
+    blocking = False
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()   # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self._data)
+
+class PostgresBackend:
+    """Cache bersama di tabel tool_cache (lihat init_db.py). Nilai disimpan sebagai JSONB."""
+
+    blocking = True
+
+    def get(self, key):
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT value FROM tool_cache WHERE key = %s AND expires_at > now()", (key,))
+                row = cur.fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value, ttl):
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """INSERT INTO tool_cache (key, value, expires_at) VALUES (%s, %s, now() + %s * interval '1 second')
+                       ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value, expires_at = EXCLUDED.expires_at""",
+                    (key, json.dumps(value), ttl)
+                )
+                # Bersih-bersih entri kedaluwarsa sesekali saja, bukan di setiap penulisan
+                if random.random() < 0.01:
+                    cur.execute("DELETE FROM tool_cache WHERE expires_at <= now()")
+            conn.commit()
+
+class _Fetch:
+    """Satu panggilan upstream yang sedang berjalan dan jumlah pemanggil yang menunggunya."""
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+class ToolCache:
+    def __init__(self, memory, shared=None, ttls=None):
+        self.memory = memory
+        self.shared = shared
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self._inflight = {}
+        self._stats = {}
+
+    def register_tool(self, tool, ttl):
+        """TTL default untuk tool baru (lihat intent_router.Tool.cache_ttl); TOOL_CACHE_TTL_<TOOL> tetap menang."""
+        self.ttls[tool] = int(os.getenv(f"TOOL_CACHE_TTL_{tool.upper()}", ttl))
+
+    def _count(self, tool, name):
+        tool_stats = self._stats.setdefault(tool, {'hits': 0, 'misses': 0, 'coalesced': 0, 'shared_hits': 0})
+        tool_stats[name] += 1
+
+    async def _call_backend(self, fn, *args):
+        if self.shared is not None and self.shared.blocking:
+            return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+        return fn(*args)
+
+    async def get_or_fetch(self, tool, query, fetch, cacheable=bool):
+        """
+        Mengambil hasil dari cache, atau memanggil `fetch()` (coroutine) sekali untuk semua pemanggil yang menunggu.
+        Panggilan upstream berjalan di task milik cache: pemanggil yang dibatalkan (batas waktu tool, deadline
+        pipeline, client putus) hanya berhenti menunggu. Task-nya baru dibatalkan jika tidak ada lagi yang menunggu.
+        """
+        key = f"{tool}:{normalize_key(query)}"
+        value = self.memory.get(key)
+        if value is not None:
+            self._count(tool, 'hits')
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self._count(tool, 'coalesced')
+        else:
+            inflight = self._inflight[key] = _Fetch(asyncio.ensure_future(self._fetch(tool, key, fetch, cacheable)))
+            inflight.task.add_done_callback(lambda _: self._forget(key, inflight))
+        inflight.waiters += 1
+        try:
+            return await asyncio.shield(inflight.task)
+        finally:
+            inflight.waiters -= 1
+            if inflight.waiters == 0 and not inflight.task.done():
+                self._forget(key, inflight)
+                inflight.task.cancel()
+
+    def _forget(self, key, inflight):
+        if self._inflight.get(key) is inflight:
+            del self._inflight[key]
+
+    async def _fetch(self, tool, key, fetch, cacheable):
+        value = None
+        if self.shared is not None:
+            try:
+                value = await self._call_backend(self.shared.get, key)
+            except Exception as e:
+                logging.warning(f"Cache bersama tidak bisa dibaca: {e}")
+            if value is not None:
+                self._count(tool, 'shared_hits')
+                self.memory.set(key, value, self.ttls[tool])
+                return value
+
+        self._count(tool, 'misses')
+        value = await fetch()
+        if cacheable(value):
+            self.memory.set(key, value, self.ttls[tool])
+            if self.shared is not None:
+                try:
+                    await self._call_backend(self.shared.set, key, value, self.ttls[tool])
+                except Exception as e:
+                    logging.warning(f"Cache bersama tidak bisa ditulis: {e}")
+        return value
+
+    def stats(self):
+        return {
+            'tools': {tool: dict(values) for tool, values in self._stats.items()},
+            'size': len(self.memory),
+            'evictions': self.memory.evictions,
+            'expirations': self.memory.expirations,
+        }
+
+def _build_cache():
+    ttls = {tool: int(os.getenv(f"TOOL_CACHE_TTL_{tool.upper()}", ttl)) for tool, ttl in DEFAULT_TTLS.items()}
+    shared = PostgresBackend() if os.getenv("TOOL_CACHE_BACKEND", "memory") == "postgres" else None
+    return ToolCache(MemoryBackend(int(os.getenv("TOOL_CACHE_SIZE", "1024"))), shared=shared, ttls=ttls)
+
+tool_cache = _build_cache()
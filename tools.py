@@ -0,0 +1,128 @@
+# tools.py
+# Tool eksternal untuk /ask: cuaca (OpenWeatherMap) dan pencarian web (SerpAPI).
+# Semua fungsi di sini async dan harus dijalankan di event loop milik pipeline.py.
+
+import os
+import logging
+import gemini
+import gazetteer
+import tracing
+from tool_cache import tool_cache
+from http_client import http_client, UpstreamError
+from intent_router import IntentRouter, Tool, load_classifier
+
+# Bisa diarahkan ke server tiruan untuk benchmark (benchmarks/fake_upstreams.py)
+WEATHER_URL = os.getenv("WEATHER_API_URL", "https://api.openweathermap.org/data/2.5/weather")
+SEARCH_URL = os.getenv("SERPAPI_URL", "https://serpapi.com/search.json")
+WEATHER_KEYWORDS = ("cuaca", "prakiraan cuaca", "ramalan cuaca", "weather")
+SEARCH_PREFIXES = ("siapa", "apa itu", "kapan", "presiden", "berita")
+# Pertanyaan identitas dijawab oleh briefing Gemini, bukan oleh pencarian web
+IDENTITY_KEYWORDS = ("siapa kamu", "kamu siapa", "siapa namamu", "siapa nama kamu", "siapa yang membuatmu",
+                     "siapa pembuatmu", "siapa yang membuat kamu", "siapa penciptamu")
+
+@tracing.traced('tool.city_extraction')
+async def extract_city(user_prompt_original):
+    """Mencari nama kota di gazetteer lokal dulu; Gemini hanya dipakai jika tidak ada yang cocok."""
+    city = gazetteer.find_city(user_prompt_original)
+    if city:
+        return city
+    if os.getenv("CITY_LLM_FALLBACK", "1") != "1":
+        return None
+    return await extract_city_llm(user_prompt_original)
+
+@tracing.traced('llm.city_extraction')
+async def extract_city_llm(user_prompt_original):
+    """Minta Gemini untuk mengekstrak nama kota dari pertanyaan. Mengembalikan None jika tidak ada."""
+    extraction_prompt = f"""Dari kalimat berikut, ekstrak HANYA nama kota atau lokasinya. Jika tidak disebutkan secara spesifik, jawab HANYA dengan kata 'None'. Kalimat: '{user_prompt_original}'"""
+    city_response = await gemini.get_model().generate_content_async(extraction_prompt)
+    city = city_response.text.strip()
+    if city.lower() == 'none' or not city:
+        return None
+    return city
+
+async def _fetch_weather(city):
+    params = {"q": city, "appid": os.getenv("OPENWEATHERMAP_API_KEY"), "units": "metric", "lang": "id"}
+    # Kota yang tidak dikenal dijawab 404 dengan body JSON {"cod": "404"}, bukan dianggap error upstream
+    response = await http_client.get('weather', WEATHER_URL, params=params)
+    return response.json()
+
+async def fetch_weather(city):
+    # Hanya respons sukses yang di-cache; kota yang tidak ditemukan selalu ditanyakan ulang
+    return await tool_cache.get_or_fetch(
+        'weather', city, lambda: _fetch_weather(city), cacheable=lambda r: r.get("cod") == 200
+    )
+
+async def _web_search(query):
+    params = {"engine": "google", "q": query, "api_key": os.getenv("SERPAPI_API_KEY")}
+    response = (await http_client.get('search', SEARCH_URL, params=params)).json()
+    context_snippets = []
+    if "organic_results" in response:
+        for result in response["organic_results"][:3]:
+            if "snippet" in result:
+                context_snippets.append(result["snippet"])
+    return context_snippets
+
+async def web_search(query):
+    """Mengembalikan maksimal 3 snippet teratas dari hasil pencarian Google via SerpAPI."""
+    return await tool_cache.get_or_fetch('search', query, lambda: _web_search(query))
+
+async def weather_answer(user_prompt_original):
+    try:
+        # LANGKAH 1: Ekstrak nama kota dari pertanyaan
+        city = await extract_city(user_prompt_original)
+
+        # Jika Gemini tidak menemukan kota, gunakan default atau bisa juga bertanya kembali ke user
+        if not city:
+            city = "Jakarta" # Tetap gunakan default jika tidak ada kota dalam pertanyaan
+            logging.info(f"Tidak ada kota terdeteksi, menggunakan default: {city}")
+        else:
+            logging.info(f"Kota yang terdeteksi: {city}")
+
+        # LANGKAH 2: Panggil API OpenWeatherMap dengan kota yang sudah diekstrak
+        response = await fetch_weather(city)
+
+        if response.get("cod") == 200:
+            cuaca = response['weather'][0]['description']
+            suhu = response['main']['temp']
+            return f"Tentu, cuaca di {city.title()} saat ini adalah {cuaca} dengan suhu sekitar {suhu}°C."
+        # Jika kota hasil ekstraksi tidak ditemukan oleh API cuaca
+        return f"Maaf, saya tidak dapat menemukan data cuaca untuk '{city.title()}'. Pastikan nama lokasinya benar."
+
+    except UpstreamError as e:
+        logging.error(f"Layanan cuaca tidak tersedia: {e}")
+        return "Maaf, layanan cuaca sedang tidak dapat dihubungi. Silakan coba lagi beberapa saat lagi."
+    except Exception as e:
+        logging.error(f"Error saat memproses permintaan cuaca: {e}")
+        return "Maaf, terjadi kesalahan saat memproses permintaan cuaca."
+
+async def search_answer(user_prompt_original):
+    try:
+        context_snippets = await web_search(user_prompt_original)
+        if not context_snippets:
+            raise ValueError("No context found from web search")
+        context = " ".join(context_snippets)
+        augmented_prompt = f"""Berdasarkan informasi dari internet berikut: "{context}", jawab pertanyaan ini secara detail, lengkap, dan jelaskan dengan baik dalam Bahasa Indonesia: "{user_prompt_original}" """
+        with tracing.span('llm.search_answer'):
+            response = await gemini.get_model().generate_content_async(augmented_prompt)
+        return response.text
+    except Exception as e:
+        logging.error(f"SerpAPI/Augmented prompt failed: {e}")
+        return ""
+
+# --- Registry tool ---
+# Tool baru cukup didaftarkan di sini: handler, kata kunci, batas waktu, dan TTL cache-nya sendiri.
+router = IntentRouter(classifier=load_classifier(),
+                      threshold=float(os.getenv("INTENT_CLASSIFIER_THRESHOLD", "0.6")), cache=tool_cache)
+router.register(Tool('chat', None, keywords=IDENTITY_KEYWORDS, priority=30))
+router.register(Tool('weather', weather_answer, keywords=WEATHER_KEYWORDS, priority=20,
+                     timeout=float(os.getenv("TOOL_WEATHER_TIMEOUT", "10")), cache_ttl=600))
+router.register(Tool('search', search_answer, prefixes=SEARCH_PREFIXES, priority=10,
+                     timeout=float(os.getenv("TOOL_SEARCH_TIMEOUT", "12")), cache_ttl=1800))
+
+def route_for(user_prompt_original):
+    """Route yang akan menjawab prompt: nama tool ('weather', 'search', ...) atau 'chat' (langsung ke Gemini)."""
+    return router.route(user_prompt_original)
+
+async def answer_with_tools(user_prompt_original):
+    """Menjawab prompt lewat tool hasil routing. Mengembalikan string kosong jika tidak ada tool yang cocok."""
+    return await router.dispatch(user_prompt_original)
@@ -0,0 +1,193 @@
+# tracing.py
+# Span per tahap request dan histogram latensi ala Prometheus.
+#
+#   with tracing.span('db.history'):          # blok sync
+#       ...
+#   @tracing.traced('llm.gemini')              # fungsi sync maupun async
+#   async def ...
+#
+# Setiap span selalu masuk histogram richatz_stage_duration_seconds{stage=...}. Jika ada trace aktif
+# (dibuat per request oleh app.py), span juga dicatat ke trace tersebut dan bisa ditulis sebagai satu
+# baris JSON per request (TRACE_LOG=1). Overhead-nya hanya dua perf_counter() dan satu update
+# histogram per span, jadi aman dibiarkan menyala di produksi.
+#
+# Trace dibawa lewat contextvars: otomatis ikut ke task asyncio yang dibuat dari coroutine yang sama.
+# Untuk melintasi thread (loop pipeline, executor DB) pakai bind() dan copy_context().
+
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float("inf"))
+
+TRACE_LOG = os.getenv("TRACE_LOG", "0") == "1"
+# Hanya request yang lebih lambat dari ini yang ditulis ke log trace (milidetik)
+TRACE_LOG_MIN_MS = float(os.getenv("TRACE_LOG_MIN_MS", "0"))
+
+_current = contextvars.ContextVar("richatz_trace", default=None)
+trace_logger = logging.getLogger("richatz.trace")
+
+
+class Histogram:
+    """Histogram berlabel dengan bucket kumulatif, format teks Prometheus."""
+
+    def __init__(self, name, documentation, labelnames, buckets=BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}     # label values -> [counts per bucket, count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += 1
+            series[2] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, ([*s[0]], s[1], s[2])) for labels, s in self._series.items())
+        for labels, (counts, count, total) in items:
+            base = format_labels(zip(self.labelnames, labels))
+            running = 0
+            for bound, n in zip(self.buckets, counts):
+                running += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{format_labels(zip(self.labelnames, labels), le=le)} {running}")
+            lines.append(f"{self.name}_count{base} {count}")
+            lines.append(f"{self.name}_sum{base} {total:.6f}")
+        return "\n".join(lines)
+
+
+def format_labels(pairs, **extra):
+    items = list(pairs) + list(extra.items())
+    if not items:
+        return ""
+    escaped = (f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for k, v in items)
+    return "{" + ",".join(escaped) + "}"
+
+
+def render_gauges(name, documentation, samples, metric_type="gauge"):
+    """samples: [(dict label, nilai)]. Nilai None dilewati."""
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {metric_type}"]
+    for labels, value in samples:
+        if value is not None:
+            lines.append(f"{name}{format_labels(labels.items())} {float(value):g}")
+    return "\n".join(lines)
+
+
+STAGES = Histogram("richatz_stage_duration_seconds", "Durasi per tahap (span) di dalam request.", ("stage",))
+REQUESTS = Histogram("richatz_request_duration_seconds", "Durasi request HTTP per route.",
+                     ("route", "method", "status"))
+
+
+class Trace:
+    __slots__ = ("request_id", "name", "start", "wall_start", "spans", "attrs")
+
+    def __init__(self, name, request_id=None):
+        self.request_id = request_id or uuid.uuid4().hex
+        self.name = name
+        self.start = time.perf_counter()
+        self.wall_start = time.time()
+        self.spans = []
+        self.attrs = {}
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def stage_totals(self):
+        totals = {}
+        for name, _, duration, _ in self.spans:
+            totals[name] = totals.get(name, 0.0) + duration
+        return totals
+
+
+def current():
+    return _current.get()
+
+
+def start_trace(name, request_id=None):
+    trace = Trace(name, request_id)
+    return trace, _current.set(trace)
+
+
+def finish_trace(trace, token, route, method, status):
+    duration = trace.elapsed()
+    REQUESTS.observe((route, method, str(status)), duration)
+    try:
+        _current.reset(token)
+    except ValueError:
+        # Token dibuat di konteks lain (mis. generator streaming), cukup kosongkan saja
+        _current.set(None)
+    if TRACE_LOG and duration * 1000 >= TRACE_LOG_MIN_MS:
+        trace_logger.info(json.dumps({
+            "request_id": trace.request_id, "name": trace.name, "route": route, "method": method,
+            "status": status, "start": trace.wall_start, "duration_ms": round(duration * 1000, 3),
+            "attrs": trace.attrs,
+            "spans": [dict({"name": name, "offset_ms": round(offset * 1000, 3), "duration_ms": round(d * 1000, 3)},
+                           **(attrs or {})) for name, offset, d, attrs in trace.spans],
+        }, default=str))
+    return duration
+
+
+def record(name, duration, **attrs):
+    """Mencatat span yang durasinya diukur sendiri (mis. time-to-first-token)."""
+    STAGES.observe((name,), duration)
+    trace = _current.get()
+    if trace is not None:
+        trace.spans.append((name, time.perf_counter() - duration - trace.start, duration, attrs or None))
+
+
+@contextmanager
+def span(name, **attrs):
+    start = time.perf_counter()
+    try:
+        yield attrs
+    finally:
+        duration = time.perf_counter() - start
+        STAGES.observe((name,), duration)
+        trace = _current.get()
+        if trace is not None:
+            trace.spans.append((name, start - trace.start, duration, attrs or None))
+
+
+def traced(name):
+    def decorator(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def bind(coro):
+    """Membungkus coroutine supaya berjalan dengan trace milik thread pemanggil (untuk pipeline.run)."""
+    trace = _current.get()
+
+    async def bound():
+        _current.set(trace)
+        return await coro
+    return bound()
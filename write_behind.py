@@ -0,0 +1,242 @@
+# write_behind.py
+# Buffer write-behind untuk penyimpanan pesan chat (opsional, WRITE_BEHIND=1).
+#
+# Jawaban /ask tidak menunggu INSERT ke Postgres: setiap exchange ditulis dulu ke journal lokal
+# (append + fsync), lalu thread latar belakang menyimpannya ke database dalam batch. Saat beban
+# tinggi banyak exchange terkumpul dalam satu batch = satu round-trip.
+#
+# Tidak ada pesan yang hilang saat proses crash: journal milik proses yang sudah mati (file yang
+# tidak lagi dikunci flock) diputar ulang oleh proses berikutnya. Penulisan ulang aman karena setiap
+# exchange punya exchange_id unik (ON CONFLICT DO NOTHING di chat_store.save_exchanges).
+#
+# Konsistensi baca: exchange yang belum di-flush ikut dibaca oleh load_chat_history di proses yang
+# sama (pending_for), tetapi proses/instance lain baru melihatnya setelah flush (~WRITE_BEHIND_INTERVAL).
+#
+# Hanya untuk proses yang hidup lama dengan disk lokal yang bertahan (gunicorn, container). Di Vercel
+# instance dibekukan begitu response terkirim (thread flush ikut berhenti) dan /tmp hilang bersama
+# instance, jadi journal tidak bisa diputar ulang: WRITE_BEHIND diabaikan jika VERCEL diset.
+#
+# Error sementara (koneksi putus, database restart) diulang dengan backoff. Exchange yang tidak akan
+# pernah diterima Postgres (mis. teks berisi NUL) dipisahkan dari batch-nya dengan membagi dua batch
+# yang gagal, lalu ditulis ke dead-letter.jsonl di direktori journal, supaya tidak menahan flush lain.
+
+import os
+import json
+import time
+import uuid
+import fcntl
+import atexit
+import logging
+import threading
+
+import psycopg2
+
+ENABLED = os.getenv("WRITE_BEHIND", "0") == "1"
+if ENABLED and os.getenv("VERCEL"):
+    logging.warning("WRITE_BEHIND=1 diabaikan di Vercel: journal di /tmp tidak bertahan, pesan disimpan langsung.")
+    ENABLED = False
+JOURNAL_DIR = os.getenv("WRITE_BEHIND_DIR", "/tmp/richatz-write-behind")
+BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "100"))
+# Berapa lama exchange pertama menunggu teman satu batch sebelum di-flush (detik)
+FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_INTERVAL", "0.05"))
+RETRY_MAX_DELAY = 30.0
+DEAD_LETTER_FILE = "dead-letter.jsonl"
+# Error yang pasti terulang untuk data yang sama. ValueError: psycopg2 menolak string berisi NUL
+# sebelum dikirim ke server.
+PERMANENT_ERRORS = (psycopg2.DataError, psycopg2.IntegrityError, ValueError)
+
+
+class Journal:
+    """File append-only berisi satu exchange JSON per baris, dikunci flock selama proses hidup."""
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, f"journal-{os.getpid()}-{uuid.uuid4().hex}.jsonl")
+        self._file = open(self.path, "a", encoding="utf-8")
+        fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def append(self, record):
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def remove(self):
+        self._file.close()
+        os.remove(self.path)
+
+
+def _orphaned_journals(directory):
+    """Journal milik proses yang sudah mati: file yang kuncinya bisa kita ambil."""
+    for name in sorted(os.listdir(directory)):
+        if not name.startswith("journal-"):
+            continue
+        path = os.path.join(directory, name)
+        f = open(path, "r+", encoding="utf-8")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            continue
+        yield path, f
+
+
+class WriteBehindBuffer:
+    def __init__(self, flush_fn, directory=JOURNAL_DIR, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 permanent_errors=PERMANENT_ERRORS):
+        self.flush_fn = flush_fn
+        self.directory = directory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.permanent_errors = permanent_errors
+        self._lock = threading.Condition()
+        # fsync journal dilakukan di bawah _journal_lock saja, supaya pending_for() dan thread flush tidak
+        # ikut menunggu disk. Urutan kunci selalu _journal_lock lalu _lock.
+        self._journal_lock = threading.Lock()
+        self._pending = []           # exchange yang sudah di-journal tapi belum di-flush
+        self._flushing = []          # batch yang sedang ditulis ke database
+        self._journal = None
+        self._thread = None
+        self._stats = {"appended": 0, "flushed": 0, "batches": 0, "failures": 0, "recovered": 0, "dead_lettered": 0}
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            self._recover()
+            self._journal = Journal(self.directory)
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+            atexit.register(self.drain)
+
+    def _recover(self):
+        for path, f in _orphaned_journals(self.directory):
+            records = []
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # Baris terakhir yang terpotong saat crash: append-nya belum selesai, jadi belum
+                    # pernah dikonfirmasi ke user
+                    logging.warning(f"Write-behind: baris rusak di {path} dilewati")
+            if records:
+                # Gagal di sini (error sementara) lebih baik daripada menghapus journal yang belum tersimpan
+                for start in range(0, len(records), self.batch_size):
+                    self._write(records[start:start + self.batch_size])
+                self._stats["recovered"] += len(records)
+                logging.info(f"Write-behind: {len(records)} exchange dipulihkan dari {path}")
+            os.remove(path)
+            f.close()
+
+    def append(self, record):
+        self.start()
+        with self._journal_lock:
+            # Journal tidak bisa diganti selama append berjalan, jadi record selalu masuk ke batch yang
+            # sama dengan journal yang memuatnya
+            self._journal.append(record)
+            with self._lock:
+                self._pending.append(record)
+                self._stats["appended"] += 1
+                self._lock.notify()
+
+    def pending_for(self, conversation_id):
+        """
+        Exchange percakapan ini yang belum pasti ada di database, tanpa exchange_id ganda dan tanpa jawaban
+        parsial yang sudah digantikan jawaban lengkapnya (kolom replaces) di buffer yang sama.
+        """
+        with self._lock:
+            records, seen = [], set()
+            for r in self._flushing + self._pending:
+                if r["conversation_id"] == conversation_id and r["exchange_id"] not in seen:
+                    seen.add(r["exchange_id"])
+                    records.append(r)
+            replaced = {r.get("replaces") for r in records}
+            return [r for r in records if r["exchange_id"] not in replaced]
+
+    def _take_batch(self, new_journal):
+        """Mengambil semua exchange yang menunggu dan memulai journal baru. Dipanggil di bawah kedua kunci."""
+        batch, journal = self._pending, self._journal
+        self._flushing = self._flushing + batch
+        self._pending = []
+        self._journal = new_journal
+        return batch, journal
+
+    def _dead_letter(self, record, error):
+        with open(os.path.join(self.directory, DEAD_LETTER_FILE), "a", encoding="utf-8") as f:
+            f.write(json.dumps({"record": record, "error": f"{type(error).__name__}: {error}", "at": time.time()}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        with self._lock:
+            self._stats["dead_lettered"] += 1
+        logging.error(f"Write-behind: exchange {record.get('exchange_id')} ditolak permanen, dipindah ke "
+                      f"{DEAD_LETTER_FILE}: {error}")
+
+    def _write(self, records):
+        """
+        Menyimpan `records`. Batch yang gagal dengan error permanen dibagi dua sampai exchange penyebabnya
+        ketemu, lalu exchange itu masuk dead-letter. Error sementara dilempar ke pemanggil.
+        """
+        try:
+            self.flush_fn(records)
+        except self.permanent_errors as e:
+            if len(records) == 1:
+                self._dead_letter(records[0], e)
+                return
+            middle = len(records) // 2
+            self._write(records[:middle])
+            self._write(records[middle:])
+
+    def _flush(self, batch, journal):
+        for start in range(0, len(batch), self.batch_size):
+            chunk = batch[start:start + self.batch_size]
+            delay = 0.5
+            while True:
+                try:
+                    self._write(chunk)
+                    break
+                except Exception as e:
+                    with self._lock:
+                        self._stats["failures"] += 1
+                    logging.error(f"Write-behind: flush {len(chunk)} exchange gagal, dicoba lagi dalam {delay:.1f} detik: {e}")
+                    time.sleep(delay)
+                    delay = min(delay * 2, RETRY_MAX_DELAY)
+        # Journal lama baru dihapus setelah semua isinya ter-commit
+        journal.remove()
+        with self._lock:
+            flushed = {id(r) for r in batch}
+            self._flushing = [r for r in self._flushing if id(r) not in flushed]
+            self._stats["flushed"] += len(batch)
+            self._stats["batches"] += 1
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._pending:
+                    self._lock.wait()
+                # Beri waktu exchange lain untuk ikut batch ini, kecuali batch sudah penuh
+                deadline = time.monotonic() + self.flush_interval
+                while len(self._pending) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._lock.wait(remaining)
+            new_journal = Journal(self.directory)
+            with self._journal_lock, self._lock:
+                batch, journal = self._take_batch(new_journal)
+            self._flush(batch, journal)
+
+    def drain(self):
+        """Flush sinkron semua exchange yang tersisa (dipanggil saat proses berhenti normal)."""
+        with self._journal_lock, self._lock:
+            batch, journal = self._pending, self._journal
+            self._pending = []
+        try:
+            for start in range(0, len(batch), self.batch_size):
+                self._write(batch[start:start + self.batch_size])
+            journal.remove()
+        except Exception as e:
+            # Journal tetap ada dan akan dipulihkan oleh proses berikutnya
+            logging.error(f"Write-behind: drain gagal, {len(batch)} exchange menunggu pemulihan: {e}")
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, pending=len(self._pending))